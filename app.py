@@ -10,14 +10,17 @@ import logging
 import traceback
 import time
 import uuid
+import threading
 import hashlib
+import json
+import base64
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
@@ -44,7 +47,15 @@ except ImportError:
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import our retrieval utilities
-from utils.retrieval import get_retrieval_client, format_response, validate_request
+from utils.retrieval import default_kb_id, format_response, validate_request
+from utils.chat_writer import ChatMessageWriter
+from utils.query_analytics import QueryAnalyticsAggregator
+from utils.jobs import JobRunner
+from utils.cache_warmer import CacheWarmer
+from utils.static_assets import StaticAsset, load_asset
+from utils.responses import FastJSONResponse, CompressionMiddleware
+from src.advanced_retrieval import corrections_index
+from src.advanced_retrieval.thinking_trace import render_thinking
 
 # Setup logging
 logging.basicConfig(
@@ -60,6 +71,60 @@ retrieval_client = None
 ssm_client = None
 cached_db_credentials = None
 
+# Pooled chat DB connections so requests skip the TCP/TLS/auth handshake
+CHAT_DB_POOL_SIZE = int(os.getenv('CHAT_DB_POOL_SIZE', 5))
+chat_db_pool = None
+chat_db_pool_lock = threading.Lock()
+# After a failed connect, requests get no connection for this long instead of
+# each waiting on their own connect attempt while the DB is down
+CHAT_DB_RETRY_SECONDS = float(os.getenv('CHAT_DB_RETRY_SECONDS', 10))
+chat_db_retry_at = 0.0
+
+# Retrieval clients per knowledge base ID, reused across requests
+retrieval_clients = {}
+retrieval_clients_lock = threading.Lock()
+
+# Startup warm-up; /ready reports 503 until it has finished
+WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', 'false').lower() in ('1', 'true', 'yes')
+warmup_state = {'ready': not WARMUP_ON_STARTUP, 'steps': {}, 'started_at': None, 'completed_at': None}
+
+# Application -> knowledge base routing table, loaded at startup and refreshed on a TTL
+APPLICATION_KBS_TTL = int(os.getenv('APPLICATION_KBS_TTL', 300))
+APPLICATION_KBS_RETRY_SECONDS = 30
+application_kbs_cache = None
+application_kbs_loaded_at = 0.0
+application_kbs_lock = threading.Lock()
+
+# Write-behind buffer for /chat/message - started with the app, drained on shutdown
+chat_writer = None
+
+# In-memory query_analytic counters, flushed in bulk on an interval
+query_analytics = None
+
+# /feedback/training-status results per (KB, company code), invalidated on feedback changes
+TRAINING_STATUS_TTL = int(os.getenv('TRAINING_STATUS_TTL', 15))
+training_status_cache = {}
+training_status_lock = threading.Lock()
+
+# Worker pool for long-running jobs such as the feedback training pipeline
+job_runner = None
+
+# Replays popular queries into the retrieval caches after deploy and on a schedule
+CACHE_WARMUP_ENABLED = os.getenv('CACHE_WARMUP_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+CACHE_WARMUP_DELAY = float(os.getenv('CACHE_WARMUP_DELAY', 30))
+cache_warmer = None
+
+# Retrieval text /optimize sends to the knowledge base
+OPTIMIZE_QUERY_TEMPLATE = "How can I optimize this SQL query? {}"
+
+# MMR relevance/diversity trade-off per endpoint (1.0 = pure ranking, lower = more diverse tables)
+MMR_LAMBDAS = {
+    '/query': float(os.getenv('MMR_LAMBDA_QUERY', 0.7)),
+    '/query/multi': float(os.getenv('MMR_LAMBDA_QUERY_MULTI', 0.7)),
+    '/relationship': float(os.getenv('MMR_LAMBDA_RELATIONSHIP', 0.5)),
+    '/optimize': float(os.getenv('MMR_LAMBDA_OPTIMIZE', 0.5))
+}
+
 def get_ssm_client():
     """Get or create SSM client"""
     global ssm_client
@@ -145,20 +210,193 @@ def get_chat_db_config():
         'port': int(os.getenv('CHAT_DB_PORT', 3306))
     }
 
+def get_chat_writer() -> Optional[ChatMessageWriter]:
+    """Get or start the write-behind chat message writer"""
+    global chat_writer
+    if not mysql.connector:
+        return None
+    if not chat_writer:
+        chat_writer = ChatMessageWriter(get_chat_db_connection)
+        chat_writer.start()
+    return chat_writer
+
+def get_query_analytics() -> Optional[QueryAnalyticsAggregator]:
+    """Get or start the query analytics aggregator"""
+    global query_analytics
+    if not mysql.connector:
+        return None
+    if not query_analytics:
+        query_analytics = QueryAnalyticsAggregator(get_chat_db_connection)
+        query_analytics.start()
+    return query_analytics
+
+def get_job_runner() -> Optional[JobRunner]:
+    """Get or create the background job runner"""
+    global job_runner
+    if not mysql.connector:
+        return None
+    if not job_runner:
+        job_runner = JobRunner(get_chat_db_connection)
+        job_runner.register('feedback_training', run_feedback_training_job)
+    return job_runner
+
+def get_cache_warmer() -> CacheWarmer:
+    """Get or create the retrieval cache warmer"""
+    global cache_warmer
+    if not cache_warmer:
+        cache_warmer = CacheWarmer(get_chat_db_connection, replay_warmup_query)
+    return cache_warmer
+
+def chat_db_backing_off() -> bool:
+    """True while a recent chat DB connect failure is being waited out"""
+    return time.time() < chat_db_retry_at
+
+def chat_db_connect_failed():
+    """Start the retry backoff after a failed chat DB connect"""
+    global chat_db_retry_at
+    chat_db_retry_at = time.time() + CHAT_DB_RETRY_SECONDS
+
+def get_chat_db_pool():
+    """Get or create the chat database connection pool (CHAT_DB_POOL_SIZE=0 disables it)"""
+    global chat_db_pool
+    if chat_db_pool or CHAT_DB_POOL_SIZE <= 0 or not mysql.connector or chat_db_backing_off():
+        return chat_db_pool
+    
+    with chat_db_pool_lock:
+        if not chat_db_pool and not chat_db_backing_off():
+            try:
+                from mysql.connector import pooling
+                chat_db_pool = pooling.MySQLConnectionPool(
+                    pool_name='dbkb_chat',
+                    pool_size=CHAT_DB_POOL_SIZE,
+                    pool_reset_session=True,
+                    **get_chat_db_config()
+                )
+                logger.info(f"Chat database pool created with {CHAT_DB_POOL_SIZE} connections")
+            except Error as e:
+                chat_db_connect_failed()
+                logger.error(f"Failed to create chat database pool, retrying in {CHAT_DB_RETRY_SECONDS}s: {e}")
+    return chat_db_pool
+
 def get_chat_db_connection():
     """Get database connection for chat persistence"""
     if not mysql.connector:
         logger.warning("MySQL connector not available - chat persistence disabled")
         return None
     
+    pool = get_chat_db_pool()
+    if pool:
+        try:
+            # close() on a pooled connection hands it back to the pool
+            return pool.get_connection()
+        except Error as e:
+            logger.warning(f"Chat database pool unavailable, opening a direct connection: {e}")
+    
+    if chat_db_backing_off():
+        return None
+    
     try:
         db_config = get_chat_db_config()
         connection = mysql.connector.connect(**db_config)
         return connection
     except Error as e:
+        chat_db_connect_failed()
         logger.error(f"Failed to connect to chat database: {e}")
         return None
 
+# Validated corrections are loaded from the chat database into per-KB in-memory indexes
+corrections_index.configure(get_chat_db_connection)
+
+
+def run_warmup_step(name: str, step):
+    """Run one warm-up step, recording its duration and outcome"""
+    started = time.time()
+    try:
+        detail = step()
+        warmup_state['steps'][name] = {'status': 'ok', 'ms': int((time.time() - started) * 1000)}
+        if detail is not None:
+            warmup_state['steps'][name]['detail'] = detail
+    except Exception as e:
+        logger.warning(f"Warm-up step '{name}' failed: {e}")
+        warmup_state['steps'][name] = {'status': 'failed', 'ms': int((time.time() - started) * 1000),
+                                       'error': str(e)}
+
+def warmup_knowledge_bases() -> Dict[str, str]:
+    """Knowledge bases whose caches are warmed, as {kb_id: kb_type}"""
+    kb_ids = {}
+    kb_ids[default_kb_id()] = 'database'
+    for kbs in refresh_application_kbs().values():
+        kb_ids[kbs.databaseKnowledgeBaseId] = 'database'
+        if kbs.supportKnowledgeBaseId:
+            kb_ids.setdefault(kbs.supportKnowledgeBaseId, 'support')
+    return kb_ids
+
+def replay_warmup_query(kb_id: str, endpoint: str, query_text: str):
+    """Run one historical query through the same retrieval path its endpoint uses"""
+    client = get_retrieval_client_for_kb(kb_id)
+    if not client:
+        raise RuntimeError(f"no retrieval client for KB {kb_id}")
+    
+    # Same MMR lambda as the live endpoint so the warmed cache keys match
+    mmr_lambda = MMR_LAMBDAS.get(endpoint, MMR_LAMBDAS['/query'])
+    if endpoint == '/relationship':
+        result = client.relationship_retrieval(query_text, mmr_lambda=mmr_lambda)
+    elif endpoint == '/optimize':
+        result = client.multi_strategy_retrieval(OPTIMIZE_QUERY_TEMPLATE.format(query_text), mmr_lambda=mmr_lambda)
+    else:
+        result = client.multi_strategy_retrieval(query_text, mmr_lambda=mmr_lambda)
+    
+    # Retrieval methods report failures in the result instead of raising
+    if result.get('error'):
+        raise RuntimeError(result['error'])
+    return result
+
+def warm_up():
+    """Pay cold-start costs before the task takes traffic.
+
+    Failed steps are recorded but do not block readiness - the lazy paths still
+    work, they are just slower on the first request.
+    """
+    warmup_state['started_at'] = time.time()
+    logger.info("Warming up API...")
+    
+    def warm_database():
+        get_db_credentials()
+        connection = get_chat_db_connection()
+        if not connection:
+            raise RuntimeError("chat database unavailable")
+        connection.close()
+    
+    def warm_retrieval_clients():
+        if not get_default_retrieval_client():
+            raise RuntimeError("default retrieval client unavailable")
+        kb_ids = set()
+        for kbs in refresh_application_kbs().values():
+            kb_ids.add(kbs.databaseKnowledgeBaseId)
+            if kbs.supportKnowledgeBaseId:
+                kb_ids.add(kbs.supportKnowledgeBaseId)
+        for kb_id in kb_ids:
+            get_retrieval_client_for_kb(kb_id)
+        return sorted(retrieval_clients)
+    
+    def warm_bedrock_connections():
+        # One tiny retrieve per KB opens the TLS connections boto3 will reuse
+        for kb_id, client in list(retrieval_clients.items()):
+            if hasattr(client, 'warm_up'):
+                client.warm_up()
+    
+    def warm_corrections_indexes():
+        return {kb_id: corrections_index.get_corrections_index(kb_id).refresh() for kb_id in list(retrieval_clients)}
+    
+    run_warmup_step('database', warm_database)
+    run_warmup_step('application_routing', lambda: len(refresh_application_kbs(force=True)))
+    run_warmup_step('retrieval_clients', warm_retrieval_clients)
+    run_warmup_step('bedrock_connections', warm_bedrock_connections)
+    run_warmup_step('corrections_indexes', warm_corrections_indexes)
+    
+    warmup_state['completed_at'] = time.time()
+    warmup_state['ready'] = True
+    logger.info(f"✅ Warm-up finished in {warmup_state['completed_at'] - warmup_state['started_at']:.1f}s")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -168,21 +406,51 @@ async def lifespan(app: FastAPI):
     
     # Initialize to None first for fast startup
     retrieval_client = None
+    
+    if WARMUP_ON_STARTUP:
+        # Runs in the background so /health answers immediately; /ready gates ALB traffic
+        warmup_state['ready'] = False
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    else:
+        # Application routing table is tiny - load it up front so /query/multi never waits on it.
+        # Done in the background so an unreachable chat DB can't delay startup.
+        threading.Thread(target=refresh_application_kbs, kwargs={'force': True}, daemon=True).start()
+    get_chat_writer()
+    get_query_analytics()
+    runner = get_job_runner()
+    if runner:
+        # Pick up queued jobs and jobs whose task died, now and every lease period
+        runner.start_reclaimer()
+    if CACHE_WARMUP_ENABLED:
+        get_cache_warmer().start(warmup_knowledge_bases, delay=CACHE_WARMUP_DELAY)
     logger.info("✅ API started successfully (client will be initialized on first request)")
     
     yield
     
     # Cleanup on shutdown
     logger.info("Shutting down Database Knowledge Base API...")
+    if chat_writer:
+        # Durable flush of any buffered chat messages before the task exits
+        chat_writer.stop()
+    if query_analytics:
+        query_analytics.stop()
+    if job_runner:
+        job_runner.shutdown()
+    if cache_warmer:
+        cache_warmer.stop()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Database Knowledge Base API",
     description="Intelligent knowledge base for database schema and queries using Amazon Bedrock",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
+# Compress large JSON answers (contexts, thinking) for clients that accept it
+app.add_middleware(CompressionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -271,6 +539,7 @@ class ChatMessageRequest(BaseModel):
 class ChatSessionResponse(BaseModel):
     sessionId: str
     messages: Optional[List[Dict]] = []
+    nextCursor: Optional[str] = None
 
 class ChatMessage(BaseModel):
     Id: int
@@ -307,8 +576,8 @@ class TrainingStatusResponse(BaseModel):
     improvementMetrics: Optional[Dict] = None
 
 # Helper functions that use the models (moved after model definitions)
-def get_application_kbs(application_name: str) -> Optional[ApplicationKBs]:
-    """Get knowledge base IDs for an application"""
+def load_application_kbs() -> Optional[Dict[str, ApplicationKBs]]:
+    """Load the knowledge base IDs for every active application"""
     connection = get_chat_db_connection()
     if not connection:
         return None
@@ -316,27 +585,65 @@ def get_application_kbs(application_name: str) -> Optional[ApplicationKBs]:
     try:
         cursor = connection.cursor(dictionary=True)
         cursor.execute(
-            """SELECT DatabaseKnowledgeBaseId, SupportKnowledgeBaseId, DocumentationKnowledgeBaseId 
-               FROM application WHERE Name = %s AND IsActive = TRUE""",
-            (application_name,)
+            """SELECT Name, DatabaseKnowledgeBaseId, SupportKnowledgeBaseId, DocumentationKnowledgeBaseId 
+               FROM application WHERE IsActive = TRUE"""
         )
-        result = cursor.fetchone()
         
-        if result:
-            return ApplicationKBs(
-                databaseKnowledgeBaseId=result['DatabaseKnowledgeBaseId'],
-                supportKnowledgeBaseId=result['SupportKnowledgeBaseId'],
-                documentationKnowledgeBaseId=result['DocumentationKnowledgeBaseId']
+        routing_table = {}
+        for row in cursor.fetchall():
+            routing_table[row['Name']] = ApplicationKBs(
+                databaseKnowledgeBaseId=row['DatabaseKnowledgeBaseId'],
+                supportKnowledgeBaseId=row['SupportKnowledgeBaseId'],
+                documentationKnowledgeBaseId=row['DocumentationKnowledgeBaseId']
             )
-        return None
+        cursor.close()
+        return routing_table
         
     except Error as e:
-        logger.error(f"Failed to get application KBs: {e}")
+        logger.error(f"Failed to load application KBs: {e}")
         return None
     finally:
         if connection:
             connection.close()
 
+def refresh_application_kbs(force: bool = False) -> Dict[str, ApplicationKBs]:
+    """Reload the application routing table when it is stale (or when forced)"""
+    global application_kbs_cache, application_kbs_loaded_at
+    
+    if not force and application_kbs_cache is not None and \
+            time.time() - application_kbs_loaded_at < APPLICATION_KBS_TTL:
+        return application_kbs_cache
+    
+    with application_kbs_lock:
+        # Another request may have refreshed the table while we waited
+        if not force and application_kbs_cache is not None and \
+                time.time() - application_kbs_loaded_at < APPLICATION_KBS_TTL:
+            return application_kbs_cache
+        
+        routing_table = load_application_kbs()
+        if routing_table is not None:
+            application_kbs_cache = routing_table
+            application_kbs_loaded_at = time.time()
+            logger.info(f"Loaded KB routing for {len(routing_table)} applications")
+        elif application_kbs_cache is not None:
+            # Keep serving the last known table, but retry sooner than a full TTL
+            application_kbs_loaded_at = time.time() - APPLICATION_KBS_TTL + APPLICATION_KBS_RETRY_SECONDS
+            logger.warning("Could not refresh application KBs, serving cached routing table")
+    
+    return application_kbs_cache or {}
+
+def invalidate_application_kbs_cache():
+    """Drop the cached routing table so the next lookup reloads it"""
+    global application_kbs_cache, application_kbs_loaded_at
+    with application_kbs_lock:
+        application_kbs_cache = None
+        application_kbs_loaded_at = 0.0
+    logger.info("Application KB routing cache invalidated")
+
+def get_application_kbs(application_name: str) -> Optional[ApplicationKBs]:
+    """Get knowledge base IDs for an application"""
+    return refresh_application_kbs().get(application_name)
+
 def classify_query_and_get_targets(query_text: str, app_kbs: ApplicationKBs, query_mode: str = 'smart') -> List[QueryTarget]:
     """Classify query and determine which knowledge bases to use"""
     targets = []
@@ -382,6 +689,21 @@ def classify_query_and_get_targets(query_text: str, app_kbs: ApplicationKBs, que
     
     return targets
 
+def record_query_analytics(user_context: Optional[UserContext], kb_id: str, query_text: str,
+                           endpoint: str, query_type: str, started_at: float,
+                           success: bool = True, error_message: Optional[str] = None):
+    """Count a query in the in-memory analytics (no database work on the request path)"""
+    if not user_context:
+        return
+    analytics = get_query_analytics()
+    if analytics:
+        analytics.record(
+            user_context.company, kb_id, query_text,
+            int((time.time() - started_at) * 1000),
+            endpoint=endpoint, query_type=query_type,
+            success=success, error_message=error_message
+        )
+
 def ensure_user_and_company(user_context: UserContext):
     """Ensure user and company exist in database, create if needed"""
     connection = get_chat_db_connection()
@@ -464,6 +786,32 @@ try:
 except Exception as e:
     logger.warning(f"Could not mount static files: {e}")
 
+UI_HTML_CACHE_CONTROL = "no-cache"
+UI_SCRIPT_CACHE_CONTROL = f"public, max-age={int(os.getenv('UI_SCRIPT_MAX_AGE', 3600))}"
+
+UI_FALLBACK_HTML = """
+        <html>
+            <head><title>DBKB API</title></head>
+            <body>
+                <h1>Database Knowledge Base API</h1>
+                <p>API is running. Access the documentation at <a href="/docs">/docs</a></p>
+            </body>
+        </html>
+        """
+
+def load_ui_assets() -> Dict[str, Optional[StaticAsset]]:
+    """Load the UI pages and widget once, with API_ENDPOINT substituted"""
+    return {
+        'index': load_asset("src/ui/index.html", "text/html; charset=utf-8", UI_HTML_CACHE_CONTROL,
+                            {"{{API_ENDPOINT}}": os.getenv("API_ENDPOINT", "")})
+                 or StaticAsset(UI_FALLBACK_HTML.encode(), "text/html; charset=utf-8", UI_HTML_CACHE_CONTROL),
+        'script': load_asset("src/ui/db-knowledge-assistant.js", "application/javascript",
+                             UI_SCRIPT_CACHE_CONTROL),
+        'test': load_asset("src/ui/test.html", "text/html; charset=utf-8", UI_HTML_CACHE_CONTROL)
+    }
+
+ui_assets = load_ui_assets()
+
 # Chat API endpoints
 @app.post("/chat/session", response_model=ChatSessionResponse)
 async def create_or_get_chat_session(request: ChatSessionRequest):
@@ -487,7 +835,7 @@ async def create_or_get_chat_session(request: ChatSessionRequest):
         
         # Check for existing active session
         cursor.execute(
-            """SELECT SessionUuid, Id FROM chat_sessions 
+            """SELECT SessionUuid, Id FROM chat_session 
                WHERE UserId = %s AND CompanyId = %s AND IsActive = TRUE 
                ORDER BY CreatedAt DESC LIMIT 1""",
             (user_id, company_id)
@@ -498,30 +846,29 @@ async def create_or_get_chat_session(request: ChatSessionRequest):
             session_uuid = session_result['SessionUuid']
             session_id = session_result['Id']
             
-            # Get recent messages
-            cursor.execute(
-                """SELECT MessageType, Content, CreatedAt, Metadata 
-                   FROM chat_messages 
-                   WHERE SessionId = %s 
-                   ORDER BY CreatedAt DESC LIMIT 50""",
-                (session_id,)
-            )
-            messages = list(reversed(cursor.fetchall()))
+            # Get recent messages (newest page first, returned oldest-first for display)
+            page = query_session_messages(cursor, session_id, limit=50,
+                                          fields=['MessageType', 'Content', 'CreatedAt', 'Metadata'])
+            next_cursor = page_next_cursor(page, 50)
+            messages = list(reversed(page[:50]))
         else:
             # Create new session
             session_uuid = str(uuid.uuid4())
+            app_kbs = get_application_kbs(user_context.application)
+            kb_id = app_kbs.databaseKnowledgeBaseId if app_kbs else user_context.application
             cursor.execute(
-                """INSERT INTO chat_sessions (SessionUuid, UserId, CompanyId, KnowledgeBaseId) 
+                """INSERT INTO chat_session (SessionUuid, UserId, CompanyId, KnowledgeBaseId) 
                    VALUES (%s, %s, %s, %s)""",
-                (session_uuid, user_id, company_id, user_context.DatabaseKnowledgeBaseId)
+                (session_uuid, user_id, company_id, kb_id)
             )
             connection.commit()
             messages = []
+            next_cursor = None
         
         cursor.close()
         connection.close()
         
-        return ChatSessionResponse(sessionId=session_uuid, messages=messages)
+        return ChatSessionResponse(sessionId=session_uuid, messages=messages, nextCursor=next_cursor)
         
     except Exception as e:
         logger.error(f"Error in create_or_get_chat_session: {e}")
@@ -529,15 +876,136 @@ async def create_or_get_chat_session(request: ChatSessionRequest):
         session_uuid = str(uuid.uuid4())
         return ChatSessionResponse(sessionId=session_uuid, messages=[])
 
-def get_retrieval_client_for_kb(kb_id: str):
-    """Get a retrieval client for a specific knowledge base ID"""
+# Columns a client may project from chat_message. Metadata can hold large
+# thinking/context blobs, so it is only returned when asked for explicitly.
+CHAT_MESSAGE_FIELDS = ['Id', 'MessageType', 'Content', 'CreatedAt', 'QueryType', 'EndpointUsed',
+                       'ResponseTimeMs', 'QueryMode', 'SourceKnowledgeBase', 'Metadata']
+DEFAULT_CHAT_MESSAGE_FIELDS = [f for f in CHAT_MESSAGE_FIELDS if f != 'Metadata']
+MAX_CHAT_MESSAGE_PAGE = 200
+
+def encode_message_cursor(created_at, message_id: int) -> str:
+    """Encode a (CreatedAt, Id) keyset position as an opaque cursor"""
+    created = created_at.isoformat() if hasattr(created_at, 'isoformat') else str(created_at)
+    return base64.urlsafe_b64encode(f"{created}|{message_id}".encode()).decode()
+
+def decode_message_cursor(cursor_value: str):
+    """Decode a cursor produced by encode_message_cursor into (CreatedAt, Id)"""
     try:
-        # Import here to avoid circular imports
-        from utils.retrieval import create_retrieval_client
-        return create_retrieval_client(kb_id)
-    except Exception as e:
-        logger.error(f"Failed to create retrieval client for KB {kb_id}: {e}")
+        created, message_id = base64.urlsafe_b64decode(cursor_value.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(created), int(message_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+def query_session_messages(cursor, session_id: int, before: Optional[str] = None,
+                           limit: int = 50, fields: Optional[List[str]] = None) -> List[Dict]:
+    """Fetch up to limit + 1 messages older than the cursor, newest first.
+
+    Keyset pagination on (CreatedAt, Id) walks the idx_session_messages index
+    backwards instead of scanning past an OFFSET. The extra row tells the caller
+    whether another page exists.
+    """
+    columns = list(dict.fromkeys(['Id', 'CreatedAt'] + (fields or DEFAULT_CHAT_MESSAGE_FIELDS)))
+    sql = f"SELECT {', '.join(columns)} FROM chat_message WHERE SessionId = %s"
+    params = [session_id]
+    
+    if before:
+        created_at, message_id = decode_message_cursor(before)
+        sql += " AND (CreatedAt < %s OR (CreatedAt = %s AND Id < %s))"
+        params.extend([created_at, created_at, message_id])
+    
+    sql += " ORDER BY CreatedAt DESC, Id DESC LIMIT %s"
+    params.append(limit + 1)
+    
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+def page_next_cursor(rows: List[Dict], limit: int) -> Optional[str]:
+    """Cursor for the page after rows, or None when rows was the last page"""
+    if len(rows) <= limit:
         return None
+    last = rows[limit - 1]
+    return encode_message_cursor(last['CreatedAt'], last['Id'])
+
+@app.get("/chat/session/{session_uuid}/messages")
+async def get_chat_session_messages(session_uuid: str, before: Optional[str] = None,
+                                    limit: int = 50, fields: Optional[str] = None):
+    """Page backwards through a session's messages (newest first)"""
+    limit = max(1, min(limit, MAX_CHAT_MESSAGE_PAGE))
+    
+    if fields:
+        selected = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in selected if f not in CHAT_MESSAGE_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    else:
+        selected = DEFAULT_CHAT_MESSAGE_FIELDS
+    
+    connection = get_chat_db_connection()
+    if not connection:
+        raise HTTPException(status_code=500, detail="Database unavailable")
+    
+    # Query before the response starts: once streaming has begun a DB error
+    # can only truncate the body, not change the status
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT Id FROM chat_session WHERE SessionUuid = %s", (session_uuid,))
+        session_result = cursor.fetchone()
+        
+        if not session_result:
+            raise HTTPException(status_code=404, detail="Session not found")
+        
+        rows = query_session_messages(cursor, session_result['Id'], before, limit, selected)
+        cursor.close()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting chat session messages: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        connection.close()
+    
+    next_cursor = page_next_cursor(rows, limit)
+    
+    def stream_page():
+        # Serialize message by message so long sessions never build one large response string
+        yield f'{{"sessionId": {json.dumps(session_uuid)}, "messages": ['
+        for i, row in enumerate(rows[:limit]):
+            message = {field: row[field] for field in selected}
+            yield (',' if i else '') + json.dumps(message, default=str)
+        yield f'], "nextCursor": {json.dumps(next_cursor)}}}'
+    
+    return StreamingResponse(stream_page(), media_type="application/json")
+
+def get_retrieval_client_for_kb(kb_id: str):
+    """Get a retrieval client for a specific knowledge base ID"""
+    client = retrieval_clients.get(kb_id)
+    if client:
+        return client
+    
+    with retrieval_clients_lock:
+        client = retrieval_clients.get(kb_id)
+        if client:
+            return client
+        try:
+            # Import here to avoid circular imports
+            from utils.retrieval import create_retrieval_client
+            client = create_retrieval_client(kb_id)
+            retrieval_clients[kb_id] = client
+            return client
+        except Exception as e:
+            logger.error(f"Failed to create retrieval client for KB {kb_id}: {e}")
+            return None
+
+def get_default_retrieval_client():
+    """Retrieval client for the default knowledge base (single-KB endpoints)
+
+    Taken from the per-KB registry, so the single-KB endpoints share the
+    client and retrieval cache the cache warmer fills.
+    """
+    global retrieval_client
+    if not retrieval_client:
+        retrieval_client = get_retrieval_client_for_kb(default_kb_id())
+    return retrieval_client
 
 @app.post("/query/multi")
 async def multi_kb_query(request: QueryRequest):
@@ -565,6 +1033,7 @@ async def multi_kb_query(request: QueryRequest):
         results = []
         
         for target in targets:
+            started_at = time.time()
             try:
                 # Get retrieval client for this specific KB
                 kb_client = get_retrieval_client_for_kb(target.kbId)
@@ -575,8 +1044,11 @@ async def multi_kb_query(request: QueryRequest):
                 # Query this knowledge base
                 result = kb_client.advanced_rag_query(
                     request.query_text,
-                    use_extended_thinking=request.extended_thinking
+                    use_extended_thinking=request.extended_thinking,
+                    mmr_lambda=MMR_LAMBDAS['/query/multi']
                 )
+                record_query_analytics(request.userContext, target.kbId, request.query_text,
+                                       '/query/multi', target.type, started_at)
                 
                 result['source_type'] = target.type
                 result['kb_id'] = target.kbId
@@ -586,6 +1058,9 @@ async def multi_kb_query(request: QueryRequest):
                 
             except Exception as e:
                 logger.error(f"Error querying KB {target.kbId}: {e}")
+                record_query_analytics(request.userContext, target.kbId, request.query_text,
+                                       '/query/multi', target.type, started_at,
+                                       success=False, error_message=str(e))
                 continue
         
         if not results:
@@ -617,7 +1092,7 @@ async def multi_kb_query(request: QueryRequest):
         response_data = {"answer": primary_result['answer']}
         
         if request.include_thinking and primary_result.get('thinking'):
-            response_data['thinking'] = primary_result['thinking']
+            response_data['thinking'] = render_thinking(primary_result['thinking'])
         
         if request.include_contexts and primary_result.get('retrieved_contexts'):
             response_data['contexts'] = primary_result['retrieved_contexts']
@@ -631,57 +1106,22 @@ async def multi_kb_query(request: QueryRequest):
 
 @app.post("/chat/message")
 async def save_chat_message(request: ChatMessageRequest):
-    """Save a chat message to the database"""
+    """Queue a chat message for batched persistence"""
     try:
-        user_id, company_id = ensure_user_and_company(request.userContext)
-        
-        if not user_id or not company_id:
+        writer = get_chat_writer()
+        if not writer:
             return {"status": "success", "note": "message not persisted - database unavailable"}
         
-        connection = get_chat_db_connection()
-        if not connection:
-            return {"status": "success", "note": "message not persisted - database unavailable"}
-        
-        cursor = connection.cursor()
-        
-        # Get session internal ID
-        cursor.execute(
-            "SELECT Id FROM chat_sessions WHERE SessionUuid = %s",
-            (request.sessionId,)
-        )
-        session_result = cursor.fetchone()
-        
-        if not session_result:
-            cursor.close()
-            connection.close()
-            return {"status": "error", "message": "Session not found"}
-        
-        session_id = session_result[0]
-        
-        # Save message
-        cursor.execute(
-            """INSERT INTO chat_messages 
-               (SessionId, UserId, CompanyId, MessageType, Content, Metadata, 
-                QueryType, EndpointUsed, ResponseTimeMs) 
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-            (session_id, user_id, company_id, request.messageType, request.content,
-             request.metadata.get('metadata', '{}') if request.metadata else '{}',
-             request.metadata.get('queryType'), request.metadata.get('endpointUsed'),
-             request.metadata.get('responseTime'))
-        )
-        
-        # Update session timestamp
-        cursor.execute(
-            "UPDATE chat_sessions SET UpdatedAt = NOW() WHERE Id = %s",
-            (session_id,)
-        )
-        
-        connection.commit()
-        cursor.close()
-        connection.close()
+        # Acknowledge immediately - the writer resolves the session and inserts in batches.
+        # enqueue never waits for room, so a full buffer does not stall the event loop
+        if not writer.enqueue(request.sessionId, request.messageType, request.content, request.metadata):
+            return {"status": "success", "note": "message not persisted - write queue full"}
         
-        return {"status": "success", "message": "Message saved"}
+        return {"status": "success", "message": "Message queued"}
         
+    except ValueError as e:
+        logger.warning(f"Rejected chat message: {e}")
+        return {"status": "success", "note": f"message not persisted - {e}"}
     except Exception as e:
         logger.error(f"Error saving chat message: {e}")
         return {"status": "success", "note": "message not persisted - error occurred"}
@@ -745,6 +1185,8 @@ async def submit_feedback(request: FeedbackRequest):
         cursor.close()
         connection.close()
         
+        invalidate_training_status(kb_id, request.userContext.company)
+        
         if request.feedbackType == 'correction' and request.correctedResponse:
             logger.info(f"Feedback {feedback_id} queued for training pipeline")
         
@@ -758,10 +1200,28 @@ async def submit_feedback(request: FeedbackRequest):
         logger.error(f"Error submitting feedback: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_cached_training_status(kb_id: str, company_code: str) -> Optional[TrainingStatusResponse]:
+    """Return a cached training status if it is still fresh"""
+    with training_status_lock:
+        entry = training_status_cache.get((kb_id, company_code))
+    if entry and time.time() - entry['timestamp'] < TRAINING_STATUS_TTL:
+        return entry['status']
+    return None
+
+def invalidate_training_status(kb_id: str, company_code: str):
+    """Drop the cached training status after feedback is submitted or processed"""
+    with training_status_lock:
+        training_status_cache.pop((kb_id, company_code), None)
+
 @app.get("/feedback/training-status", response_model=TrainingStatusResponse)
 async def get_training_status(request: TrainingStatusRequest):
     """Get training status for a knowledge base"""
     try:
+        # The UI polls this endpoint - serve repeat calls from memory
+        cached_status = get_cached_training_status(request.knowledgeBaseId, request.userContext.company)
+        if cached_status:
+            return cached_status
+        
         user_id, company_id = ensure_user_and_company(request.userContext)
         
         if not user_id or not company_id:
@@ -774,76 +1234,126 @@ async def get_training_status(request: TrainingStatusRequest):
         cursor = connection.cursor()
         
         cursor.execute(
-            """SELECT COUNT(*) FROM query_feedback 
-               WHERE KnowledgeBaseId = %s AND CompanyId = %s AND ProcessingStatus = 'pending'""",
-            (request.knowledgeBaseId, company_id)
+            """SELECT 
+                   COALESCE(SUM(CASE WHEN ProcessingStatus = 'pending' THEN 1 ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN ProcessingStatus IN ('applied', 'reviewed') THEN 1 ELSE 0 END), 0),
+                   (SELECT MAX(CompletedAt) FROM kb_improvement_log 
+                    WHERE KnowledgeBaseId = %s AND CompanyId = %s AND Status = 'completed')
+               FROM query_feedback 
+               WHERE KnowledgeBaseId = %s AND CompanyId = %s""",
+            (request.knowledgeBaseId, company_id, request.knowledgeBaseId, company_id)
         )
-        pending_count = cursor.fetchone()[0]
-        
-        cursor.execute(
-            """SELECT COUNT(*) FROM query_feedback 
-               WHERE KnowledgeBaseId = %s AND CompanyId = %s AND ProcessingStatus IN ('applied', 'reviewed')""",
-            (request.knowledgeBaseId, company_id)
-        )
-        processed_count = cursor.fetchone()[0]
-        
-        cursor.execute(
-            """SELECT CompletedAt FROM kb_improvement_log 
-               WHERE KnowledgeBaseId = %s AND CompanyId = %s AND Status = 'completed'
-               ORDER BY CompletedAt DESC LIMIT 1""",
-            (request.knowledgeBaseId, company_id)
-        )
-        last_update_result = cursor.fetchone()
-        last_update = last_update_result[0].isoformat() if last_update_result and last_update_result[0] else None
+        pending_count, processed_count, last_completed = cursor.fetchone()
+        last_update = last_completed.isoformat() if last_completed else None
         
         cursor.close()
         connection.close()
         
-        return TrainingStatusResponse(
-            pendingFeedback=pending_count,
-            processedFeedback=processed_count,
+        status = TrainingStatusResponse(
+            pendingFeedback=int(pending_count),
+            processedFeedback=int(processed_count),
             lastTrainingUpdate=last_update
         )
         
+        with training_status_lock:
+            training_status_cache[(request.knowledgeBaseId, request.userContext.company)] = {
+                'status': status,
+                'timestamp': time.time()
+            }
+        
+        return status
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting training status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def run_feedback_training_job(payload: Dict, report_progress) -> Dict:
+    """Background job: process pending feedback for a knowledge base"""
+    connection = get_chat_db_connection()
+    if not connection:
+        raise RuntimeError("Database unavailable")
+    
+    try:
+        from src.training.feedback_processor import FeedbackProcessor
+        
+        processor = FeedbackProcessor()
+        result = processor.process_pending_feedback(
+            payload['knowledgeBaseId'], payload['companyId'], connection,
+            progress_callback=report_progress
+        )
+    finally:
+        connection.close()
+    
+    invalidate_training_status(payload['knowledgeBaseId'], payload['companyCode'])
+    return result
+
 @app.post("/feedback/process-training")
 async def process_training_pipeline(request: TrainingStatusRequest):
-    """Trigger training pipeline to process pending feedback"""
+    """Queue the training pipeline to process pending feedback"""
     try:
         user_id, company_id = ensure_user_and_company(request.userContext)
         
         if not user_id or not company_id:
             raise HTTPException(status_code=400, detail="User context required")
         
-        connection = get_chat_db_connection()
-        if not connection:
+        runner = get_job_runner()
+        job_id = runner.submit(
+            'feedback_training',
+            {
+                'knowledgeBaseId': request.knowledgeBaseId,
+                'companyId': company_id,
+                'companyCode': request.userContext.company
+            },
+            dedupe_key=f"feedback_training:{request.knowledgeBaseId}:{company_id}"
+        ) if runner else None
+        
+        if not job_id:
             raise HTTPException(status_code=500, detail="Database unavailable")
         
-        from src.training.feedback_processor import FeedbackProcessor
-        
-        processor = FeedbackProcessor()
-        result = processor.process_pending_feedback(request.knowledgeBaseId, company_id, connection)
-        
-        connection.close()
-        
         return {
-            "status": "success",
-            "message": f"Processed {result.get('processed', 0)} feedback items",
-            "details": result
+            "status": "accepted",
+            "message": "Training pipeline queued",
+            "jobId": job_id,
+            "statusUrl": f"/jobs/{job_id}"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing training pipeline: {e}")
+        logger.error(f"Error queueing training pipeline: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Report status and progress of a background job"""
+    runner = get_job_runner()
+    if not runner:
+        raise HTTPException(status_code=500, detail="Database unavailable")
+    
+    job = runner.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {
+        "jobId": job['JobUuid'],
+        "type": job['JobType'],
+        "status": job['Status'],
+        "progress": job['Progress'],
+        "result": job['Result'],
+        "error": job['ErrorMessage'],
+        "attempts": job['Attempts'],
+        "createdAt": job['CreatedAt'],
+        "startedAt": job['StartedAt'],
+        "completedAt": job['CompletedAt']
+    }
+
 @app.post("/support/history")
 async def get_support_history(request: ChatSessionRequest):
     """Get support history for a user"""
     try:
-        user_id, company_id = ensure_user_and_company(request.userContext)
+        user_id, company_id = ensure_user_and_company(UserContext(**request.dict()))
         
         if not user_id or not company_id:
             raise HTTPException(status_code=400, detail="User context required")
@@ -854,46 +1364,45 @@ async def get_support_history(request: ChatSessionRequest):
         
         cursor = connection.cursor(dictionary=True)
         
-        # Get recent support sessions
+        # Message counts and the latest user query are maintained on chat_session by
+        # the chat message writer, so this is one range scan on idx_user_kb_sessions
         cursor.execute(
-            """SELECT cs.SessionUuid, cs.Title, cs.CreatedAt, cs.UpdatedAt,
-                      COUNT(cm.Id) as MessageCount
-               FROM chat_session cs
-               LEFT JOIN chat_message cm ON cs.Id = cm.SessionId
-               WHERE cs.UserId = %s AND cs.CompanyId = %s 
-               AND cs.KnowledgeBaseId = 'ECC3L7C2PG'
-               GROUP BY cs.Id
-               ORDER BY cs.UpdatedAt DESC
+            """SELECT SessionUuid, Title, CreatedAt, UpdatedAt, MessageCount,
+                      LastMessageAt, LastUserMessage, LastUserMessageAt
+               FROM chat_session
+               WHERE UserId = %s AND CompanyId = %s 
+               AND KnowledgeBaseId = 'ECC3L7C2PG'
+               ORDER BY UpdatedAt DESC
                LIMIT 10""",
             (user_id, company_id)
         )
         
         sessions = cursor.fetchall()
         
-        # Get recent support messages
-        cursor.execute(
-            """SELECT cm.Content, cm.MessageType, cm.CreatedAt, cm.QueryMode
-               FROM chat_message cm
-               JOIN chat_session cs ON cm.SessionId = cs.Id
-               WHERE cm.UserId = %s AND cm.CompanyId = %s 
-               AND cs.KnowledgeBaseId = 'ECC3L7C2PG'
-               AND cm.MessageType = 'user'
-               ORDER BY cm.CreatedAt DESC
-               LIMIT 20""",
-            (user_id, company_id)
-        )
-        
-        recent_queries = cursor.fetchall()
-        
         cursor.close()
         connection.close()
         
+        # Latest user query of each recent session, from the same denormalized columns.
+        # QueryMode is kept for compatibility; chat messages are stored without one
+        recent_queries = sorted((
+            {
+                "Content": session['LastUserMessage'],
+                "MessageType": "user",
+                "CreatedAt": session['LastUserMessageAt'],
+                "QueryMode": None,
+                "SessionUuid": session['SessionUuid']
+            }
+            for session in sessions if session['LastUserMessage']
+        ), key=lambda query: query['CreatedAt'], reverse=True)
+        
         return {
             "sessions": sessions,
             "recent_queries": recent_queries,
             "tickets": []  # Placeholder for Zendesk integration
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting support history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -926,38 +1435,17 @@ async def escalate_to_human_support(request: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/db-knowledge-assistant.js")
-async def serve_js():
+async def serve_js(request: Request):
     """Serve the JavaScript file directly"""
-    try:
-        with open("src/ui/db-knowledge-assistant.js", "r") as f:
-            js_content = f.read()
-        return HTMLResponse(content=js_content, media_type="application/javascript")
-    except FileNotFoundError:
+    if not ui_assets['script']:
         raise HTTPException(status_code=404, detail="JavaScript file not found")
+    return ui_assets['script'].response(request)
 
 @app.get("/", response_class=HTMLResponse)
 @app.get("/ui/", response_class=HTMLResponse)
-async def serve_ui():
+async def serve_ui(request: Request):
     """Serve the main UI page"""
-    try:
-        with open("src/ui/index.html", "r") as f:
-            html_content = f.read()
-        
-        # Replace placeholder with actual API endpoint
-        api_endpoint = os.getenv("API_ENDPOINT", "")
-        html_content = html_content.replace("{{API_ENDPOINT}}", api_endpoint)
-        
-        return HTMLResponse(content=html_content)
-    except FileNotFoundError:
-        return HTMLResponse(content="""
-        <html>
-            <head><title>DBKB API</title></head>
-            <body>
-                <h1>Database Knowledge Base API</h1>
-                <p>API is running. Access the documentation at <a href="/docs">/docs</a></p>
-            </body>
-        </html>
-        """)
+    return ui_assets['index'].response(request)
 
 @app.get("/health")
 async def health_check():
@@ -980,14 +1468,45 @@ async def health_check():
             "note": "simplified_health_check"
         }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint for the ALB - 503 until startup warm-up has finished"""
+    body = {
+        "ready": warmup_state['ready'],
+        "warmup": WARMUP_ON_STARTUP,
+        "steps": warmup_state['steps']
+    }
+    if not warmup_state['ready']:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.post("/applications/refresh")
+async def refresh_application_routing():
+    """Reload the cached application-to-KB routing table
+
+    The new table replaces the cached one only if it loads; during a database
+    outage the last known table keeps serving and the response says so.
+    """
+    requested_at = time.time()
+    routing_table = refresh_application_kbs(force=True)
+    applications = {name: kbs.dict() for name, kbs in routing_table.items()}
+    if application_kbs_loaded_at < requested_at:
+        return JSONResponse(status_code=503, content={
+            "status": "error",
+            "message": "Could not reload application routing - serving cached table",
+            "applications": applications
+        })
+    return {
+        "status": "success",
+        "applications": applications
+    }
+
 @app.get('/test', response_class=HTMLResponse)
-async def test_page():
+async def test_page(request: Request):
     """Serve the test page for parameter configuration"""
-    try:
-        with open('src/ui/test.html', 'r') as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
+    if not ui_assets['test']:
         return HTMLResponse(content="Test page not found", status_code=404)
+    return ui_assets['test'].response(request)
 
 @app.post("/query", response_model=APIResponse)
 async def query_knowledge_base(request: QueryRequest):
@@ -998,28 +1517,26 @@ async def query_knowledge_base(request: QueryRequest):
             return await multi_kb_query(request)
         
         # Single KB query (legacy/fallback behavior)
-        global retrieval_client
+        retrieval_client = get_default_retrieval_client()
         if not retrieval_client:
-            try:
-                logger.info("Initializing retrieval client on first request...")
-                retrieval_client = get_retrieval_client()
-                logger.info("✅ Retrieval client initialized successfully")
-            except Exception as e:
-                logger.error(f"❌ Failed to initialize retrieval client: {e}")
-                raise HTTPException(status_code=500, detail="Service initialization failed")
+            raise HTTPException(status_code=500, detail="Service initialization failed")
 
         logger.info(f"Processing single KB query: {request.query_text}")
         
+        started_at = time.time()
         result = retrieval_client.advanced_rag_query(
             request.query_text, 
-            use_extended_thinking=request.extended_thinking
+            use_extended_thinking=request.extended_thinking,
+            mmr_lambda=MMR_LAMBDAS['/query']
         )
+        record_query_analytics(request.userContext, retrieval_client.kb_id, request.query_text,
+                               '/query', 'general', started_at)
 
         # Format response based on options
         response_data = {"answer": result['answer']}
 
         if request.include_thinking and result.get('thinking'):
-            response_data['thinking'] = result['thinking']
+            response_data['thinking'] = render_thinking(result['thinking'])
 
         if request.include_contexts and result.get('retrieved_contexts'):
             response_data['contexts'] = result['retrieved_contexts']
@@ -1035,25 +1552,25 @@ async def query_knowledge_base(request: QueryRequest):
 async def analyze_table_relationships(request: RelationshipRequest):
     """Analyze relationships for a specific table"""
     try:
-        # Lazy initialization of retrieval client
-        global retrieval_client
+        # Shared with the cache warmer through the per-KB client registry
+        retrieval_client = get_default_retrieval_client()
         if not retrieval_client:
-            try:
-                logger.info("Initializing retrieval client on first request...")
-                retrieval_client = get_retrieval_client()
-                logger.info("✅ Retrieval client initialized successfully")
-            except Exception as e:
-                logger.error(f"❌ Failed to initialize retrieval client: {e}")
-                raise HTTPException(status_code=500, detail="Service initialization failed")
+            raise HTTPException(status_code=500, detail="Service initialization failed")
 
         logger.info(f"Analyzing relationships for table: {request.table_name}")
         
-        result = retrieval_client.query_database_relationships(request.table_name)
+        started_at = time.time()
+        result = retrieval_client.query_database_relationships(
+            request.table_name,
+            mmr_lambda=MMR_LAMBDAS['/relationship']
+        )
+        record_query_analytics(request.userContext, retrieval_client.kb_id, request.table_name,
+                               '/relationship', 'relationship', started_at)
 
         response_data = {"answer": result.get('relationship_analysis', '')}
 
         if request.include_thinking and result.get('thinking_process'):
-            response_data['thinking'] = result['thinking_process']
+            response_data['thinking'] = render_thinking(result['thinking_process'])
 
         if request.include_contexts:
             response_data['contexts'] = result.get('retrieved_contexts', [])
@@ -1069,31 +1586,29 @@ async def analyze_table_relationships(request: RelationshipRequest):
 async def optimize_sql_query(request: OptimizeRequest):
     """Get optimization recommendations for a SQL query"""
     try:
-        # Lazy initialization of retrieval client
-        global retrieval_client
+        # Shared with the cache warmer through the per-KB client registry
+        retrieval_client = get_default_retrieval_client()
         if not retrieval_client:
-            try:
-                logger.info("Initializing retrieval client on first request...")
-                retrieval_client = get_retrieval_client()
-                logger.info("✅ Retrieval client initialized successfully")
-            except Exception as e:
-                logger.error(f"❌ Failed to initialize retrieval client: {e}")
-                raise HTTPException(status_code=500, detail="Service initialization failed")
+            raise HTTPException(status_code=500, detail="Service initialization failed")
 
         logger.info(f"Optimizing SQL query: {request.sql_query[:100]}...")
         
         # Create optimization query for the knowledge base
-        optimization_query = f"How can I optimize this SQL query? {request.sql_query}"
+        optimization_query = OPTIMIZE_QUERY_TEMPLATE.format(request.sql_query)
         
+        started_at = time.time()
         result = retrieval_client.advanced_rag_query(
             optimization_query, 
-            use_extended_thinking=True
+            use_extended_thinking=True,
+            mmr_lambda=MMR_LAMBDAS['/optimize']
         )
+        record_query_analytics(request.userContext, retrieval_client.kb_id, request.sql_query,
+                               '/optimize', 'optimization', started_at)
 
         response_data = {"answer": result['answer']}
 
         if request.include_thinking and result.get('thinking'):
-            response_data['thinking'] = result['thinking']
+            response_data['thinking'] = render_thinking(result['thinking'])
 
         if request.include_contexts and result.get('retrieved_contexts'):
             response_data['contexts'] = result['retrieved_contexts']
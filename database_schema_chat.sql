@@ -72,11 +72,16 @@ CREATE TABLE chat_session (
     UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     EndedAt TIMESTAMP NULL,
     IsActive BOOLEAN DEFAULT TRUE,
+    MessageCount INT NOT NULL DEFAULT 0, -- Maintained by the chat message writer
+    LastMessageAt TIMESTAMP NULL,
+    LastUserMessage VARCHAR(500) NULL, -- Preview of the latest user message
+    LastUserMessageAt TIMESTAMP NULL,
     
     FOREIGN KEY (UserId) REFERENCES user(Id) ON DELETE CASCADE,
     FOREIGN KEY (CompanyId) REFERENCES company(Id) ON DELETE CASCADE,
     INDEX idx_session_uuid (SessionUuid),
     INDEX idx_user_sessions (UserId, CreatedAt DESC),
+    INDEX idx_user_kb_sessions (UserId, CompanyId, KnowledgeBaseId, UpdatedAt),
     INDEX idx_company_sessions (CompanyId, CreatedAt DESC),
     INDEX idx_knowledge_base (KnowledgeBaseId)
 );
@@ -124,7 +129,7 @@ CREATE TABLE query_analytic (
     LastUsedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
     FOREIGN KEY (CompanyId) REFERENCES company(Id) ON DELETE CASCADE,
-    UNIQUE KEY unique_query_per_company (CompanyId, QueryHash),
+    UNIQUE KEY unique_query_per_company_kb (CompanyId, KnowledgeBaseId, QueryHash),
     INDEX idx_company_analytics (CompanyId, LastUsedAt DESC),
     INDEX idx_knowledge_base_analytics (KnowledgeBaseId),
     INDEX idx_query_performance (ResponseTimeMs),
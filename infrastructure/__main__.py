@@ -214,7 +214,7 @@ target_group = aws.lb.TargetGroup(
         healthy_threshold=2,
         interval=30,
         matcher="200",
-        path="/health",
+        path="/ready",
         port="traffic-port",
         protocol="HTTP",
         timeout=5,
@@ -379,6 +379,14 @@ task_definition = aws.ecs.TaskDefinition(
                 {{
                     "name": "AWS_DEFAULT_REGION",
                     "value": "{args[2]}"
+                }},
+                {{
+                    "name": "WARMUP_ON_STARTUP",
+                    "value": "true"
+                }},
+                {{
+                    "name": "CACHE_WARMUP_ENABLED",
+                    "value": "true"
                 }}
             ],
             "logConfiguration": {{
@@ -0,0 +1,16 @@
+-- Job leases for background_job tables created before leases were added
+-- Lets several API tasks share the job table without running a job twice (utils/jobs.py)
+USE chat;
+
+ALTER TABLE background_job
+    ADD COLUMN LeaseOwner VARCHAR(255) NULL AFTER Attempts,
+    ADD COLUMN LeaseExpiresAt TIMESTAMP NULL AFTER LeaseOwner,
+    ADD INDEX idx_job_lease (Status, LeaseExpiresAt);
+
+-- One active job per dedupe key, enforced by the database so concurrent submits
+-- from different tasks cannot both insert. Fails if duplicate active jobs exist;
+-- mark the extra ones 'failed' first.
+ALTER TABLE background_job
+    ADD COLUMN ActiveDedupeKey VARCHAR(255)
+        AS (IF(Status IN ('queued', 'running'), DedupeKey, NULL)) STORED AFTER LeaseExpiresAt,
+    ADD UNIQUE KEY unique_active_dedupe (ActiveDedupeKey);
@@ -0,0 +1,32 @@
+USE chat;
+
+-- Background jobs - long-running work (e.g. the feedback training pipeline) run
+-- by the API's in-process worker pool. A running job is leased to the task executing
+-- it; every task periodically resumes queued jobs and running jobs whose lease expired.
+CREATE TABLE background_job (
+    Id INT AUTO_INCREMENT PRIMARY KEY,
+    JobUuid CHAR(36) NOT NULL UNIQUE,
+    JobType VARCHAR(100) NOT NULL, -- 'feedback_training'
+    Payload JSON NOT NULL,
+    DedupeKey VARCHAR(255) NULL, -- Prevents duplicate active jobs for the same target
+    
+    Status ENUM('queued', 'running', 'completed', 'failed') DEFAULT 'queued',
+    Progress JSON NULL,
+    Result JSON NULL,
+    ErrorMessage TEXT NULL,
+    Attempts INT DEFAULT 0,
+    LeaseOwner VARCHAR(255) NULL, -- Task currently running the job
+    LeaseExpiresAt TIMESTAMP NULL, -- Renewed while the job runs; past = owner died
+    -- DedupeKey while the job is active; unique so only one active job per key can exist
+    ActiveDedupeKey VARCHAR(255) AS (IF(Status IN ('queued', 'running'), DedupeKey, NULL)) STORED,
+    
+    CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    StartedAt TIMESTAMP NULL,
+    CompletedAt TIMESTAMP NULL,
+    
+    INDEX idx_job_status (Status, CreatedAt),
+    INDEX idx_job_lease (Status, LeaseExpiresAt),
+    INDEX idx_job_dedupe (DedupeKey, Status),
+    UNIQUE KEY unique_active_dedupe (ActiveDedupeKey)
+);
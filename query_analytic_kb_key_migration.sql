@@ -0,0 +1,10 @@
+-- Count query_analytic rows per knowledge base
+-- utils/query_analytics.py aggregates per (company, KB, query); with the old
+-- (CompanyId, QueryHash) key the same query on two KBs collapsed into one row
+-- whose KnowledgeBaseId was whichever KB flushed last. Rows merged before this
+-- migration keep that last KB.
+USE chat;
+
+ALTER TABLE query_analytic
+    ADD UNIQUE KEY unique_query_per_company_kb (CompanyId, KnowledgeBaseId, QueryHash),
+    DROP INDEX unique_query_per_company;
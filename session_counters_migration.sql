@@ -0,0 +1,36 @@
+-- Denormalized per-session counters for /support/history
+-- Maintained by the batched chat message writer (utils/chat_writer.py)
+USE chat;
+
+ALTER TABLE chat_session
+    ADD COLUMN MessageCount INT NOT NULL DEFAULT 0,
+    ADD COLUMN LastMessageAt TIMESTAMP NULL,
+    ADD COLUMN LastUserMessage VARCHAR(500) NULL,
+    ADD COLUMN LastUserMessageAt TIMESTAMP NULL,
+    ADD INDEX idx_user_kb_sessions (UserId, CompanyId, KnowledgeBaseId, UpdatedAt);
+
+-- Backfill existing sessions
+UPDATE chat_session cs
+JOIN (
+    SELECT SessionId, COUNT(*) AS MessageCount, MAX(CreatedAt) AS LastMessageAt
+    FROM chat_message
+    GROUP BY SessionId
+) counts ON counts.SessionId = cs.Id
+SET cs.MessageCount = counts.MessageCount,
+    cs.LastMessageAt = counts.LastMessageAt,
+    cs.UpdatedAt = cs.UpdatedAt;
+
+UPDATE chat_session cs
+JOIN (
+    SELECT cm.SessionId, LEFT(cm.Content, 500) AS Content, cm.CreatedAt
+    FROM chat_message cm
+    JOIN (
+        SELECT SessionId, MAX(Id) AS Id
+        FROM chat_message
+        WHERE MessageType = 'user'
+        GROUP BY SessionId
+    ) latest ON latest.Id = cm.Id
+) last_user ON last_user.SessionId = cs.Id
+SET cs.LastUserMessage = last_user.Content,
+    cs.LastUserMessageAt = last_user.CreatedAt,
+    cs.UpdatedAt = cs.UpdatedAt;
@@ -1,2 +1,10 @@
 # Advanced retrieval module
-from .retrieval_techniques import AdvancedRetrieval
\ No newline at end of file
+# AdvancedRetrieval (and with it boto3) is loaded on first access, so the
+# lexical submodules such as text_utils can be imported on their own
+
+
+def __getattr__(name):
+    if name == 'AdvancedRetrieval':
+        from .retrieval_techniques import AdvancedRetrieval
+        return AdvancedRetrieval
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,174 @@
+"""
+Adaptive numberOfResults for knowledge base retrieval
+Each retrieval starts with a fraction of the results a call site asks for,
+fetches the full amount only when the scores are too flat to tell the
+results apart, and cuts the list at the first large score gap. Per-strategy
+parameters come from a policy file learned offline from logged score
+distributions (see ``learn_policies``)
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from src.advanced_retrieval.context import RetrievedContext
+
+logger = logging.getLogger('adaptive_retrieval')
+
+POLICY_FILE = os.getenv('RETRIEVAL_POLICY_FILE', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'retrieval_policy.json'
+))
+
+# JSONL file of {strategy, requested, scores} records to learn policies from (unset = off)
+SCORE_LOG_FILE = os.getenv('RETRIEVAL_SCORE_LOG')
+
+
+class RetrievalPolicy:
+    """How many results to fetch for one strategy and where to cut them
+
+    ``start``: fraction of the requested results fetched first.
+    ``flat_spread``: if (top - last) / top of that first fetch is below this, the
+    ranking cannot separate the results and the full requested amount is fetched.
+    ``gap``: results after the first drop larger than ``gap * top`` between
+    neighbours are discarded, but at least ``min_results`` are kept.
+    """
+
+    __slots__ = ('start', 'flat_spread', 'gap', 'min_results')
+
+    def __init__(self, start: float = 0.6, flat_spread: float = 0.1, gap: float = 0.15, min_results: int = 2):
+        self.start = start
+        self.flat_spread = flat_spread
+        self.gap = gap
+        self.min_results = min_results
+
+    def initial_results(self, requested: int) -> int:
+        return min(requested, max(self.min_results, math.ceil(requested * self.start)))
+
+    def is_flat(self, scores: Sequence[float]) -> bool:
+        if len(scores) < 2 or scores[0] <= 0:
+            return True
+        return (scores[0] - scores[-1]) / scores[0] < self.flat_spread
+
+    def cut_at_gap(self, scores: Sequence[float]) -> int:
+        """Number of results to keep: everything before the first large score gap"""
+        if len(scores) <= self.min_results or scores[0] <= 0:
+            return len(scores)
+        drops = -np.diff(np.asarray(scores, dtype=float)) / scores[0]
+        large = np.nonzero(drops > self.gap)[0]
+        return max(self.min_results, int(large[0]) + 1) if len(large) else len(scores)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# Built-in per-strategy defaults, overridden by the learned policy file
+DEFAULT_POLICIES = {
+    'standard': RetrievalPolicy(),
+    'expansion': RetrievalPolicy(start=1.0),  # already a few results per expanded query
+    'hyde': RetrievalPolicy(),
+    'relationship': RetrievalPolicy(start=1.0, gap=0.2),
+    'optimize': RetrievalPolicy(start=1.0, gap=0.2),
+}
+
+
+def load_policies(path: str = POLICY_FILE) -> Dict[str, RetrievalPolicy]:
+    """Default policies with any learned ones from the policy file on top"""
+    policies = dict(DEFAULT_POLICIES)
+    if not os.path.exists(path):
+        return policies
+    try:
+        with open(path) as f:
+            learned = json.load(f)
+        for strategy, params in learned.items():
+            policies[strategy] = RetrievalPolicy(**params)
+    except (OSError, ValueError, TypeError) as e:
+        logger.warning(f"Could not read retrieval policies from {path}: {e}")
+    return policies
+
+
+_score_log_lock = threading.Lock()
+
+
+def log_scores(strategy: str, requested: int, scores: Sequence[float], path: Optional[str] = SCORE_LOG_FILE):
+    """Append a score distribution to the score log used for offline learning"""
+    if not path:
+        return
+    record = json.dumps({'strategy': strategy, 'requested': requested, 'scores': [round(s, 4) for s in scores]})
+    with _score_log_lock:
+        with open(path, 'a') as f:
+            f.write(record + '\n')
+
+
+def adaptive_retrieve(fetch: Callable[[int], List[RetrievedContext]], requested: int,
+                      policy: RetrievalPolicy, strategy: str = 'standard') -> List[RetrievedContext]:
+    """Fetch with the policy: small first, the full amount only if flat, then cut at the first gap
+
+    ``fetch(n)`` runs the search with numberOfResults = n and returns contexts in rank order.
+    """
+    initial = policy.initial_results(requested)
+    contexts = fetch(initial)
+    if initial < requested and len(contexts) == initial and policy.is_flat([c.score for c in contexts]):
+        contexts = fetch(requested)
+
+    scores = [c.score for c in contexts]
+    log_scores(strategy, requested, scores)
+    keep = policy.cut_at_gap(scores)
+    if keep < len(contexts):
+        logger.debug(f"{strategy}: kept {keep} of {len(contexts)} results before a score gap")
+    return contexts[:keep]
+
+
+def learn_policies(records: Iterable[Dict], min_samples: int = 20) -> Dict[str, Dict[str, float]]:
+    """Per-strategy policy parameters from logged score distributions
+
+    ``gap`` is midway between the median and the 90th percentile of neighbour
+    drops (relative to the top score), so only unusually large drops cut the
+    list; ``flat_spread`` is the 25th percentile of score spreads, so the
+    flattest quarter of searches fetch more; ``start`` is the median share of
+    requested results that survive the gap cut.
+    """
+    by_strategy: Dict[str, List[Dict]] = {}
+    for record in records:
+        if len(record.get('scores', [])) >= 2 and record['scores'][0] > 0:
+            by_strategy.setdefault(record['strategy'], []).append(record)
+
+    learned = {}
+    for strategy, samples in by_strategy.items():
+        if len(samples) < min_samples:
+            continue
+        default = DEFAULT_POLICIES.get(strategy, RetrievalPolicy())
+        drops = np.concatenate([-np.diff(s['scores']) / s['scores'][0] for s in samples])
+        spreads = [(s['scores'][0] - s['scores'][-1]) / s['scores'][0] for s in samples]
+        gap = float(np.clip((np.median(drops) + np.percentile(drops, 90)) / 2, 0.05, 0.5))
+        policy = RetrievalPolicy(start=1.0, flat_spread=float(np.clip(np.percentile(spreads, 25), 0.02, 0.5)),
+                                 gap=gap, min_results=default.min_results)
+        kept = [policy.cut_at_gap(s['scores']) / max(s['requested'], 1) for s in samples]
+        policy.start = round(float(np.clip(np.median(kept), 0.3, 1.0)), 2)
+        policy.flat_spread = round(policy.flat_spread, 3)
+        policy.gap = round(policy.gap, 3)
+        learned[strategy] = policy.to_dict()
+    return learned
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Learn adaptive retrieval policies from a score log')
+    parser.add_argument('score_log', help='JSONL file written with RETRIEVAL_SCORE_LOG set')
+    parser.add_argument('--output', default=POLICY_FILE, help='Policy file to write')
+    parser.add_argument('--min-samples', type=int, default=20, help='Minimum searches per strategy')
+    args = parser.parse_args()
+
+    with open(args.score_log) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    policies = learn_policies(records, args.min_samples)
+    with open(args.output, 'w') as f:
+        json.dump(policies, f, indent=2)
+    print(json.dumps(policies, indent=2))
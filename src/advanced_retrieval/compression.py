@@ -0,0 +1,193 @@
+"""
+Query-focused extractive compression of retrieved contexts
+Table docs carry every column, index and generated join example; before a
+context goes into a prompt only the rows and sections that relate to the
+question are kept (named identifiers, key columns, matching join examples)
+"""
+
+import re
+from typing import List, Optional, Sequence, Set
+
+from src.advanced_retrieval.context_packer import estimate_tokens, split_sections
+from src.advanced_retrieval.text_utils import singular, tokenize
+from src.advanced_retrieval.thinking_trace import TraceStage
+
+# SQL keywords carry no information about which columns or tables matter
+SQL_KEYWORDS = {
+    'select', 'from', 'where', 'join', 'inner', 'left', 'right', 'outer', 'on', 'as', 'not', 'null',
+    'group', 'having', 'limit', 'distinct', 'count', 'sum', 'avg', 'min', 'max', 'like', 'between',
+    'asc', 'desc', 'case', 'when', 'then', 'else', 'end', 'union', 'exists', 'top', 'into', 'values'
+}
+
+# Relationship sections are kept whole: they are what joins are built from
+KEY_SECTIONS = ('primary key', 'foreign keys', 'referenced by')
+
+# Markdown table columns marking a key column
+KEY_COLUMN_HEADERS = ('pk', 'fk')
+
+TABLE_END_MARKER = re.compile(r'^\[/TABLE:[^\]]*\]\s*$', re.MULTILINE)
+TABLE_SEPARATOR_ROW = re.compile(r'^\|[\s:|-]+\|$')
+
+
+def query_terms(query_text: str) -> Set[str]:
+    """Question tokens, singular forms and identifier parts used to judge relevance"""
+    terms = set()
+    for token in tokenize(query_text):
+        if token in SQL_KEYWORDS or len(token) < 2:
+            continue
+        terms.update((token, singular(token)))
+        if '_' in token:
+            terms.update(part for part in token.split('_') if len(part) > 2 and part != 'db')
+    return terms
+
+
+def is_relevant(text: str, terms: Set[str]) -> bool:
+    """True if the text names one of the terms (``db_order`` also matches "order")"""
+    for token in tokenize(text):
+        if token in terms or singular(token) in terms or token.split('_', 1)[-1] in terms:
+            return True
+    return False
+
+
+def _heading(section: str):
+    """(level, heading text) of a section; level 0 for the [TABLE: ...] marker or no heading"""
+    first = section.split('\n', 1)[0]
+    match = re.match(r'(#{1,6}) (.*)', first)
+    if match:
+        return len(match.group(1)), match.group(2)
+    return 0, first
+
+
+def _cells(row: str) -> List[str]:
+    return [cell.strip() for cell in row.strip().strip('|').split('|')]
+
+
+def filter_table_rows(section: str, terms: Set[str]) -> str:
+    """Keep a section's prose, table headers, key-column rows and rows naming a term"""
+    lines = section.split('\n')
+    kept = []
+    key_columns: List[int] = []
+    for i, line in enumerate(lines):
+        if not line.startswith('|'):
+            kept.append(line)
+            continue
+        next_line = lines[i + 1] if i + 1 < len(lines) else ''
+        if TABLE_SEPARATOR_ROW.match(line.strip()) or TABLE_SEPARATOR_ROW.match(next_line.strip()):
+            # Header row or separator row
+            if not TABLE_SEPARATOR_ROW.match(line.strip()):
+                headers = [cell.lower() for cell in _cells(line)]
+                key_columns = [j for j, header in enumerate(headers) if header in KEY_COLUMN_HEADERS]
+            kept.append(line)
+            continue
+        cells = _cells(line)
+        if any(j < len(cells) and cells[j] for j in key_columns) or is_relevant(line, terms):
+            kept.append(line)
+    return '\n'.join(kept)
+
+
+def _table_rows(section: str) -> int:
+    return sum(1 for line in section.split('\n') if line.startswith('|'))
+
+
+def _data_rows(section: str) -> List[str]:
+    """Markdown table rows of a section minus header and separator rows"""
+    lines = section.split('\n')
+    return [line for line, next_line in zip(lines, lines[1:] + [''])
+            if line.startswith('|') and not TABLE_SEPARATOR_ROW.match(line.strip())
+            and not TABLE_SEPARATOR_ROW.match(next_line.strip())]
+
+
+def compress_context(text: str, terms: Set[str]) -> str:
+    """Sections and table rows of one context relevant to the question
+
+    The [TABLE: ...] marker, the title and relationship sections are always
+    kept; join examples only when their heading names a term. Column names
+    kept from the column table also make matching index rows relevant. A
+    context nothing can be judged in (no terms, nothing matching) is
+    returned unchanged.
+    """
+    if not terms:
+        return text
+
+    end_markers = TABLE_END_MARKER.findall(text)
+    body = TABLE_END_MARKER.sub('', text).rstrip()
+    terms = set(terms)
+
+    kept = []
+    matched = False
+    for section in split_sections(body):
+        level, heading = _heading(section)
+        lowered = heading.lower()
+        if level <= 1 or lowered in KEY_SECTIONS:
+            kept.append((level, section))
+            continue
+        if '[QUERY_EXAMPLE]' in section:
+            if is_relevant(heading, terms):
+                kept.append((level, section))
+                matched = True
+            continue
+        if _table_rows(section):
+            filtered = filter_table_rows(section, terms)
+            rows = _data_rows(filtered)
+            if rows or not _data_rows(section):
+                kept.append((level, filtered))
+                matched = matched or any(is_relevant(row, terms) for row in rows)
+                if lowered == 'columns':
+                    terms.update(_cells(row)[0].lower() for row in rows)
+            continue
+        if is_relevant(section, terms):
+            kept.append((level, section))
+            matched = True
+        elif '\n' not in section.strip():
+            # Bare heading; kept only if a deeper subsection survives below it
+            kept.append((level, section))
+
+    if not matched:
+        return text
+
+    # Drop bare headings with nothing kept beneath them
+    result = []
+    for i, (level, section) in enumerate(kept):
+        if level >= 2 and '\n' not in section.strip():
+            if i + 1 >= len(kept) or kept[i + 1][0] <= level:
+                continue
+        result.append(section)
+
+    compressed = ''.join(result).rstrip()
+    if end_markers:
+        compressed += '\n\n' + '\n'.join(marker.strip() for marker in end_markers)
+    return compressed
+
+
+class CompressedContexts:
+    """Compressed texts plus the estimated tokens before and after"""
+
+    __slots__ = ('texts', 'tokens_before', 'tokens_after')
+
+    def __init__(self, texts: List[str], tokens_before: int, tokens_after: int):
+        self.texts = texts
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_after
+
+    @property
+    def reduction(self) -> float:
+        if not self.tokens_before:
+            return 0.0
+        return 1 - self.tokens_after / self.tokens_before
+
+    def report(self, stage: TraceStage):
+        """Record the measured token reduction on a trace stage"""
+        stage.count('Compressed context tokens (estimated)',
+                    f"{self.tokens_before} -> {self.tokens_after} ({self.reduction:.0%} saved)")
+
+
+def compress_contexts(query_text: str, texts: Sequence[str],
+                      terms: Optional[Set[str]] = None) -> CompressedContexts:
+    """Compress every context for one question"""
+    terms = query_terms(query_text) if terms is None else terms
+    compressed = [compress_context(text, terms) for text in texts]
+    return CompressedContexts(
+        compressed,
+        sum(estimate_tokens(text) for text in texts),
+        sum(estimate_tokens(text) for text in compressed)
+    )
@@ -0,0 +1,86 @@
+"""
+Compact record for a retrieved knowledge base chunk
+"""
+
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional
+
+SAMPLE_CHARS = 500
+
+
+class RetrievedContext:
+    """One retrieval result
+
+    The content hash is computed once at construction so deduplication across
+    strategies never re-hashes the text, and ``content_sample`` is derived on
+    access instead of storing a second copy. Dict-style access (``ctx['content']``,
+    ``ctx.get('score')``) is kept for existing callers.
+    """
+
+    __slots__ = ('content', 'source', 'score', 'from_query', 'content_hash', 'signature')
+
+    def __init__(self, content: str, source: str = '', score: float = 0.0, from_query: Optional[str] = None):
+        self.content = content
+        self.source = source
+        self.score = score
+        self.from_query = from_query
+        self.content_hash = hashlib.md5(content.encode()).hexdigest()
+        # MinHash signature, filled in on first near-duplicate check
+        self.signature = None
+
+    @classmethod
+    def from_retrieval_result(cls, item: Dict[str, Any], from_query: Optional[str] = None) -> 'RetrievedContext':
+        """Build from one entry of a bedrock-agent-runtime retrieve() response"""
+        return cls(
+            content=item.get('content', {}).get('text', ''),
+            source=item.get('location', {}).get('s3Location', {}).get('uri', ''),
+            score=item.get('score', 0),
+            from_query=from_query
+        )
+
+    @property
+    def content_sample(self) -> str:
+        return self.content[:SAMPLE_CHARS] + '...' if self.content else ''
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key: str, default: Any = None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __contains__(self, key: str) -> bool:
+        return getattr(self, key, None) is not None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            'content': self.content,
+            'source': self.source,
+            'content_sample': self.content_sample,
+            'score': self.score
+        }
+        if self.from_query is not None:
+            data['from_query'] = self.from_query
+        return data
+
+    def __repr__(self) -> str:
+        return f"RetrievedContext(score={self.score}, source={self.source!r}, hash={self.content_hash[:8]})"
+
+
+def contexts_from_response(response: Dict[str, Any], from_query: Optional[str] = None) -> List[RetrievedContext]:
+    """RetrievedContexts for every result of a retrieve() response"""
+    return [RetrievedContext.from_retrieval_result(item, from_query)
+            for item in response.get('retrievalResults', [])]
+
+
+def dedupe_contexts(contexts: Iterable[RetrievedContext]) -> Dict[str, RetrievedContext]:
+    """Highest-scoring context per content hash"""
+    unique = {}
+    for context in contexts:
+        current = unique.get(context.content_hash)
+        if current is None or context.score > current.score:
+            unique[context.content_hash] = context
+    return unique
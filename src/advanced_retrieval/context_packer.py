@@ -0,0 +1,114 @@
+"""
+Token-budgeted packing of retrieved contexts into a prompt
+Contexts are added in priority order until the stage's input-token budget is
+spent; a context that does not fit whole is cut back to its leading markdown
+sections ([TABLE: ...], ## Columns, ...) instead of mid-table
+"""
+
+import math
+import re
+from typing import List, Optional, Sequence
+
+from src.advanced_retrieval.thinking_trace import TraceStage
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# Rough Claude tokenizer ratios: ~4 characters per token for prose, but every
+# punctuation mark in markdown tables and SQL tends to be a token of its own
+CHARS_PER_TOKEN = 4
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+# Lines a context may be cut before: the table marker and markdown headings
+SECTION_BOUNDARY = re.compile(r'^(?=\[TABLE:|#{1,6} )', re.MULTILINE)
+
+# Smallest leftover budget worth filling with a truncated context
+MIN_TRUNCATED_TOKENS = 64
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast local estimate of the model tokens in a text, erring on the high side"""
+    if not text:
+        return 0
+    return max(len(TOKEN_PATTERN.findall(text)), math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def split_sections(text: str) -> List[str]:
+    """Split a markdown context at its table marker and headings"""
+    return [section for section in SECTION_BOUNDARY.split(text) if section]
+
+
+def truncate_to_sections(text: str, budget_tokens: int) -> str:
+    """Leading sections of a text that fit the budget ('' if not even the first does)"""
+    kept = []
+    used = 0
+    for section in split_sections(text):
+        cost = estimate_tokens(section)
+        if used + cost > budget_tokens:
+            break
+        kept.append(section)
+        used += cost
+    # A bare table marker or heading without its body is no use to the model
+    if len(kept) == 1 and len(kept[0].strip().splitlines()) <= 1:
+        return ''
+    return ''.join(kept).rstrip()
+
+
+class PackedContexts:
+    """Result of packing: the texts that go into the prompt and what was cut"""
+
+    __slots__ = ('texts', 'tokens', 'budget', 'total', 'truncated', 'dropped')
+
+    def __init__(self, budget: Optional[int]):
+        self.texts: List[str] = []
+        self.tokens = 0
+        self.budget = budget
+        self.total = 0
+        self.truncated: List[int] = []
+        self.dropped: List[int] = []
+
+    def join(self, separator: str = CONTEXT_SEPARATOR) -> str:
+        return separator.join(self.texts)
+
+    def report(self, stage: TraceStage):
+        """Record the packing decisions on a trace stage"""
+        budget = self.budget if self.budget is not None else 'unlimited'
+        stage.count('Context tokens (estimated / budget)', f"{self.tokens} / {budget}")
+        stage.count('Contexts packed', f"{len(self.texts)} of {self.total}")
+        if self.truncated:
+            stage.note(f"Truncated at a section boundary: context {', '.join(str(i + 1) for i in self.truncated)}")
+        if self.dropped:
+            stage.note(f"Dropped for the token budget: context {', '.join(str(i + 1) for i in self.dropped)}")
+
+
+def pack_contexts(texts: Sequence[str], budget_tokens: Optional[int],
+                  separator: str = CONTEXT_SEPARATOR) -> PackedContexts:
+    """Fill a token budget with texts in priority order
+
+    Each text that fits is kept whole; the first that does not is cut back to
+    the sections that fit, and lower-priority texts still fill what is left.
+    ``budget_tokens`` None or <= 0 keeps everything.
+    """
+    if budget_tokens is not None and budget_tokens <= 0:
+        budget_tokens = None
+
+    packed = PackedContexts(budget_tokens)
+    packed.total = len(texts)
+    separator_tokens = estimate_tokens(separator)
+
+    for i, text in enumerate(texts):
+        overhead = separator_tokens if packed.texts else 0
+        cost = estimate_tokens(text)
+        if budget_tokens is None or packed.tokens + overhead + cost <= budget_tokens:
+            packed.texts.append(text)
+            packed.tokens += overhead + cost
+            continue
+
+        remaining = budget_tokens - packed.tokens - overhead
+        truncated = truncate_to_sections(text, remaining) if remaining >= MIN_TRUNCATED_TOKENS else ''
+        if truncated:
+            packed.texts.append(truncated)
+            packed.tokens += overhead + estimate_tokens(truncated)
+            packed.truncated.append(i)
+        else:
+            packed.dropped.append(i)
+    return packed
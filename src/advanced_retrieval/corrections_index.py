@@ -0,0 +1,203 @@
+"""
+In-memory index of validated user corrections
+Keeps the validated training_data rows for each knowledge base in memory and
+matches incoming questions against their query patterns lexically, so
+corrections can be added to the answer prompt without a database query
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from src.advanced_retrieval.text_utils import tokenize
+from src.training.feedback_processor import generalize_query_pattern
+
+logger = logging.getLogger('corrections_index')
+
+
+class CorrectionsIndex:
+    """Validated corrections for one knowledge base with a TF-IDF inverted index
+
+    ``refresh()`` loads rows changed since the last ``UpdatedAt`` watermark, so
+    after the first load only new or re-validated corrections are read.
+    ``search()`` only touches in-memory structures and triggers a background
+    refresh when the data is older than ``refresh_interval``.
+    """
+
+    def __init__(self, kb_id: str, connection_factory: Optional[Callable[[], Any]] = None,
+                 refresh_interval: Optional[float] = None):
+        self.kb_id = kb_id
+        self.connection_factory = connection_factory
+        self.refresh_interval = refresh_interval or float(os.getenv('CORRECTIONS_REFRESH_INTERVAL', 300))
+
+        self.corrections: Dict[int, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_norms: Dict[int, float] = {}
+        self.watermark = None
+        self.last_refresh = 0.0
+
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def __len__(self):
+        return len(self.corrections)
+
+    def _idf(self, token: str) -> float:
+        return math.log(1 + len(self.corrections) / (1 + len(self.postings.get(token, ()))))
+
+    def _remove(self, correction_id: int):
+        correction = self.corrections.pop(correction_id, None)
+        if not correction:
+            return
+        for token in set(correction['tokens']):
+            docs = self.postings.get(token)
+            if docs:
+                docs.pop(correction_id, None)
+                if not docs:
+                    del self.postings[token]
+
+    def _add(self, correction_id: int, pattern: str, correct_response: str):
+        tokens = tokenize(pattern)
+        self.corrections[correction_id] = {
+            'pattern': pattern,
+            'correct_response': correct_response,
+            'tokens': tokens
+        }
+        counts = defaultdict(int)
+        for token in tokens:
+            counts[token] += 1
+        for token, count in counts.items():
+            self.postings[token][correction_id] = count
+
+    def _recompute_norms(self):
+        norms = {}
+        for correction_id, correction in self.corrections.items():
+            counts = defaultdict(int)
+            for token in correction['tokens']:
+                counts[token] += 1
+            norms[correction_id] = math.sqrt(sum((c * self._idf(t)) ** 2 for t, c in counts.items())) or 1.0
+        self.doc_norms = norms
+
+    def apply_rows(self, rows: List[Dict[str, Any]]):
+        """Merge changed training_data rows into the index"""
+        with self._lock:
+            for row in rows:
+                self._remove(row['Id'])
+                if row['ValidationStatus'] == 'validated' and row['QueryPattern'] and row['CorrectResponse']:
+                    self._add(row['Id'], row['QueryPattern'], row['CorrectResponse'])
+                updated_at = row.get('UpdatedAt')
+                if updated_at and (self.watermark is None or updated_at > self.watermark):
+                    self.watermark = updated_at
+            if rows:
+                self._recompute_norms()
+
+    def refresh(self) -> int:
+        """Load training_data rows changed since the watermark; returns rows read"""
+        if not self.connection_factory or not self._refreshing.acquire(blocking=False):
+            return 0
+        try:
+            connection = self.connection_factory()
+            if not connection:
+                return 0
+            try:
+                cursor = connection.cursor(dictionary=True)
+                sql = """SELECT Id, QueryPattern, CorrectResponse, ValidationStatus, UpdatedAt
+                         FROM training_data WHERE KnowledgeBaseId = %s"""
+                params = [self.kb_id]
+                if self.watermark is not None:
+                    # >= so rows sharing the watermark second are not missed; re-applying is idempotent
+                    sql += " AND UpdatedAt >= %s"
+                    params.append(self.watermark)
+                else:
+                    sql += " AND ValidationStatus = 'validated'"
+                sql += " ORDER BY UpdatedAt ASC"
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                connection.close()
+
+            self.apply_rows(rows)
+            self.last_refresh = time.time()
+            if rows:
+                logger.info(f"Corrections index for KB {self.kb_id}: {len(rows)} rows applied, "
+                            f"{len(self.corrections)} validated corrections")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error refreshing corrections index for KB {self.kb_id}: {e}")
+            return 0
+        finally:
+            self._refreshing.release()
+
+    def refresh_if_stale(self):
+        """Start a background refresh when the index is older than refresh_interval"""
+        if self.connection_factory and time.time() - self.last_refresh >= self.refresh_interval:
+            self.last_refresh = time.time()
+            threading.Thread(target=self.refresh, daemon=True).start()
+
+    def search(self, query_text: str, top_k: int = 3, min_score: float = 0.35) -> List[Dict[str, Any]]:
+        """Corrections whose pattern is most similar to the query (cosine over TF-IDF)"""
+        self.refresh_if_stale()
+
+        query_tokens = tokenize(generalize_query_pattern(query_text))
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            if not self.corrections:
+                return []
+
+            query_counts = defaultdict(int)
+            for token in query_tokens:
+                query_counts[token] += 1
+
+            scores = defaultdict(float)
+            query_norm = 0.0
+            for token, count in query_counts.items():
+                idf = self._idf(token)
+                weight = count * idf
+                query_norm += weight ** 2
+                for correction_id, doc_count in self.postings.get(token, {}).items():
+                    scores[correction_id] += weight * doc_count * idf
+            query_norm = math.sqrt(query_norm) or 1.0
+
+            ranked = sorted(
+                ((score / (query_norm * self.doc_norms[cid]), cid) for cid, score in scores.items()),
+                reverse=True
+            )
+            return [
+                {
+                    'id': cid,
+                    'score': round(score, 4),
+                    'pattern': self.corrections[cid]['pattern'],
+                    'correct_response': self.corrections[cid]['correct_response']
+                }
+                for score, cid in ranked[:top_k] if score >= min_score
+            ]
+
+
+_connection_factory = None
+_indexes: Dict[str, CorrectionsIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def configure(connection_factory: Callable[[], Any]):
+    """Set how corrections indexes reach the chat database"""
+    global _connection_factory
+    _connection_factory = connection_factory
+    with _indexes_lock:
+        for index in _indexes.values():
+            index.connection_factory = connection_factory
+
+
+def get_corrections_index(kb_id: str) -> CorrectionsIndex:
+    """Shared corrections index for a knowledge base"""
+    with _indexes_lock:
+        index = _indexes.get(kb_id)
+        if index is None:
+            index = _indexes[kb_id] = CorrectionsIndex(kb_id, _connection_factory)
+        return index
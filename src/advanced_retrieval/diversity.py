@@ -0,0 +1,64 @@
+"""
+Maximal marginal relevance (MMR) selection of retrieved contexts
+Picks the final contexts one at a time, trading relevance against similarity
+to what is already selected, so one table's doc cannot fill every slot
+"""
+
+from collections import Counter
+from typing import List, Sequence
+
+import numpy as np
+
+from src.advanced_retrieval.context import RetrievedContext
+from src.advanced_retrieval.text_utils import tokenize
+
+
+def term_vectors(contexts: Sequence[RetrievedContext]) -> np.ndarray:
+    """L2-normalized TF-IDF rows over the candidate pool's vocabulary"""
+    documents = [Counter(tokenize(context.content)) for context in contexts]
+    vocabulary = {}
+    for counts in documents:
+        for term in counts:
+            vocabulary.setdefault(term, len(vocabulary))
+
+    matrix = np.zeros((len(contexts), max(len(vocabulary), 1)))
+    for row, counts in enumerate(documents):
+        for term, count in counts.items():
+            matrix[row, vocabulary[term]] = count
+
+    df = np.count_nonzero(matrix, axis=0)
+    matrix *= np.log((1 + len(contexts)) / (1 + df)) + 1
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_select(contexts: Sequence[RetrievedContext], k: int, mmr_lambda: float = 0.7) -> List[RetrievedContext]:
+    """Select k contexts from a ranked pool with maximal marginal relevance
+
+    Relevance is taken from the pool order (it is already fused and ranked),
+    decaying linearly from 1 for the first candidate. ``mmr_lambda`` = 1 keeps
+    the ranking as-is; lower values favour contexts unlike those already chosen.
+    """
+    if k <= 0:
+        return []
+    if mmr_lambda >= 1 or len(contexts) <= k:
+        return list(contexts)[:k]
+
+    n = len(contexts)
+    relevance = 1.0 - np.arange(n) / n
+    vectors = term_vectors(contexts)
+    similarity = vectors @ vectors.T
+
+    selected = [0]
+    max_similarity = similarity[0].copy()
+    available = np.ones(n, dtype=bool)
+    available[0] = False
+    while len(selected) < k:
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        scores[~available] = -np.inf
+        choice = int(np.argmax(scores))
+        selected.append(choice)
+        available[choice] = False
+        np.maximum(max_similarity, similarity[choice], out=max_similarity)
+    return [contexts[i] for i in selected]
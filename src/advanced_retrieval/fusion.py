@@ -0,0 +1,104 @@
+"""
+Rank fusion for merging retrieval results
+Combines ranked context lists from several strategies, expanded queries or
+knowledge bases whose raw scores are not comparable with each other
+"""
+
+import math
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.advanced_retrieval.context import RetrievedContext
+
+# Standard RRF damping constant (Cormack et al.); larger values flatten rank differences
+RRF_K = 60
+
+FUSION_METHODS = ('rrf', 'weighted')
+
+
+def results_per_list(num_results: int, num_lists: int, minimum: int = 2) -> int:
+    """numberOfResults per retrieve call so the fused pool is about twice the final top-k"""
+    if num_lists <= 0:
+        return num_results
+    return min(num_results, max(minimum, math.ceil(2 * num_results / num_lists)))
+
+
+def _index_lists(ranked_lists: Sequence[Sequence[RetrievedContext]]):
+    """Map every context to a slot in the union of all lists
+
+    Returns the union (best-scoring instance per content hash), plus one
+    array of union indices per input list.
+    """
+    slots = {}
+    union: List[RetrievedContext] = []
+    indices = []
+    for contexts in ranked_lists:
+        list_indices = np.empty(len(contexts), dtype=np.int64)
+        for position, context in enumerate(contexts):
+            slot = slots.get(context.content_hash)
+            if slot is None:
+                slot = slots[context.content_hash] = len(union)
+                union.append(context)
+            elif context.score > union[slot].score:
+                union[slot] = context
+            list_indices[position] = slot
+        indices.append(list_indices)
+    return union, indices
+
+
+def _weights(weights: Optional[Sequence[float]], count: int) -> np.ndarray:
+    if weights is None:
+        return np.ones(count)
+    if len(weights) != count:
+        raise ValueError(f"Expected {count} weights, got {len(weights)}")
+    return np.asarray(weights, dtype=np.float64)
+
+
+def _top(union: List[RetrievedContext], fused: np.ndarray, top_k: Optional[int]):
+    # Stable sort on the negated score keeps earlier-seen contexts first on ties
+    order = np.argsort(-fused, kind='stable')
+    if top_k is not None:
+        order = order[:top_k]
+    return [union[i] for i in order], fused[order]
+
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[Sequence[RetrievedContext]],
+                           top_k: Optional[int] = None,
+                           weights: Optional[Sequence[float]] = None,
+                           k: int = RRF_K) -> Tuple[List[RetrievedContext], np.ndarray]:
+    """Fuse ranked lists by sum of weight / (k + rank); each list must be ordered best first"""
+    union, indices = _index_lists(ranked_lists)
+    fused = np.zeros(len(union))
+    for weight, list_indices in zip(_weights(weights, len(ranked_lists)), indices):
+        ranks = np.arange(1, len(list_indices) + 1, dtype=np.float64)
+        np.add.at(fused, list_indices, weight / (k + ranks))
+    return _top(union, fused, top_k)
+
+
+def weighted_score_fusion(ranked_lists: Sequence[Sequence[RetrievedContext]],
+                          top_k: Optional[int] = None,
+                          weights: Optional[Sequence[float]] = None) -> Tuple[List[RetrievedContext], np.ndarray]:
+    """Fuse by summing min-max normalized scores per list (CombSUM)"""
+    union, indices = _index_lists(ranked_lists)
+    fused = np.zeros(len(union))
+    for weight, contexts, list_indices in zip(_weights(weights, len(ranked_lists)), ranked_lists, indices):
+        if not len(contexts):
+            continue
+        scores = np.fromiter((context.score for context in contexts), dtype=np.float64, count=len(contexts))
+        spread = scores.max() - scores.min()
+        normalized = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        np.add.at(fused, list_indices, weight * normalized)
+    return _top(union, fused, top_k)
+
+
+def fuse(ranked_lists: Sequence[Sequence[RetrievedContext]], top_k: Optional[int] = None,
+         method: str = 'rrf', weights: Optional[Sequence[float]] = None) -> List[RetrievedContext]:
+    """Top-k contexts across ranked lists using the given fusion method"""
+    if method == 'weighted':
+        contexts, _ = weighted_score_fusion(ranked_lists, top_k, weights)
+    elif method == 'rrf':
+        contexts, _ = reciprocal_rank_fusion(ranked_lists, top_k, weights)
+    else:
+        raise ValueError(f"Unknown fusion method '{method}', expected one of {FUSION_METHODS}")
+    return contexts
@@ -0,0 +1,43 @@
+"""
+JSON encoding for API responses and Bedrock request/response bodies
+Uses orjson when it is installed and falls back to the standard library
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(value: Any):
+    """Serialize records with ``to_dict()``; other unsupported values (Decimal, bytes, ...) as strings"""
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    return str(value)
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON bytes"""
+    if orjson:
+        return orjson.dumps(obj, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from bytes or str"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_bedrock_body(body: dict) -> bytes:
+    """Request body for bedrock-runtime invoke_model"""
+    return dumps(body)
+
+
+def decode_bedrock_body(response: dict) -> dict:
+    """Parsed body of an invoke_model response"""
+    return loads(response.get('body').read())
@@ -0,0 +1,87 @@
+"""
+Metadata filters for knowledge base retrieval
+The doc generators tag every document with doc_type / category / table_name
+sidecar metadata; when a question names known tables, retrieval is limited
+to those tables' docs plus the non-table docs (query patterns, summaries)
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from src.advanced_retrieval.reranker import question_identifiers
+from src.advanced_retrieval.text_utils import tokenize
+from src.documentation.metadata import DOC_TYPE_TABLE, DOC_TYPE_TABLE_USAGE
+
+logger = logging.getLogger('metadata_filter')
+
+SELECTED_QUERIES_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'query_analysis_selected_queries.json'
+)
+
+# Per-table doc types the table_name filter applies to
+TABLE_DOC_TYPES = [DOC_TYPE_TABLE, DOC_TYPE_TABLE_USAGE]
+
+# More tables than this and the question is too broad for a filter to help
+MAX_FILTER_TABLES = 10
+
+TABLE_NAME_PATTERN = re.compile(r"'([A-Za-z0-9_]+)'")
+
+
+def load_known_tables(path: str = SELECTED_QUERIES_FILE) -> Set[str]:
+    """Table names referenced by the representative queries"""
+    try:
+        with open(path) as f:
+            selected = json.load(f).get('selected_queries', [])
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read known tables from {path}: {e}")
+        return set()
+
+    tables = set()
+    for query in selected:
+        if query.get('main_table'):
+            tables.add(query['main_table'])
+        all_tables = query.get('all_tables', [])
+        if isinstance(all_tables, str):
+            # Stored as the repr of a list, sometimes cut short
+            all_tables = TABLE_NAME_PATTERN.findall(all_tables)
+        tables.update(all_tables)
+    return tables
+
+
+def detect_tables(text: str, known_tables: Iterable[str]) -> List[str]:
+    """Known tables a question or SQL statement refers to, in sorted order"""
+    by_lower = {table.lower(): table for table in known_tables}
+    identifiers = question_identifiers(tokenize(text), set(by_lower))
+    return sorted(by_lower[name] for name in identifiers if name in by_lower)
+
+
+def unqualified_name(name: str) -> str:
+    """Table part of a possibly schema-qualified, quoted name (``[dbo].[db_order]`` -> ``db_order``)"""
+    return name.split('.')[-1].strip('[]`"\' ')
+
+
+def resolve_tables(names: Iterable[str], known_tables: Iterable[str]) -> List[str]:
+    """Known tables for user- or SQL-supplied names, matched case-insensitively, in sorted order
+
+    Names that resolve to no known table are dropped, so an unrecognised name
+    yields no filter rather than one that matches none of its docs.
+    """
+    by_lower = {table.lower(): table for table in known_tables}
+    resolved = {by_lower.get(unqualified_name(name).lower()) for name in names}
+    return sorted(table for table in resolved if table)
+
+
+def table_filter(tables: List[str]) -> Optional[Dict[str, Any]]:
+    """Retrieval filter for the docs of the given tables plus every non-table doc"""
+    if not tables or len(tables) > MAX_FILTER_TABLES:
+        return None
+    return {
+        'orAll': [
+            {'in': {'key': 'table_name', 'value': tables}},
+            {'notIn': {'key': 'doc_type', 'value': TABLE_DOC_TYPES}}
+        ]
+    }
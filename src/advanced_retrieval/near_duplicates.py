@@ -0,0 +1,98 @@
+"""
+Near-duplicate suppression for retrieved contexts
+MinHash signatures over word shingles estimate how much of one context is
+contained in another, so overlapping chunks and the same table doc reached
+through different queries take only one slot in the prompt
+"""
+
+import re
+import zlib
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from src.advanced_retrieval.context import RetrievedContext
+
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 3
+
+# Mersenne prime 2^61 - 1; with 32-bit shingle hashes and 31-bit coefficients a * x + b fits in uint64
+_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(1337)
+_A = _rng.randint(1, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+_B = _rng.randint(0, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class MinHashSignature:
+    """MinHash values plus the shingle count needed to estimate containment"""
+
+    __slots__ = ('values', 'size')
+
+    def __init__(self, values: np.ndarray, size: int):
+        self.values = values
+        self.size = size
+
+
+def minhash(text: str) -> MinHashSignature:
+    """Signature of a text's word shingles"""
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        shingles = {' '.join(words)} if words else set()
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    if not shingles:
+        return MinHashSignature(np.full(NUM_PERMUTATIONS, _PRIME, dtype=np.uint64), 0)
+
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    values = ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0)
+    return MinHashSignature(values, len(shingles))
+
+
+def signature(context: RetrievedContext) -> MinHashSignature:
+    """Signature of a context, computed once and kept on the record"""
+    if context.signature is None:
+        context.signature = minhash(context.content)
+    return context.signature
+
+
+def containment(a: MinHashSignature, b: MinHashSignature) -> float:
+    """Estimated share of the smaller shingle set that also appears in the larger"""
+    if not a.size or not b.size:
+        return 0.0
+    jaccard = float(np.mean(a.values == b.values))
+    intersection = jaccard / (1 + jaccard) * (a.size + b.size)
+    return min(1.0, intersection / min(a.size, b.size))
+
+
+def filter_near_duplicates(contexts: Sequence[RetrievedContext], threshold: float = 0.8,
+                           limit: Optional[int] = None) -> List[RetrievedContext]:
+    """Drop contexts mostly contained in a higher-ranked one; input order is the ranking
+
+    ``threshold`` <= 0 or >= 1 disables near-duplicate detection (exact
+    duplicates are already merged by content hash). Stops once ``limit``
+    contexts are kept.
+    """
+    if not 0 < threshold < 1:
+        return list(contexts)[:limit]
+
+    kept: List[RetrievedContext] = []
+    kept_values = np.empty((0, NUM_PERMUTATIONS), dtype=np.uint64)
+    kept_sizes = np.empty(0)
+    for context in contexts:
+        if limit is not None and len(kept) >= limit:
+            break
+        sig = signature(context)
+        if kept and sig.size:
+            jaccard = (kept_values == sig.values).mean(axis=1)
+            intersection = jaccard / (1 + jaccard) * (kept_sizes + sig.size)
+            smaller = np.minimum(kept_sizes, sig.size)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                contained = np.where(smaller > 0, intersection / smaller, 0.0)
+            if contained.max() >= threshold:
+                continue
+        kept.append(context)
+        kept_values = np.vstack([kept_values, sig.values])
+        kept_sizes = np.append(kept_sizes, sig.size)
+    return kept
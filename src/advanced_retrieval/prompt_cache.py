@@ -0,0 +1,128 @@
+"""
+Bedrock prompt caching for generation requests
+Prompts are laid out as the static instructions and the whole docs of the
+tables involved (system), then the per-request documentation excerpts and
+question. Cache checkpoints only go on the stable system blocks, and only
+when the prefix is long enough to be cached on models that support prompt
+caching
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.advanced_retrieval.context_packer import CONTEXT_SEPARATOR, estimate_tokens
+from src.advanced_retrieval.reranker import TABLE_MARKER
+from src.advanced_retrieval.thinking_trace import TraceStage
+
+logger = logging.getLogger('prompt_cache')
+
+CACHE_CONTROL = {'type': 'ephemeral'}
+
+# Claude models on Bedrock that accept cache_control checkpoints
+PROMPT_CACHING_MODELS = (
+    'claude-3-5-haiku',
+    'claude-3-7-sonnet',
+    'claude-sonnet-4',
+    'claude-opus-4',
+)
+
+# Bedrock ignores checkpoints on prefixes shorter than this, so a block is
+# only marked when the prefix ending at it can actually be cached
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv('PROMPT_CACHE_MIN_TOKENS', 1024))
+
+PROMPT_CACHING_ENABLED = os.getenv('PROMPT_CACHING', 'true').lower() in ('1', 'true', 'yes')
+
+
+def supports_prompt_caching(model_id: str) -> bool:
+    return PROMPT_CACHING_ENABLED and any(name in model_id for name in PROMPT_CACHING_MODELS)
+
+
+def text_block(text: str, cache: bool = False) -> Dict[str, Any]:
+    block = {'type': 'text', 'text': text}
+    if cache:
+        block['cache_control'] = CACHE_CONTROL
+    return block
+
+
+def split_table_docs(texts: Sequence[str], budget_tokens: Optional[int]) -> Tuple[List[str], List[str]]:
+    """Whole table docs that fit the budget, sorted by table, and the other texts in priority order
+
+    Table docs are chosen in priority order but laid out by table name, so
+    questions over the same tables share the same prefix whatever the
+    retrieval scores were. ``budget_tokens`` None or <= 0 keeps everything.
+    """
+    if budget_tokens is not None and budget_tokens <= 0:
+        budget_tokens = None
+
+    table_docs, rest = [], []
+    seen = set()
+    used = 0
+    separator_tokens = estimate_tokens(CONTEXT_SEPARATOR)
+    for text in texts:
+        if text in seen:
+            continue
+        match = TABLE_MARKER.search(text)
+        cost = estimate_tokens(text) + (separator_tokens if table_docs else 0)
+        if match and (budget_tokens is None or used + cost <= budget_tokens):
+            table_docs.append((match.group(1).lower(), text))
+            seen.add(text)
+            used += cost
+        else:
+            rest.append(text)
+    return [text for _, text in sorted(table_docs)], rest
+
+
+def build_request(instructions: str, documentation: str, prompt: str, max_tokens: int,
+                  temperature: float = 0.2, caching: bool = False, table_docs: str = '') -> Dict[str, Any]:
+    """Anthropic messages body with the cacheable prefix first
+
+    The instructions are identical on every call and ``table_docs`` repeats
+    whenever a question touches the same tables, so both go in the system
+    prompt. A checkpoint caches the whole prompt up to it, so each system
+    block is marked only when the prefix ending there reaches
+    PROMPT_CACHE_MIN_TOKENS. ``documentation`` (compressed and packed for the
+    question) and ``prompt`` change on each request, so they go after the last
+    checkpoint and are never marked.
+    """
+    prefix_tokens = estimate_tokens(instructions)
+    system = [text_block(instructions, caching and prefix_tokens >= PROMPT_CACHE_MIN_TOKENS)]
+    if table_docs:
+        prefix_tokens += estimate_tokens(table_docs)
+        system.append(text_block(table_docs, caching and prefix_tokens >= PROMPT_CACHE_MIN_TOKENS))
+
+    content: List[Dict[str, Any]] = []
+    if documentation:
+        content.append(text_block(documentation))
+    content.append(text_block(prompt))
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "system": system,
+        "messages": [
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+    }
+
+
+def record_usage(response_body: Dict[str, Any], stage: Optional[TraceStage] = None) -> Dict[str, int]:
+    """Input, cache read/write and output token counts from an invoke_model response"""
+    usage = response_body.get('usage') or {}
+    counts = {
+        'input_tokens': usage.get('input_tokens', 0),
+        'cache_read_input_tokens': usage.get('cache_read_input_tokens', 0),
+        'cache_creation_input_tokens': usage.get('cache_creation_input_tokens', 0),
+        'output_tokens': usage.get('output_tokens', 0),
+    }
+    logger.info("Prompt tokens: %(input_tokens)s input, %(cache_read_input_tokens)s cache read, "
+                "%(cache_creation_input_tokens)s cache write, %(output_tokens)s output", counts)
+    if stage is not None:
+        stage.count('Prompt tokens (input / cache read / cache write)',
+                    f"{counts['input_tokens']} / {counts['cache_read_input_tokens']} / "
+                    f"{counts['cache_creation_input_tokens']}")
+        stage.count('Output tokens', counts['output_tokens'])
+    return counts
@@ -0,0 +1,92 @@
+"""
+Local lexical reranker for retrieved contexts
+Scores the candidate pool with BM25 over the context text plus boosts for
+schema identifiers named in the question, so the answer prompt gets fewer,
+more relevant contexts
+"""
+
+import re
+from collections import Counter
+from typing import List, Optional, Sequence, Set
+
+import numpy as np
+
+from src.advanced_retrieval.context import RetrievedContext
+from src.advanced_retrieval.text_utils import singular, tokenize
+
+TABLE_MARKER = re.compile(r'\[TABLE:\s*([A-Za-z0-9_]+)\]')
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Added to the [0, 1] normalized BM25 score
+TABLE_CHUNK_BOOST = 1.0      # the chunk documents a table named in the question
+IDENTIFIER_MATCH_BOOST = 0.3  # per identifier from the question found in the chunk
+RANK_PRIOR_WEIGHT = 0.3       # keeps the retrieval order as a tie-breaker
+
+
+def question_identifiers(query_tokens: Sequence[str], table_names: Set[str]) -> Set[str]:
+    """Schema identifiers the question refers to
+
+    Explicit identifiers (``db_order``, ``ship_date``) count as-is; plain words
+    count when they name a known table with its ``db_`` prefix dropped, so
+    "orders" matches ``db_order``.
+    """
+    identifiers = {token for token in query_tokens if '_' in token}
+    words = {singular(token) for token in query_tokens}
+    for table in table_names:
+        lowered = table.lower()
+        if lowered in identifiers or lowered.split('_', 1)[-1] in words:
+            identifiers.add(lowered)
+    return identifiers
+
+
+def bm25_scores(query_tokens: Sequence[str], documents: Sequence[Sequence[str]],
+                k1: float = BM25_K1, b: float = BM25_B) -> np.ndarray:
+    """BM25 score of every tokenized document for the query, using the pool for IDF"""
+    terms = list(dict.fromkeys(query_tokens))
+    if not terms or not documents:
+        return np.zeros(len(documents))
+
+    term_index = {term: i for i, term in enumerate(terms)}
+    tf = np.zeros((len(documents), len(terms)))
+    lengths = np.empty(len(documents))
+    for row, tokens in enumerate(documents):
+        lengths[row] = len(tokens)
+        for term, count in Counter(t for t in tokens if t in term_index).items():
+            tf[row, term_index[term]] = count
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+    avg_length = lengths.mean() or 1.0
+    norm = k1 * (1 - b + b * lengths / avg_length)
+    return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def rerank(query_text: str, contexts: Sequence[RetrievedContext],
+           top_k: Optional[int] = None) -> List[RetrievedContext]:
+    """Reorder contexts by lexical relevance to the question; input order is the prior"""
+    if len(contexts) < 2:
+        return list(contexts)[:top_k]
+
+    query_tokens = tokenize(query_text)
+    documents = [tokenize(context.content) for context in contexts]
+
+    bm25 = bm25_scores(query_tokens, documents)
+    if bm25.max() > 0:
+        bm25 = bm25 / bm25.max()
+
+    tables = [{name.lower() for name in TABLE_MARKER.findall(context.content)} for context in contexts]
+    identifiers = question_identifiers(query_tokens, set().union(*tables))
+    boosts = np.zeros(len(contexts))
+    if identifiers:
+        for row, tokens in enumerate(documents):
+            if identifiers & tables[row]:
+                boosts[row] += TABLE_CHUNK_BOOST
+            boosts[row] += IDENTIFIER_MATCH_BOOST * len(identifiers.intersection(tokens))
+
+    prior = RANK_PRIOR_WEIGHT / np.arange(1, len(contexts) + 1)
+    order = np.argsort(-(bm25 + boosts + prior), kind='stable')
+    if top_k is not None:
+        order = order[:top_k]
+    return [contexts[i] for i in order]
@@ -0,0 +1,120 @@
+"""
+In-process cache for retrieval results
+Failures and empty results are cached briefly (negative entries) so a failing
+knowledge base is not retried on every request, and expired results are
+served stale while a single background refresh recomputes them
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger('retrieval_cache')
+
+
+# Source of the placeholder context standard retrieval returns when the knowledge base fails
+MOCK_SOURCE = 'mock-source'
+
+
+def is_negative_result(result: Dict[str, Any]) -> bool:
+    """Errors, results without contexts and results carrying the mock fallback context"""
+    contexts = result.get('contexts')
+    if result.get('error') or not contexts:
+        return True
+    return any(getattr(c, 'source', None) == MOCK_SOURCE for c in contexts)
+
+
+class CacheEntry:
+    __slots__ = ('result', 'expires_at', 'stale_until', 'negative', 'refresh_after')
+
+    def __init__(self, result: Any, expires_at: float, stale_until: float, negative: bool):
+        self.result = result
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.negative = negative
+        # Earliest time a background refresh may start (pushed back after a failed refresh)
+        self.refresh_after = 0.0
+
+
+class RetrievalCache:
+    """Results by cache key with a TTL, short-lived negative entries and stale-while-revalidate
+
+    A positive entry is fresh for ``ttl`` seconds and may then be served for
+    another ``stale_ttl`` seconds while one background refresh per key
+    recomputes it; a failed refresh keeps the stale result and is not retried
+    for ``negative_ttl`` seconds. Negative entries are fresh for
+    ``negative_ttl`` seconds and never served stale.
+    """
+
+    def __init__(self, ttl: float = 3600, negative_ttl: Optional[float] = None, stale_ttl: Optional[float] = None,
+                 is_negative: Callable[[Any], bool] = is_negative_result):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else float(os.getenv('RETRIEVAL_NEGATIVE_TTL', 30))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(os.getenv('RETRIEVAL_STALE_TTL', 3600))
+        self.is_negative = is_negative
+
+        self._entries: Dict[str, CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._refreshing: Set[str] = set()
+        # Set on refresh threads so nested lookups recompute instead of returning stale results
+        self._revalidating = threading.local()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def put(self, key: str, result: Any) -> CacheEntry:
+        now = time.time()
+        negative = self.is_negative(result)
+        ttl = self.negative_ttl if negative else self.ttl
+        entry = CacheEntry(result, now + ttl, now + ttl + (0 if negative else self.stale_ttl), negative)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Cached result for the key, computing it on a miss"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now < entry.expires_at:
+                logger.debug(f"Cache hit ({'negative' if entry.negative else 'fresh'}): {key}")
+                return entry.result
+            if not entry.negative and now < entry.stale_until and not getattr(self._revalidating, 'active', False):
+                self._revalidate(key, entry, compute)
+                return entry.result
+
+        result = compute()
+        self.put(key, result)
+        return result
+
+    def _revalidate(self, key: str, entry: CacheEntry, compute: Callable[[], Any]):
+        """Start a background refresh for a stale entry unless one is running or backing off"""
+        with self._lock:
+            if key in self._refreshing or time.time() < entry.refresh_after:
+                return
+            self._refreshing.add(key)
+        logger.debug(f"Serving stale result, refreshing in background: {key}")
+        threading.Thread(target=self._refresh, args=(key, entry, compute), daemon=True).start()
+
+    def _refresh(self, key: str, entry: CacheEntry, compute: Callable[[], Any]):
+        self._revalidating.active = True
+        try:
+            result = compute()
+            if self.is_negative(result):
+                # Keep serving the stale result; back off before trying again
+                entry.refresh_after = time.time() + self.negative_ttl
+                logger.warning(f"Background refresh failed, keeping stale result: {key}")
+            else:
+                self.put(key, result)
+        except Exception as e:
+            entry.refresh_after = time.time() + self.negative_ttl
+            logger.error(f"Background refresh error for {key}: {e}")
+        finally:
+            self._revalidating.active = False
+            with self._lock:
+                self._refreshing.discard(key)
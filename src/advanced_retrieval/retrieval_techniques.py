@@ -3,11 +3,27 @@ import sys
 import json
 import logging
 import boto3
-import time
 import hashlib
 import re
 from typing import List, Dict, Any, Optional, Union, Tuple
 
+from src.advanced_retrieval.corrections_index import get_corrections_index
+from src.advanced_retrieval.json_codec import encode_bedrock_body, decode_bedrock_body, json_default
+from src.advanced_retrieval.thinking_trace import ThinkingTrace, TraceStage
+from src.advanced_retrieval.context import RetrievedContext, contexts_from_response, dedupe_contexts
+from src.advanced_retrieval.fusion import fuse, results_per_list
+from src.advanced_retrieval.reranker import rerank, TABLE_MARKER
+from src.advanced_retrieval.near_duplicates import filter_near_duplicates
+from src.advanced_retrieval.diversity import mmr_select
+from src.advanced_retrieval.context_packer import CONTEXT_SEPARATOR, pack_contexts, estimate_tokens
+from src.advanced_retrieval.compression import compress_contexts
+from src.advanced_retrieval.prompt_cache import build_request, record_usage, split_table_docs, supports_prompt_caching
+from src.advanced_retrieval.metadata_filter import (
+    load_known_tables, detect_tables, resolve_tables, table_filter, unqualified_name
+)
+from src.advanced_retrieval.adaptive_retrieval import RetrievalPolicy, adaptive_retrieve, load_policies
+from src.advanced_retrieval.retrieval_cache import MOCK_SOURCE, RetrievalCache
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -15,6 +31,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger('advanced_retrieval')
 
+# Static instruction blocks, sent as the (cacheable) system prompt of each generation request
+ANSWER_INSTRUCTIONS = """You are a SQL query assistant. Based on the retrieved database documentation, provide ONLY SQL statements that answer the user's query.
+
+IMPORTANT INSTRUCTIONS:
+1. Respond ONLY with SQL statements - no explanatory text
+2. Use proper SQL syntax for the database system
+3. Include table aliases for readability
+4. Add appropriate WHERE clauses for filtering
+5. Use meaningful column names in SELECT statements
+6. If multiple queries are needed, separate them with semicolons
+7. If user corrections are provided, prioritize those over general documentation
+8. If the query cannot be answered with available schema information, respond with: "-- Insufficient schema information to generate SQL\""""
+
+RELATIONSHIP_INSTRUCTIONS = """Based on the provided database documentation excerpts, provide a comprehensive analysis of all relationships for the requested table.
+
+Please provide a detailed explanation of:
+1. Primary key(s) of the table
+2. Foreign keys in the table that reference other tables
+3. Tables that have foreign keys referencing the table
+4. The complete relationship graph of the table
+5. Important notes about these relationships (e.g., cascade delete rules, indexing considerations)
+
+Format your response as a technical but readable analysis with markdown formatting. Use bullet points and tables where appropriate.
+If the information is not available in the provided documentation, clearly indicate what's missing."""
+
+OPTIMIZATION_INSTRUCTIONS = """Analyze and optimize the given SQL query using the provided schema information. Respond with ONLY the optimized SQL and brief performance comments.
+
+Provide:
+1. Optimized SQL query with performance improvements
+2. Brief comments (-- format) explaining key optimizations
+3. Index recommendations as SQL comments"""
+
 class AdvancedRetrieval:
     """Advanced retrieval techniques for the Database Knowledge Base"""
 
@@ -44,9 +92,100 @@ class AdvancedRetrieval:
             self.bedrock_client = session.client('bedrock-runtime')
             self.kb_client = session.client('bedrock-agent-runtime')
 
-        # Cache for queries to avoid redundant retrievals
-        self.cache = {}
-        self.cache_ttl = 3600  # 1 hour
+        # Cache for queries to avoid redundant retrievals; failures are cached briefly
+        # and expired results are served while a background refresh recomputes them
+        self.cache = RetrievalCache(ttl=3600)
+
+        # How ranked lists from different strategies/queries are merged ('rrf' or 'weighted')
+        self.fusion_method = os.getenv('RETRIEVAL_FUSION', 'rrf')
+
+        # Contexts kept after local reranking for the answer prompt
+        self.rerank_top_k = int(os.getenv('RERANK_TOP_K', 6))
+
+        # Containment above which a context counts as a near-duplicate of a higher-ranked one (0 disables)
+        self.near_duplicate_threshold = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.8))
+
+        # Default MMR relevance/diversity trade-off for the final selection (1.0 = ranking only)
+        self.mmr_lambda = float(os.getenv('MMR_LAMBDA', 0.7))
+
+        # Estimated input-token budget for retrieved contexts in each generation prompt (0 = unlimited)
+        self.answer_context_tokens = int(os.getenv('ANSWER_CONTEXT_TOKENS', 6000))
+        self.relationship_context_tokens = int(os.getenv('RELATIONSHIP_CONTEXT_TOKENS', 8000))
+        self.optimization_context_tokens = int(os.getenv('OPTIMIZATION_CONTEXT_TOKENS', 6000))
+
+        # Cut contexts down to the rows and sections relevant to the question before packing
+        self.context_compression = os.getenv('CONTEXT_COMPRESSION', 'true').lower() in ('1', 'true', 'yes')
+
+        # Limit retrieval to the docs of tables named in the question (needs the docs' metadata sidecars)
+        self.metadata_filtering = os.getenv('METADATA_FILTERING', 'true').lower() in ('1', 'true', 'yes')
+        # Seeded from the representative queries, extended with [TABLE: ...] markers seen in results
+        self.known_tables = load_known_tables()
+
+        # Fetch fewer results when the scores separate well and cut at the first score gap
+        self.adaptive_retrieval = os.getenv('ADAPTIVE_RETRIEVAL', 'true').lower() in ('1', 'true', 'yes')
+        self.retrieval_policies = load_policies()
+
+    def warm_up(self):
+        """Open the Bedrock connections ahead of the first real query"""
+        self.kb_client.retrieve(
+            knowledgeBaseId=self.kb_id,
+            retrievalQuery={'text': 'database tables'},
+            retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': 1}}
+        )
+
+    def detect_tables(self, text: str) -> List[str]:
+        """Known tables named in a question"""
+        return detect_tables(text, self.known_tables) if self.metadata_filtering else []
+
+    def resolve_tables(self, names: List[str]) -> List[str]:
+        """Known tables for explicit table names (any case, schema-qualified or not)"""
+        return resolve_tables(names, self.known_tables) if self.metadata_filtering else []
+
+    def kb_retrieve(self, query_text: str, num_results: int, tables: Optional[List[str]] = None,
+                    from_query: Optional[str] = None, strategy: str = 'standard') -> List[RetrievedContext]:
+        """Retrieve from the knowledge base, limited to the docs of ``tables`` when given
+
+        ``num_results`` is the most a search may return; with adaptive retrieval the
+        strategy's policy decides how many are fetched and kept. Falls back to an
+        unfiltered search when the filtered one returns no doc of the requested
+        tables, e.g. on a knowledge base synced before the docs carried metadata
+        (the filter still lets non-table docs through, so the result is rarely empty).
+        """
+        metadata_filter = table_filter(tables) if self.metadata_filtering else None
+
+        def fetch(number_of_results: int) -> List[RetrievedContext]:
+            search_config = {'numberOfResults': number_of_results}
+            if metadata_filter:
+                search_config['filter'] = metadata_filter
+
+            response = self.kb_client.retrieve(
+                knowledgeBaseId=self.kb_id,
+                retrievalQuery={
+                    'text': query_text
+                },
+                retrievalConfiguration={
+                    'vectorSearchConfiguration': search_config
+                }
+            )
+            return contexts_from_response(response, from_query)
+
+        if self.adaptive_retrieval:
+            policy = self.retrieval_policies.get(strategy) or RetrievalPolicy()
+            contexts = adaptive_retrieve(fetch, num_results, policy, strategy)
+        else:
+            contexts = fetch(num_results)
+
+        if metadata_filter:
+            wanted = {table.lower() for table in tables}
+            if not any(name.lower() in wanted for ctx in contexts for name in TABLE_MARKER.findall(ctx.content)):
+                logger.info(f"No docs for {tables} with the table filter, retrying unfiltered")
+                return self.kb_retrieve(query_text, num_results, None, from_query, strategy)
+
+        seen = {table for ctx in contexts for table in TABLE_MARKER.findall(ctx.content)}
+        if not seen <= self.known_tables:
+            # Rebound rather than updated in place so concurrent readers never see it change
+            self.known_tables = self.known_tables | seen
+        return contexts
 
     def generate_cache_key(self, query_text, num_results=5, **kwargs):
         """Generate a cache key based on query parameters"""
@@ -63,83 +202,119 @@ class AdvancedRetrieval:
         key_string = "::".join(key_parts)
         return hashlib.md5(key_string.encode()).hexdigest()
 
-    def advanced_rag_query(self, query_text: str, use_extended_thinking: bool = True) -> Dict[str, Any]:
+    def merge_ranked_lists(self, ranked_lists: List[List[RetrievedContext]], num_results: int,
+                           mmr_lambda: float = 1.0) -> List[RetrievedContext]:
+        """Fuse ranked lists, drop near-duplicates and pick num_results with MMR"""
+        fused = fuse(ranked_lists, None, self.fusion_method)
+        return self.select_contexts(fused, num_results, mmr_lambda)
+
+    def select_contexts(self, ranked: List[RetrievedContext], num_results: int,
+                        mmr_lambda: float = 1.0) -> List[RetrievedContext]:
+        """Final selection from a ranked pool: near-duplicate filter, then MMR diversification"""
+        if mmr_lambda >= 1:
+            return filter_near_duplicates(ranked, self.near_duplicate_threshold, num_results)
+        distinct = filter_near_duplicates(ranked, self.near_duplicate_threshold)
+        return mmr_select(distinct, num_results, mmr_lambda)
+
+    def advanced_rag_query(self, query_text: str, use_extended_thinking: bool = True,
+                           mmr_lambda: Optional[float] = None) -> Dict[str, Any]:
         """Main query method used by the API wrapper"""
         logger.info(f"Advanced RAG query called with query: {query_text}")
 
         # Use multi-strategy retrieval for best results
-        result = self.multi_strategy_retrieval(query_text)
+        result = self.multi_strategy_retrieval(query_text, mmr_lambda=mmr_lambda)
 
-        # Extract contexts
-        contexts = result.get('contexts', [])
-        context_texts = [ctx.get('content', '').strip() for ctx in contexts if ctx.get('content')]
+        # Structured trace - rendered to text only if the client asks for thinking.
+        # Copied so per-request stages never accumulate on the cached retrieval trace.
+        thinking = result.get('thinking_process')
+        thinking = thinking.copy() if thinking else ThinkingTrace('Multi-Strategy Retrieval Process', query_text)
 
-        # Extract thinking process
-        thinking = result.get('thinking_process', '')
+        # Rerank the candidate pool locally so fewer, better contexts reach the prompt
+        contexts = result.get('contexts', [])
+        with thinking.stage('Reranking') as stage:
+            contexts = rerank(query_text, contexts, self.rerank_top_k)
+            stage.count('Candidates', len(result.get('contexts', [])))
+            stage.count('Kept for the answer prompt', len(contexts))
+        context_texts = [ctx.content.strip() for ctx in contexts if ctx.content]
 
         # Generate a proper answer using Claude instead of just concatenating contexts
-        answer = self.generate_answer_from_contexts(query_text, context_texts)
+        with thinking.stage('Answer generation') as stage:
+            answer = self.generate_answer_from_contexts(query_text, context_texts, stage)
 
         return {
             "answer": answer,
-            "thinking": thinking if use_extended_thinking else "",
+            "thinking": thinking if use_extended_thinking else None,
             "retrieved_contexts": context_texts
         }
 
-    def generate_answer_from_contexts(self, query_text: str, context_texts: List[str]) -> str:
+    def pack_prompt_contexts(self, context_texts: List[str], budget_tokens: int,
+                             stage: Optional[TraceStage] = None,
+                             query_text: Optional[str] = None) -> Tuple[str, str]:
+        """Split contexts (highest priority first) into table docs and excerpts within a token budget
+
+        Table docs that fit are kept whole and uncompressed in table order so
+        they can be cached across questions; the other contexts fill the rest
+        of the budget and, with ``query_text``, are first compressed to the
+        parts relevant to it.
+        """
+        table_texts, context_texts = split_table_docs(context_texts, budget_tokens)
+        table_docs = CONTEXT_SEPARATOR.join(table_texts)
+        if budget_tokens > 0:
+            budget_tokens = max(budget_tokens - estimate_tokens(table_docs), 1)
+        if stage is not None and table_texts:
+            stage.count('Whole table docs', len(table_texts))
+        if query_text and self.context_compression:
+            compressed = compress_contexts(query_text, context_texts)
+            if stage is not None:
+                compressed.report(stage)
+            context_texts = compressed.texts
+        packed = pack_contexts(context_texts, budget_tokens)
+        if stage is not None:
+            packed.report(stage)
+        return table_docs, packed.join()
+
+    def generate_text(self, instructions: str, documentation: str, prompt: str, max_tokens: int,
+                      stage: Optional[TraceStage] = None, table_docs: str = '') -> str:
+        """Invoke Claude with cacheable instructions and table docs ahead of the per-request text"""
+        response = self.bedrock_client.invoke_model(
+            modelId=self.model_id,
+            contentType='application/json',
+            accept='application/json',
+            body=encode_bedrock_body(build_request(
+                instructions, documentation, prompt, max_tokens,
+                caching=supports_prompt_caching(self.model_id), table_docs=table_docs
+            ))
+        )
+
+        response_body = decode_bedrock_body(response)
+        record_usage(response_body, stage)
+        return response_body.get('content', [{}])[0].get('text', '')
+
+    def generate_answer_from_contexts(self, query_text: str, context_texts: List[str],
+                                      stage: Optional[TraceStage] = None) -> str:
         """Generate a comprehensive answer from retrieved contexts using Claude with feedback awareness"""
         if not context_texts:
             return f"I couldn't find relevant information in the database knowledge base for your query: '{query_text}'. Please try rephrasing your question or check if the topic is covered in the documentation."
 
         corrections_context = self.get_relevant_corrections(query_text)
         
-        # Combine contexts for analysis
-        combined_contexts = "\n\n---\n\n".join(context_texts[:10])  # Use top 10 contexts
-        
+        # Combine contexts for analysis; user corrections take priority over documentation,
+        # so their tokens come off the budget first
+        budget = self.answer_context_tokens
+        if budget > 0 and corrections_context:
+            budget = max(budget - estimate_tokens(corrections_context), 1)
+        table_docs, combined_contexts = self.pack_prompt_contexts(context_texts, budget, stage, query_text)
+
+        documentation = f"RETRIEVED DOCUMENTATION:\n{combined_contexts}" if combined_contexts else ''
+        table_docs = f"TABLE DOCUMENTATION:\n{table_docs}" if table_docs else ''
+        prompt = f"USER QUERY: {query_text}\n\nSQL Response:"
         if corrections_context:
-            combined_contexts += f"\n\n--- USER CORRECTIONS ---\n\n{corrections_context}"
-
-        prompt = f"""You are a SQL query assistant. Based on the retrieved database documentation below, provide ONLY SQL statements that answer the user's query.
-
-USER QUERY: {query_text}
-
-RETRIEVED DOCUMENTATION:
-{combined_contexts}
-
-IMPORTANT INSTRUCTIONS:
-1. Respond ONLY with SQL statements - no explanatory text
-2. Use proper SQL syntax for the database system
-3. Include table aliases for readability
-4. Add appropriate WHERE clauses for filtering
-5. Use meaningful column names in SELECT statements
-6. If multiple queries are needed, separate them with semicolons
-7. If user corrections are provided above, prioritize those over general documentation
-8. If the query cannot be answered with available schema information, respond with: "-- Insufficient schema information to generate SQL"
-
-SQL Response:"""
+            prompt = f"USER CORRECTIONS:\n{corrections_context}\n\n{prompt}"
 
         try:
-            response = self.bedrock_client.invoke_model(
-                modelId=self.model_id,
-                contentType='application/json',
-                accept='application/json',
-                body=json.dumps({
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 4000,
-                    "temperature": 0.2,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ]
-                })
-            )
-
-            response_body = json.loads(response.get('body').read())
-            result = response_body.get('content', [{}])[0].get('text', '')
+            result = self.generate_text(ANSWER_INSTRUCTIONS, documentation, prompt, 4000, stage, table_docs)
 
-            return result.strip() if result.strip() else f"I found relevant documentation but couldn't generate a proper response. The retrieved information contains: {combined_contexts[:1000]}..."
+            return result.strip() if result.strip() else f"I found relevant documentation but couldn't generate a proper response. The retrieved information contains: {(table_docs or combined_contexts)[:1000]}..."
 
         except Exception as e:
             logger.error(f"Error generating answer from contexts: {e}")
@@ -152,57 +327,39 @@ SQL Response:"""
     def get_relevant_corrections(self, query_text: str) -> str:
         """Get relevant user corrections for similar queries"""
         try:
-            return ""
+            matches = get_corrections_index(self.kb_id).search(query_text)
+            if not matches:
+                return ""
+
+            return "\n\n".join(
+                f"Similar question: {match['pattern']}\nCorrect SQL:\n{match['correct_response']}"
+                for match in matches
+            )
         except Exception as e:
             logger.error(f"Error retrieving corrections: {e}")
             return ""
 
-    def query_database_relationships(self, table_name: str) -> Dict[str, Any]:
+    def query_database_relationships(self, table_name: str, mmr_lambda: Optional[float] = None) -> Dict[str, Any]:
         """Wrapper method for relationship queries to match API expectations"""
-        return self.relationship_retrieval(table_name)
+        return self.relationship_retrieval(table_name, mmr_lambda=mmr_lambda)
 
     def standard_query(self, query_text: str, num_results: int = 5) -> Dict[str, Any]:
         """Standard retrieval from knowledge base"""
         cache_key = self.generate_cache_key(query_text, num_results, method="standard")
 
-        if cache_key in self.cache and time.time() - self.cache[cache_key]['timestamp'] < self.cache_ttl:
-            logger.info(f"Cache hit for query: {query_text}")
-            return self.cache[cache_key]['result']
+        return self.cache.get_or_compute(cache_key, lambda: self._standard_query(query_text, num_results))
 
+    def _standard_query(self, query_text: str, num_results: int) -> Dict[str, Any]:
+        """Uncached standard retrieval"""
         logger.info(f"Performing standard retrieval for query: {query_text}")
         try:
-            # Set a timeout of 10 seconds for this operation
-            response = self.kb_client.retrieve(
-                knowledgeBaseId=self.kb_id,
-                retrievalQuery={
-                    'text': query_text
-                },
-                retrievalConfiguration={
-                    'vectorSearchConfiguration': {
-                        'numberOfResults': num_results
-                    }
-                }
-            )
+            contexts = self.kb_retrieve(query_text, num_results, self.detect_tables(query_text))
             logger.info(f"Standard retrieval successful for query: {query_text}")
 
             result = {
                 'query_text': query_text,
                 'retrieval_method': 'standard',
-                'contexts': [
-                    {
-                        'content': item.get('content', {}).get('text', ''),
-                        'source': item.get('location', {}).get('s3Location', {}).get('uri', ''),
-                        'content_sample': item.get('content', {}).get('text', '')[:500] + '...' if item.get('content', {}).get('text', '') else '',
-                        'score': item.get('score', 0)
-                    }
-                    for item in response.get('retrievalResults', [])
-                ]
-            }
-
-            # Cache the result
-            self.cache[cache_key] = {
-                'result': result,
-                'timestamp': time.time()
+                'contexts': contexts
             }
 
             return result
@@ -215,12 +372,11 @@ SQL Response:"""
                 'retrieval_method': 'standard (mock fallback)',
                 'error': str(e),
                 'contexts': [
-                    {
-                        'content': f"This is a mock response. The query was: {query_text}. There was an error connecting to the knowledge base: {str(e)}",
-                        'source': 'mock-source',
-                        'content_sample': f"This is a mock response. The query was: {query_text}...",
-                        'score': 1.0
-                    }
+                    RetrievedContext(
+                        f"This is a mock response. The query was: {query_text}. There was an error connecting to the knowledge base: {str(e)}",
+                        source=MOCK_SOURCE,
+                        score=1.0
+                    )
                 ]
             }
             return mock_result
@@ -229,68 +385,41 @@ SQL Response:"""
         """Query expansion: generate multiple versions of the query and aggregate results"""
         cache_key = self.generate_cache_key(query_text, num_results, method="expansion")
 
-        if cache_key in self.cache and time.time() - self.cache[cache_key]['timestamp'] < self.cache_ttl:
-            logger.info(f"Cache hit for expanded query: {query_text}")
-            return self.cache[cache_key]['result']
+        return self.cache.get_or_compute(cache_key, lambda: self._query_expansion(query_text, num_results))
 
+    def _query_expansion(self, query_text: str, num_results: int) -> Dict[str, Any]:
+        """Uncached query expansion retrieval"""
         logger.info(f"Performing query expansion for: {query_text}")
 
         try:
-            expanded_queries = self.generate_expanded_queries(query_text)
-            all_contexts = []
-            thinking_process = f"Original query: {query_text}\n\nExpanded queries:\n"
-
-            for i, expanded in enumerate(expanded_queries):
-                thinking_process += f"{i+1}. {expanded}\n"
-
-                response = self.kb_client.retrieve(
-                    knowledgeBaseId=self.kb_id,
-                    retrievalQuery={
-                        'text': expanded
-                    },
-                    retrievalConfiguration={
-                        'vectorSearchConfiguration': {
-                            'numberOfResults': num_results
-                        }
-                    }
-                )
-
-                contexts = [
-                    {
-                        'content': item.get('content', {}).get('text', ''),
-                        'source': item.get('location', {}).get('s3Location', {}).get('uri', ''),
-                        'content_sample': item.get('content', {}).get('text', '')[:500] + '...' if item.get('content', {}).get('text', '') else '',
-                        'score': item.get('score', 0),
-                        'from_query': expanded
-                    }
-                    for item in response.get('retrievalResults', [])
-                ]
-                all_contexts.extend(contexts)
-
-            # Deduplicate contexts based on content
-            unique_contexts = {}
-            for context in all_contexts:
-                content_hash = hashlib.md5(context['content'].encode()).hexdigest()
-                if content_hash not in unique_contexts or context['score'] > unique_contexts[content_hash]['score']:
-                    unique_contexts[content_hash] = context
-
-            # Sort by score and take top results
-            sorted_contexts = sorted(unique_contexts.values(), key=lambda x: x['score'], reverse=True)[:num_results]
-
-            thinking_process += f"\nRetrieved {len(all_contexts)} total contexts, deduplicated to {len(unique_contexts)} unique contexts."
-            thinking_process += f"\nSelected top {len(sorted_contexts)} contexts based on relevance score."
+            trace = ThinkingTrace('Query Expansion', query_text)
+            with trace.stage('Expanded queries') as stage:
+                expanded_queries = self.generate_expanded_queries(query_text)
+                for expanded in expanded_queries:
+                    stage.item(expanded)
+
+            # Fusion rewards chunks several phrasings agree on, so each query needs fewer results
+            per_query = results_per_list(num_results, len(expanded_queries))
+            tables = self.detect_tables(query_text)
+            ranked_lists = []
+            with trace.stage('Retrieval') as retrieval_stage:
+                for expanded in expanded_queries:
+                    ranked_lists.append(self.kb_retrieve(expanded, per_query, tables, expanded, 'expansion'))
+
+            sorted_contexts = self.merge_ranked_lists(ranked_lists, num_results)
+
+            retrieval_stage.count('Results per query', per_query)
+            if tables:
+                retrieval_stage.count('Filtered to tables', ', '.join(tables))
+            retrieval_stage.count('Retrieved contexts', sum(len(contexts) for contexts in ranked_lists))
+            retrieval_stage.count('Unique contexts', len({c.content_hash for contexts in ranked_lists for c in contexts}))
+            retrieval_stage.count(f'Selected by {self.fusion_method} fusion', len(sorted_contexts))
 
             result = {
                 'query_text': query_text,
                 'retrieval_method': 'query_expansion',
                 'contexts': sorted_contexts,
-                'thinking_process': thinking_process
-            }
-
-            # Cache the result
-            self.cache[cache_key] = {
-                'result': result,
-                'timestamp': time.time()
+                'thinking_process': trace
             }
 
             return result
@@ -319,7 +448,7 @@ Provide ONLY the query variations as plain text, one per line. No explanations o
                 modelId=self.model_id,
                 contentType='application/json',
                 accept='application/json',
-                body=json.dumps({
+                body=encode_bedrock_body({
                     "anthropic_version": "bedrock-2023-05-31",
                     "max_tokens": 1500,
                     "temperature": 0.7,
@@ -332,7 +461,7 @@ Provide ONLY the query variations as plain text, one per line. No explanations o
                 })
             )
 
-            response_body = json.loads(response.get('body').read())
+            response_body = decode_bedrock_body(response)
             result = response_body.get('content', [{}])[0].get('text', '')
 
             # Split the result by lines and filter out empty lines
@@ -353,55 +482,36 @@ Provide ONLY the query variations as plain text, one per line. No explanations o
         then retrieve based on that document"""
         cache_key = self.generate_cache_key(query_text, num_results, method="hyde")
 
-        if cache_key in self.cache and time.time() - self.cache[cache_key]['timestamp'] < self.cache_ttl:
-            logger.info(f"Cache hit for HyDE query: {query_text}")
-            return self.cache[cache_key]['result']
+        return self.cache.get_or_compute(cache_key, lambda: self._hyde_retrieval(query_text, num_results))
 
+    def _hyde_retrieval(self, query_text: str, num_results: int) -> Dict[str, Any]:
+        """Uncached HyDE retrieval"""
         logger.info(f"Performing HyDE retrieval for query: {query_text}")
 
         try:
-            # Generate a hypothetical document that answers the query
-            hypothetical_doc = self.generate_hypothetical_document(query_text)
-
-            thinking_process = f"Original query: {query_text}\n\nGenerated hypothetical document to use for retrieval:\n{hypothetical_doc}\n"
+            trace = ThinkingTrace('Hypothetical Document Embedding (HyDE)', query_text)
 
-            # Use the hypothetical document for retrieval
-            response = self.kb_client.retrieve(
-                knowledgeBaseId=self.kb_id,
-                retrievalQuery={
-                    'text': hypothetical_doc
-                },
-                retrievalConfiguration={
-                    'vectorSearchConfiguration': {
-                        'numberOfResults': num_results
-                    }
-                }
-            )
+            # Generate a hypothetical document that answers the query
+            with trace.stage('Hypothetical document') as stage:
+                hypothetical_doc = self.generate_hypothetical_document(query_text)
+                stage.note(hypothetical_doc)
 
-            contexts = [
-                {
-                    'content': item.get('content', {}).get('text', ''),
-                    'source': item.get('location', {}).get('s3Location', {}).get('uri', ''),
-                    'content_sample': item.get('content', {}).get('text', '')[:500] + '...' if item.get('content', {}).get('text', '') else '',
-                    'score': item.get('score', 0)
-                }
-                for item in response.get('retrievalResults', [])
-            ]
+            # Use the hypothetical document for retrieval; the filter comes from the question,
+            # since the generated document may name tables that do not exist
+            tables = self.detect_tables(query_text)
+            with trace.stage('Retrieval') as retrieval_stage:
+                contexts = self.kb_retrieve(hypothetical_doc, num_results, tables, strategy='hyde')
 
-            thinking_process += f"\nRetrieved {len(contexts)} contexts using the hypothetical document."
+            retrieval_stage.count('Retrieved contexts', len(contexts))
+            if tables:
+                retrieval_stage.count('Filtered to tables', ', '.join(tables))
 
             result = {
                 'query_text': query_text,
                 'retrieval_method': 'hyde',
                 'contexts': contexts,
                 'hypothetical_document': hypothetical_doc,
-                'thinking_process': thinking_process
-            }
-
-            # Cache the result
-            self.cache[cache_key] = {
-                'result': result,
-                'timestamp': time.time()
+                'thinking_process': trace
             }
 
             return result
@@ -432,7 +542,7 @@ Respond with the hypothetical document only. Do not include any introductions or
                 modelId=self.model_id,
                 contentType='application/json',
                 accept='application/json',
-                body=json.dumps({
+                body=encode_bedrock_body({
                     "anthropic_version": "bedrock-2023-05-31",
                     "max_tokens": 4000,
                     "temperature": 0.2,
@@ -445,7 +555,7 @@ Respond with the hypothetical document only. Do not include any introductions or
                 })
             )
 
-            response_body = json.loads(response.get('body').read())
+            response_body = decode_bedrock_body(response)
             result = response_body.get('content', [{}])[0].get('text', '')
 
             return result.strip()
@@ -454,74 +564,60 @@ Respond with the hypothetical document only. Do not include any introductions or
             logger.error(f"Error generating hypothetical document: {e}")
             return query_text  # Fall back to original query
 
-    def multi_strategy_retrieval(self, query_text: str, num_results: int = 8) -> Dict[str, Any]:
+    def multi_strategy_retrieval(self, query_text: str, num_results: int = 8,
+                                 mmr_lambda: Optional[float] = None) -> Dict[str, Any]:
         """Combine multiple retrieval strategies and aggregate results"""
-        cache_key = self.generate_cache_key(query_text, num_results, method="multi")
+        mmr_lambda = self.mmr_lambda if mmr_lambda is None else mmr_lambda
+        cache_key = self.generate_cache_key(query_text, num_results, method="multi", mmr_lambda=mmr_lambda)
 
-        if cache_key in self.cache and time.time() - self.cache[cache_key]['timestamp'] < self.cache_ttl:
-            logger.info(f"Cache hit for multi-strategy query: {query_text}")
-            return self.cache[cache_key]['result']
+        return self.cache.get_or_compute(
+            cache_key, lambda: self._multi_strategy_retrieval(query_text, num_results, mmr_lambda))
 
+    def _multi_strategy_retrieval(self, query_text: str, num_results: int, mmr_lambda: float) -> Dict[str, Any]:
+        """Uncached multi-strategy retrieval"""
         logger.info(f"Performing multi-strategy retrieval for query: {query_text}")
 
         try:
+            trace = ThinkingTrace('Multi-Strategy Retrieval Process', query_text)
+
             # Get results from each method (with fewer results per method)
             results_per_method = max(2, num_results // 3)
             standard_results = self.standard_query(query_text, results_per_method)
             expansion_results = self.query_expansion(query_text, results_per_method)
             hyde_results = self.hyde_retrieval(query_text, results_per_method)
 
-            # Combine all contexts
-            all_contexts = []
-            all_contexts.extend(standard_results.get('contexts', []))
-            all_contexts.extend(expansion_results.get('contexts', []))
-            all_contexts.extend(hyde_results.get('contexts', []))
-
-            # Deduplicate contexts based on content
-            unique_contexts = {}
-            for context in all_contexts:
-                content_hash = hashlib.md5(context['content'].encode()).hexdigest()
-                if content_hash not in unique_contexts or context['score'] > unique_contexts[content_hash]['score']:
-                    unique_contexts[content_hash] = context
-
-            # Sort by score and take top results
-            sorted_contexts = sorted(unique_contexts.values(), key=lambda x: x['score'], reverse=True)[:num_results]
-
-            # Create detailed thinking process
-            thinking_process = "# Multi-Strategy Retrieval Process\n\n"
-            thinking_process += f"Query: {query_text}\n\n"
-            thinking_process += "## Standard Retrieval\n"
-            thinking_process += f"Retrieved {len(standard_results.get('contexts', []))} results\n\n"
-
-            thinking_process += "## Query Expansion\n"
-            if 'thinking_process' in expansion_results:
-                thinking_process += expansion_results['thinking_process'] + "\n\n"
-            else:
-                thinking_process += f"Retrieved {len(expansion_results.get('contexts', []))} results\n\n"
-
-            thinking_process += "## Hypothetical Document Embedding (HyDE)\n"
-            if 'thinking_process' in hyde_results:
-                thinking_process += hyde_results['thinking_process'] + "\n\n"
-            else:
-                thinking_process += f"Retrieved {len(hyde_results.get('contexts', []))} results\n\n"
-
-            thinking_process += "## Aggregation Results\n"
-            thinking_process += f"Combined {len(all_contexts)} total contexts from all methods\n"
-            thinking_process += f"After deduplication: {len(unique_contexts)} unique contexts\n"
-            thinking_process += f"Final selection: {len(sorted_contexts)} top contexts by relevance score\n"
+            sub_results = {'standard': standard_results, 'expansion': expansion_results, 'hyde': hyde_results}
+            # A failed strategy's contexts (e.g. the standard mock fallback) are not fused, and its
+            # error is carried on the fused result so the cache treats it as a failure
+            errors = {name: r['error'] for name, r in sub_results.items() if r.get('error')}
+
+            # Raw scores from the query, expanded queries and a HyDE document are not
+            # comparable, so merge the ranked lists by rank instead of sorting on score
+            ranked_lists = [r.get('contexts', []) for name, r in sub_results.items() if name not in errors]
+            sorted_contexts = self.merge_ranked_lists(ranked_lists, num_results, mmr_lambda)
+            unique_count = len({c.content_hash for contexts in ranked_lists for c in contexts})
+
+            # Sub-strategy traces are shared by reference with their own cached results
+            trace.nest('Standard Retrieval', None, **{'Retrieved results': len(standard_results.get('contexts', []))})
+            trace.nest('Query Expansion', expansion_results.get('thinking_process'),
+                       **{'Retrieved results': len(expansion_results.get('contexts', []))})
+            trace.nest('Hypothetical Document Embedding (HyDE)', hyde_results.get('thinking_process'),
+                       **{'Retrieved results': len(hyde_results.get('contexts', []))})
+            aggregation = trace.stage('Aggregation Results')
+            aggregation.count('Combined contexts from all methods', sum(len(contexts) for contexts in ranked_lists))
+            aggregation.count('Unique contexts after deduplication', unique_count)
+            aggregation.count(f'Top contexts selected by {self.fusion_method} fusion and MMR (lambda {mmr_lambda})', len(sorted_contexts))
+            if errors:
+                aggregation.count('Failed strategies', ', '.join(errors))
 
             result = {
                 'query_text': query_text,
                 'retrieval_method': 'multi_strategy',
                 'contexts': sorted_contexts,
-                'thinking_process': thinking_process
-            }
-
-            # Cache the result
-            self.cache[cache_key] = {
-                'result': result,
-                'timestamp': time.time()
+                'thinking_process': trace
             }
+            if errors:
+                result['error'] = '; '.join(f"{name}: {error}" for name, error in errors.items())
 
             return result
 
@@ -534,14 +630,17 @@ Respond with the hypothetical document only. Do not include any introductions or
                 'contexts': []
             }
 
-    def relationship_retrieval(self, table_name: str, num_results: int = 10) -> Dict[str, Any]:
+    def relationship_retrieval(self, table_name: str, num_results: int = 10,
+                               mmr_lambda: Optional[float] = None) -> Dict[str, Any]:
         """Specialized retrieval for table relationship information"""
-        cache_key = self.generate_cache_key(table_name, num_results, method="relationship")
+        mmr_lambda = self.mmr_lambda if mmr_lambda is None else mmr_lambda
+        cache_key = self.generate_cache_key(table_name, num_results, method="relationship", mmr_lambda=mmr_lambda)
 
-        if cache_key in self.cache and time.time() - self.cache[cache_key]['timestamp'] < self.cache_ttl:
-            logger.info(f"Cache hit for relationship query: {table_name}")
-            return self.cache[cache_key]['result']
+        return self.cache.get_or_compute(
+            cache_key, lambda: self._relationship_retrieval(table_name, num_results, mmr_lambda))
 
+    def _relationship_retrieval(self, table_name: str, num_results: int, mmr_lambda: float) -> Dict[str, Any]:
+        """Uncached relationship retrieval"""
         logger.info(f"Performing relationship retrieval for table: {table_name}")
 
         try:
@@ -554,64 +653,39 @@ Respond with the hypothetical document only. Do not include any introductions or
                 f"{table_name} table schema relationships"
             ]
 
+            trace = ThinkingTrace('Relationship Retrieval', table_name)
+            tables = self.resolve_tables([table_name])
             all_contexts = []
-            thinking_process = f"Retrieving relationship information for table: {table_name}\n\nGenerated specialized queries:\n"
-
-            for i, query in enumerate(queries):
-                thinking_process += f"{i+1}. {query}\n"
-
-                response = self.kb_client.retrieve(
-                    knowledgeBaseId=self.kb_id,
-                    retrievalQuery={
-                        'text': query
-                    },
-                    retrievalConfiguration={
-                        'vectorSearchConfiguration': {
-                            'numberOfResults': num_results // len(queries) + 1
-                        }
-                    }
-                )
-
-                contexts = [
-                    {
-                        'content': item.get('content', {}).get('text', ''),
-                        'source': item.get('location', {}).get('s3Location', {}).get('uri', ''),
-                        'content_sample': item.get('content', {}).get('text', '')[:500] + '...' if item.get('content', {}).get('text', '') else '',
-                        'score': item.get('score', 0),
-                        'from_query': query
-                    }
-                    for item in response.get('retrievalResults', [])
-                ]
-                all_contexts.extend(contexts)
+            with trace.stage('Specialized queries') as stage:
+                for query in queries:
+                    stage.item(query)
+                    # The table's own doc carries its keys and the tables referencing it
+                    contexts = self.kb_retrieve(query, num_results // len(queries) + 1, tables, query, 'relationship')
+                    all_contexts.extend(contexts)
 
-            # Deduplicate contexts based on content
-            unique_contexts = {}
-            for context in all_contexts:
-                content_hash = hashlib.md5(context['content'].encode()).hexdigest()
-                if content_hash not in unique_contexts or context['score'] > unique_contexts[content_hash]['score']:
-                    unique_contexts[content_hash] = context
+            # Deduplicate contexts on the hash computed at retrieval time
+            unique_contexts = dedupe_contexts(all_contexts)
 
             # Sort by score and take top results
-            sorted_contexts = sorted(unique_contexts.values(), key=lambda x: x['score'], reverse=True)[:num_results]
+            sorted_contexts = self.select_contexts(
+                sorted(unique_contexts.values(), key=lambda x: x.score, reverse=True),
+                num_results, mmr_lambda
+            )
 
-            thinking_process += f"\nRetrieved {len(all_contexts)} total contexts, deduplicated to {len(unique_contexts)} unique contexts."
-            thinking_process += f"\nSelected top {len(sorted_contexts)} contexts based on relevance score."
+            stage.count('Retrieved contexts', len(all_contexts))
+            stage.count('Unique contexts', len(unique_contexts))
+            stage.count(f'Selected (near-duplicates skipped, MMR lambda {mmr_lambda})', len(sorted_contexts))
 
             # Generate relationship analysis using Claude
-            relationship_analysis = self.generate_relationship_analysis(table_name, sorted_contexts)
+            with trace.stage('Relationship analysis') as analysis_stage:
+                relationship_analysis = self.generate_relationship_analysis(table_name, sorted_contexts, analysis_stage)
 
             result = {
                 'table_name': table_name,
                 'retrieval_method': 'relationship',
                 'contexts': sorted_contexts,
                 'relationship_analysis': relationship_analysis,
-                'thinking_process': thinking_process
-            }
-
-            # Cache the result
-            self.cache[cache_key] = {
-                'result': result,
-                'timestamp': time.time()
+                'thinking_process': trace
             }
 
             return result
@@ -625,47 +699,20 @@ Respond with the hypothetical document only. Do not include any introductions or
                 'contexts': []
             }
 
-    def generate_relationship_analysis(self, table_name: str, contexts: List[Dict]) -> str:
+    def generate_relationship_analysis(self, table_name: str, contexts: List[RetrievedContext],
+                                       stage: Optional[TraceStage] = None) -> str:
         """Generate relationship analysis based on retrieved contexts"""
         # Extract content from contexts
-        context_texts = [ctx['content'] for ctx in contexts if ctx['content']]
-        context_combined = "\n\n---\n\n".join(context_texts)
-
-        prompt = f"""Based on the following database documentation excerpts, provide a comprehensive analysis of all relationships for the '{table_name}' table.
-
-DOCUMENTATION EXCERPTS:
-{context_combined}
-
-Please provide a detailed explanation of:
-1. Primary key(s) of the '{table_name}' table
-2. Foreign keys in '{table_name}' that reference other tables
-3. Tables that have foreign keys referencing '{table_name}'
-4. The complete relationship graph of '{table_name}'
-5. Important notes about these relationships (e.g., cascade delete rules, indexing considerations)
+        context_texts = [ctx.content for ctx in contexts if ctx.content]
+        table_docs, context_combined = self.pack_prompt_contexts(context_texts, self.relationship_context_tokens,
+                                                                 stage, table_name)
 
-Format your response as a technical but readable analysis with markdown formatting. Use bullet points and tables where appropriate.
-If the information is not available in the provided documentation, clearly indicate what's missing."""
+        documentation = f"DOCUMENTATION EXCERPTS:\n{context_combined}" if context_combined else ''
+        table_docs = f"TABLE DOCUMENTATION:\n{table_docs}" if table_docs else ''
+        prompt = f"Analyze all relationships of the '{table_name}' table."
 
         try:
-            response = self.bedrock_client.invoke_model(
-                modelId=self.model_id,
-                contentType='application/json',
-                accept='application/json',
-                body=json.dumps({
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 4000,
-                    "temperature": 0.2,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ]
-                })
-            )
-
-            response_body = json.loads(response.get('body').read())
-            result = response_body.get('content', [{}])[0].get('text', '')
+            result = self.generate_text(RELATIONSHIP_INSTRUCTIONS, documentation, prompt, 4000, stage, table_docs)
 
             return result.strip()
 
@@ -677,105 +724,63 @@ If the information is not available in the provided documentation, clearly indic
         """Analyze and optimize a SQL query based on database schema knowledge"""
         cache_key = self.generate_cache_key(sql_query, method="optimize")
 
-        if cache_key in self.cache and time.time() - self.cache[cache_key]['timestamp'] < self.cache_ttl:
-            logger.info(f"Cache hit for SQL optimization")
-            return self.cache[cache_key]['result']
+        return self.cache.get_or_compute(cache_key, lambda: self._optimize_sql_query(sql_query))
 
+    def _optimize_sql_query(self, sql_query: str) -> Dict[str, Any]:
+        """Uncached SQL optimization"""
         logger.info(f"Performing SQL query optimization")
 
         try:
             # Parse the SQL query to identify tables and columns
-            table_pattern = r'(?:FROM|JOIN)\s+(\w+)'
-            tables = re.findall(table_pattern, sql_query, re.IGNORECASE)
+            table_pattern = r'(?:FROM|JOIN)\s+((?:[\w\[\]`"]+\.)*[\w\[\]`"]+)'
+            tables = [unqualified_name(name) for name in re.findall(table_pattern, sql_query, re.IGNORECASE)]
 
             # Fetch relevant information for each table
-            thinking_process = f"Extracting tables from SQL query:\n{sql_query}\n\nIdentified tables: {', '.join(tables)}\n\n"
+            trace = ThinkingTrace('SQL Optimization', sql_query)
             all_contexts = []
 
-            for table in tables:
-                thinking_process += f"Retrieving schema information for table: {table}\n"
-                table_queries = [
-                    f"{table} schema columns indexes",
-                    f"{table} table structure",
-                    f"{table} primary key and indexes"
-                ]
-
-                for query in table_queries:
-                    response = self.kb_client.retrieve(
-                        knowledgeBaseId=self.kb_id,
-                        retrievalQuery={
-                            'text': query
-                        },
-                        retrievalConfiguration={
-                            'vectorSearchConfiguration': {
-                                'numberOfResults': 3
-                            }
-                        }
-                    )
-
-                    contexts = [
-                        {
-                            'content': item.get('content', {}).get('text', ''),
-                            'source': item.get('location', {}).get('s3Location', {}).get('uri', ''),
-                            'content_sample': item.get('content', {}).get('text', '')[:500] + '...' if item.get('content', {}).get('text', '') else '',
-                            'score': item.get('score', 0)
-                        }
-                        for item in response.get('retrievalResults', [])
+            with trace.stage('Schema retrieval') as schema_stage:
+                for table in tables:
+                    schema_stage.item(table)
+                    table_queries = [
+                        f"{table} schema columns indexes",
+                        f"{table} table structure",
+                        f"{table} primary key and indexes"
                     ]
-                    all_contexts.extend(contexts)
+
+                    for query in table_queries:
+                        contexts = self.kb_retrieve(query, 3, self.resolve_tables([table]), strategy='optimize')
+                        all_contexts.extend(contexts)
 
             # Also get relevant query patterns and optimizations
-            thinking_process += f"Retrieving relevant query patterns and optimization information\n"
+            schema_stage.count('Schema contexts', len(all_contexts))
             optimization_query = f"SQL query optimization for: {sql_query[:100]}..."
 
-            response = self.kb_client.retrieve(
-                knowledgeBaseId=self.kb_id,
-                retrievalQuery={
-                    'text': optimization_query
-                },
-                retrievalConfiguration={
-                    'vectorSearchConfiguration': {
-                        'numberOfResults': 5
-                    }
-                }
-            )
-
-            optimization_contexts = [
-                {
-                    'content': item.get('content', {}).get('text', ''),
-                    'source': item.get('location', {}).get('s3Location', {}).get('uri', ''),
-                    'content_sample': item.get('content', {}).get('text', '')[:500] + '...' if item.get('content', {}).get('text', '') else '',
-                    'score': item.get('score', 0)
-                }
-                for item in response.get('retrievalResults', [])
-            ]
+            optimization_contexts = self.kb_retrieve(optimization_query, 5, self.resolve_tables(tables), strategy='optimize')
             all_contexts.extend(optimization_contexts)
 
-            # Deduplicate contexts based on content
-            unique_contexts = {}
-            for context in all_contexts:
-                content_hash = hashlib.md5(context['content'].encode()).hexdigest()
-                if content_hash not in unique_contexts or context['score'] > unique_contexts[content_hash]['score']:
-                    unique_contexts[content_hash] = context
+            # Deduplicate contexts on the hash computed at retrieval time
+            unique_contexts = dedupe_contexts(all_contexts)
 
-            sorted_contexts = sorted(unique_contexts.values(), key=lambda x: x['score'], reverse=True)[:10]
-            thinking_process += f"Retrieved {len(all_contexts)} total contexts, deduplicated to {len(sorted_contexts)} contexts for analysis.\n"
+            sorted_contexts = filter_near_duplicates(
+                sorted(unique_contexts.values(), key=lambda x: x.score, reverse=True),
+                self.near_duplicate_threshold, 10
+            )
+            aggregation = trace.stage('Aggregation')
+            aggregation.count('Optimization pattern contexts', len(optimization_contexts))
+            aggregation.count('Retrieved contexts', len(all_contexts))
+            aggregation.count('Contexts for analysis', len(sorted_contexts))
 
             # Generate optimization analysis using Claude
-            optimization_analysis = self.generate_sql_optimization(sql_query, sorted_contexts)
+            with trace.stage('Optimization analysis') as analysis_stage:
+                optimization_analysis = self.generate_sql_optimization(sql_query, sorted_contexts, analysis_stage)
 
             result = {
                 'sql_query': sql_query,
                 'retrieval_method': 'sql_optimization',
                 'optimization_analysis': optimization_analysis,
                 'contexts': sorted_contexts,
-                'thinking_process': thinking_process
-            }
-
-            # Cache the result
-            self.cache[cache_key] = {
-                'result': result,
-                'timestamp': time.time()
+                'thinking_process': trace
             }
 
             return result
@@ -789,49 +794,20 @@ If the information is not available in the provided documentation, clearly indic
                 'contexts': []
             }
 
-    def generate_sql_optimization(self, sql_query: str, contexts: List[Dict]) -> str:
+    def generate_sql_optimization(self, sql_query: str, contexts: List[RetrievedContext],
+                                  stage: Optional[TraceStage] = None) -> str:
         """Generate SQL optimization recommendations based on schema knowledge"""
         # Extract content from contexts
-        context_texts = [ctx['content'] for ctx in contexts if ctx['content']]
-        context_combined = "\n\n---\n\n".join(context_texts)
-
-        prompt = f"""Analyze and optimize this SQL query. Respond with ONLY the optimized SQL and brief performance comments.
+        context_texts = [ctx.content for ctx in contexts if ctx.content]
+        table_docs, context_combined = self.pack_prompt_contexts(context_texts, self.optimization_context_tokens,
+                                                                 stage, sql_query)
 
-ORIGINAL SQL:
-```sql
-{sql_query}
-```
-
-SCHEMA INFORMATION:
-{context_combined}
-
-Provide:
-1. Optimized SQL query with performance improvements
-2. Brief comments (-- format) explaining key optimizations
-3. Index recommendations as SQL comments
-
-OPTIMIZED SQL:"""
+        documentation = f"SCHEMA INFORMATION:\n{context_combined}" if context_combined else ''
+        table_docs = f"TABLE DOCUMENTATION:\n{table_docs}" if table_docs else ''
+        prompt = f"ORIGINAL SQL:\n```sql\n{sql_query}\n```\n\nOPTIMIZED SQL:"
 
         try:
-            response = self.bedrock_client.invoke_model(
-                modelId=self.model_id,
-                contentType='application/json',
-                accept='application/json',
-                body=json.dumps({
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 3000,
-                    "temperature": 0.2,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ]
-                })
-            )
-
-            response_body = json.loads(response.get('body').read())
-            result = response_body.get('content', [{}])[0].get('text', '')
+            result = self.generate_text(OPTIMIZATION_INSTRUCTIONS, documentation, prompt, 3000, stage, table_docs)
 
             return result.strip()
 
@@ -874,7 +850,7 @@ if __name__ == '__main__':
             sys.exit(1)
 
         # Print the result
-        print(json.dumps(result, indent=2))
+        print(json.dumps(result, indent=2, default=json_default))
 
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,26 @@
+"""
+Shared text utilities for lexical matching
+Tokenizer, stopword list and singularizer used by the corrections index, the
+reranker, diversity selection, compression and metadata filtering. Kept free
+of AWS and database imports so lexical code can use it without them
+"""
+
+import re
+from typing import List
+
+TOKEN_PATTERN = re.compile(r'\[[a-z_]+\]|[a-z0-9_]+')
+
+STOPWORDS = {
+    'a', 'an', 'the', 'me', 'show', 'all', 'of', 'for', 'to', 'in', 'on', 'by', 'and', 'or',
+    'is', 'are', 'what', 'which', 'how', 'do', 'i', 'with', 'from', 'get', 'list', 'give', 'please'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, keeping [ENTITY] placeholders as single tokens"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def singular(token: str) -> str:
+    """Naive singular form: drops a trailing 's' from words longer than three letters"""
+    return token[:-1] if len(token) > 3 and token.endswith('s') else token
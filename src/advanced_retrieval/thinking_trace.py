@@ -0,0 +1,132 @@
+"""
+Structured trace of a retrieval run
+Strategies record stages, items, counts and timings as they go; the trace is
+only rendered to the "thinking" text when a client asks for it
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+
+class TraceStage:
+    """One step of a retrieval strategy"""
+
+    __slots__ = ('name', 'items', 'counts', 'notes', 'child', 'elapsed_ms', '_started')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items: List[str] = []
+        self.counts: Dict[str, Any] = {}
+        self.notes: List[str] = []
+        self.child: Optional['ThinkingTrace'] = None
+        self.elapsed_ms: Optional[int] = None
+        self._started = time.perf_counter()
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed_ms = int((time.perf_counter() - self._started) * 1000)
+        return False
+
+    def item(self, text: str):
+        """Add a numbered item (an expanded query, a generated document, ...)"""
+        self.items.append(text)
+
+    def count(self, label: str, value: Any):
+        self.counts[label] = value
+
+    def note(self, text: str):
+        self.notes.append(text)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {'name': self.name, 'elapsed_ms': self.elapsed_ms}
+        if self.items:
+            data['items'] = self.items
+        if self.counts:
+            data['counts'] = self.counts
+        if self.notes:
+            data['notes'] = self.notes
+        if self.child:
+            data['trace'] = self.child.to_dict()
+        return data
+
+
+class ThinkingTrace:
+    """Per-stage record of how a result was produced
+
+    Holding references instead of a concatenated string keeps cached results
+    small; ``render()`` (or ``str()``) builds the markdown text on demand.
+    """
+
+    __slots__ = ('title', 'query', 'stages')
+
+    def __init__(self, title: str, query: Optional[str] = None):
+        self.title = title
+        self.query = query
+        self.stages: List[TraceStage] = []
+
+    def stage(self, name: str) -> TraceStage:
+        """Start a stage; use as a context manager to record its duration"""
+        stage = TraceStage(name)
+        self.stages.append(stage)
+        return stage
+
+    def copy(self) -> 'ThinkingTrace':
+        """Shallow copy for adding per-request stages without touching a cached trace"""
+        trace = ThinkingTrace(self.title, self.query)
+        trace.stages = list(self.stages)
+        return trace
+
+    def nest(self, name: str, trace: Optional['ThinkingTrace'], **counts) -> TraceStage:
+        """Record a sub-strategy's trace (or just its counts) as a stage"""
+        stage = self.stage(name)
+        stage.child = trace
+        for label, value in counts.items():
+            stage.count(label, value)
+        return stage
+
+    @property
+    def elapsed_ms(self) -> int:
+        return sum(stage.elapsed_ms or 0 for stage in self.stages)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'title': self.title,
+            'query': self.query,
+            'elapsed_ms': self.elapsed_ms,
+            'stages': [stage.to_dict() for stage in self.stages]
+        }
+
+    def render(self, level: int = 1) -> str:
+        """Markdown rendering of the trace"""
+        lines = []
+        if level == 1:
+            lines.append(f"# {self.title}\n")
+            if self.query:
+                lines.append(f"Query: {self.query}\n")
+
+        heading = '#' * (level + 1)
+        for stage in self.stages:
+            timing = f" ({stage.elapsed_ms} ms)" if stage.elapsed_ms is not None else ""
+            lines.append(f"{heading} {stage.name}{timing}")
+            for i, item in enumerate(stage.items):
+                lines.append(f"{i + 1}. {item}")
+            for label, value in stage.counts.items():
+                lines.append(f"{label}: {value}")
+            lines.extend(stage.notes)
+            if stage.child:
+                lines.append(stage.child.render(level + 1))
+            lines.append("")
+        return "\n".join(lines).rstrip() + "\n"
+
+    def __str__(self) -> str:
+        return self.render()
+
+
+def render_thinking(thinking: Any) -> str:
+    """Text for the API ``thinking`` field from a trace or a plain string"""
+    if isinstance(thinking, ThinkingTrace):
+        return thinking.render()
+    return thinking or ''
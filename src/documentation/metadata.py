@@ -0,0 +1,33 @@
+import json
+
+# Values of the doc_type attribute; retrieval filters on these and on table_name
+DOC_TYPE_TABLE = 'table'
+DOC_TYPE_TABLE_USAGE = 'table_usage'
+DOC_TYPE_QUERY_PATTERN = 'query_pattern'
+DOC_TYPE_RELATIONSHIPS = 'relationships'
+DOC_TYPE_SUMMARY = 'summary'
+DOC_TYPE_INDEX = 'index'
+# Hand-written docs under docs/ carry sidecars too
+DOC_TYPE_BUSINESS_GUIDE = 'business_guide'
+DOC_TYPE_GUIDE = 'guide'
+
+
+def metadata_path(doc_path):
+    """Sidecar path Bedrock Knowledge Bases reads metadata from for a document"""
+    return f"{doc_path}.metadata.json"
+
+
+def write_metadata(doc_path, doc_type, category, table_name=None):
+    """Write the Bedrock metadata sidecar file for a generated document
+
+    :param doc_path: Path of the markdown document
+    :param doc_type: Kind of document (one of the DOC_TYPE_* values)
+    :param category: Documentation category ('schema', 'queries' or a query category)
+    :param table_name: Table the document describes, if it is about a single table
+    """
+    attributes = {'doc_type': doc_type, 'category': category}
+    if table_name:
+        attributes['table_name'] = table_name
+
+    with open(metadata_path(doc_path), 'w', encoding='utf-8') as f:
+        json.dump({'metadataAttributes': attributes}, f, indent=2)
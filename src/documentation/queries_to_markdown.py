@@ -5,6 +5,10 @@ import logging
 import argparse
 from collections import defaultdict
 
+from src.documentation.metadata import (
+    write_metadata, DOC_TYPE_INDEX, DOC_TYPE_QUERY_PATTERN, DOC_TYPE_TABLE_USAGE
+)
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -89,6 +93,7 @@ class QueryMarkdownGenerator:
                 table_filename = table.lower().replace(' ', '_')
                 f.write(f"| [{table}](tables_usage/{table_filename}.md) | {count} |\n")
 
+        write_metadata(output_path, DOC_TYPE_INDEX, 'queries')
         logger.info("Index file generated at %s", output_path)
 
     def generate_query_patterns(self):
@@ -166,6 +171,8 @@ class QueryMarkdownGenerator:
                     f.write(sql_text)
                     f.write("\n```\n\n")
 
+            write_metadata(output_path, DOC_TYPE_QUERY_PATTERN, category)
+
         logger.info("Generated documentation for %d query categories", len(queries_by_category))
 
     def generate_tables_usage_docs(self):
@@ -267,6 +274,8 @@ class QueryMarkdownGenerator:
                     f.write(sql_text)
                     f.write("\n```\n\n")
 
+            write_metadata(output_path, DOC_TYPE_TABLE_USAGE, 'queries', table)
+
         logger.info("Generated usage documentation for %d tables", len(queries_by_table))
 
 
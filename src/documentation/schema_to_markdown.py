@@ -5,6 +5,10 @@ import logging
 import argparse
 import time
 
+from src.documentation.metadata import (
+    write_metadata, DOC_TYPE_INDEX, DOC_TYPE_SUMMARY, DOC_TYPE_TABLE, DOC_TYPE_RELATIONSHIPS
+)
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -76,6 +80,7 @@ class SchemaMarkdownGenerator:
             for table_name in sorted(self.schema_data['tables'].keys()):
                 f.write(f"- [{table_name}](tables/{table_name}.md)\n")
 
+        write_metadata(output_path, DOC_TYPE_INDEX, 'schema')
         logger.info("Index file generated at %s", output_path)
 
     def generate_tables_summary(self):
@@ -103,6 +108,7 @@ class SchemaMarkdownGenerator:
 
                 f.write(f"| [{table_name}](./tables/{table_name}.md) | {description} | {num_columns} | {primary_key} | {foreign_keys} |\n")
 
+        write_metadata(output_path, DOC_TYPE_SUMMARY, 'schema')
         logger.info("Tables summary generated at %s", output_path)
 
     def generate_table_doc(self, table_name, table_data):
@@ -247,6 +253,7 @@ class SchemaMarkdownGenerator:
 
             f.write(f"[/TABLE: {table_name}]\n")
 
+        write_metadata(output_path, DOC_TYPE_TABLE, 'schema', table_name)
         logger.info("Table documentation generated at %s", output_path)
 
     def generate_relationships_summary(self):
@@ -300,6 +307,7 @@ class SchemaMarkdownGenerator:
 
                 f.write(f"| [{target_table}](../tables/{target_table}.md) | {target_column} | [{source_table}](../tables/{source_table}.md) | {source_column} |\n")
 
+        write_metadata(output_path, DOC_TYPE_RELATIONSHIPS, 'schema')
         logger.info("Relationships summary generated at %s", output_path)
 
 
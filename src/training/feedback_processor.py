@@ -3,57 +3,97 @@ import json
 import logging
 import boto3
 import hashlib
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Entity phrases replaced with placeholders so similar questions share a pattern
+QUERY_PATTERN_REPLACEMENTS = {
+    'sales orders': '[SALES_ENTITY]',
+    'customers': '[CUSTOMER_ENTITY]',
+    'products': '[PRODUCT_ENTITY]',
+    'orders': '[ORDER_ENTITY]',
+    'payments': '[PAYMENT_ENTITY]'
+}
+
+def generalize_query_pattern(original_query: str) -> str:
+    """Generalize a specific query into a reusable pattern"""
+    pattern = original_query.lower()
+    
+    for term, placeholder in QUERY_PATTERN_REPLACEMENTS.items():
+        pattern = pattern.replace(term, placeholder)
+    
+    return pattern
+
 class FeedbackProcessor:
     """Process user feedback and update knowledge base with corrections"""
     
-    def __init__(self, region_name='us-east-1'):
+    def __init__(self, region_name='us-east-1', chunk_size: Optional[int] = None):
         self.bedrock_agent = boto3.client('bedrock-agent', region_name=region_name)
         self.region = region_name
+        self.chunk_size = chunk_size or int(os.getenv('FEEDBACK_CHUNK_SIZE', 200))
     
-    def process_pending_feedback(self, kb_id: str, company_id: int, connection) -> Dict[str, Any]:
-        """Process all pending feedback for a knowledge base"""
+    def process_pending_feedback(self, kb_id: str, company_id: int, connection,
+                                 progress_callback: Optional[Callable[[Dict], None]] = None) -> Dict[str, Any]:
+        """Process all pending feedback for a knowledge base
+
+        Pending feedback is read in pages of chunk_size (keyset on Id) and each page is
+        written and committed on its own, so memory use and lock time stay bounded.
+        progress_callback, when given, is called with processed/total counts after each chunk.
+        """
         cursor = connection.cursor(dictionary=True)
         
         cursor.execute(
-            """SELECT * FROM query_feedback 
+            """SELECT COUNT(*) AS total FROM query_feedback 
                WHERE KnowledgeBaseId = %s AND CompanyId = %s 
-               AND ProcessingStatus = 'pending' AND FeedbackType = 'correction'
-               ORDER BY CreatedAt ASC""",
+               AND ProcessingStatus = 'pending' AND FeedbackType = 'correction'""",
             (kb_id, company_id)
         )
+        total = cursor.fetchone()['total']
         
-        pending_feedback = cursor.fetchall()
-        
-        if not pending_feedback:
+        if not total:
+            cursor.close()
             return {"status": "no_pending_feedback", "processed": 0}
         
         processed_count = 0
+        failed_count = 0
         training_data_ids = []
+        last_id = 0
+        
+        if progress_callback:
+            progress_callback({"stage": "training_data", "processed": 0, "total": total})
         
-        for feedback in pending_feedback:
+        while True:
+            cursor.execute(
+                """SELECT Id, CompanyId, KnowledgeBaseId, OriginalQuery, OriginalResponse, 
+                          CorrectedResponse, FeedbackNotes 
+                   FROM query_feedback 
+                   WHERE KnowledgeBaseId = %s AND CompanyId = %s 
+                   AND ProcessingStatus = 'pending' AND FeedbackType = 'correction'
+                   AND Id > %s
+                   ORDER BY Id ASC LIMIT %s""",
+                (kb_id, company_id, last_id, self.chunk_size)
+            )
+            chunk = cursor.fetchall()
+            if not chunk:
+                break
+            last_id = chunk[-1]['Id']
+            
             try:
-                training_data_id = self.create_training_data(feedback, connection)
-                if training_data_id:
-                    training_data_ids.append(training_data_id)
-                    processed_count += 1
-                    
-                    cursor.execute(
-                        """UPDATE query_feedback 
-                           SET ProcessingStatus = 'reviewed', ProcessedAt = NOW(), ProcessedBy = 'system'
-                           WHERE Id = %s""",
-                        (feedback['Id'],)
-                    )
-                    
+                chunk_ids = self.create_training_data_batch(chunk, connection)
+                connection.commit()
+                training_data_ids.extend(chunk_ids)
+                processed_count += len(chunk_ids)
             except Exception as e:
-                logger.error(f"Error processing feedback {feedback['Id']}: {e}")
-                continue
-        
-        connection.commit()
+                # Rows stay 'pending' and are picked up by the next run
+                logger.error(f"Error processing feedback chunk ending at Id {last_id}: {e}")
+                connection.rollback()
+                failed_count += len(chunk)
+            
+            if progress_callback:
+                progress_callback({"stage": "training_data", "processed": processed_count,
+                                   "failed": failed_count, "total": total})
         
         if training_data_ids:
             cursor.execute(
@@ -90,46 +130,56 @@ class FeedbackProcessor:
         return {
             "status": "success",
             "processed": processed_count,
+            "failed": failed_count,
             "training_data_ids": training_data_ids
         }
     
-    def create_training_data(self, feedback: Dict, connection) -> Optional[int]:
-        """Create training data from user feedback"""
+    def create_training_data_batch(self, feedback_rows: List[Dict], connection) -> List[int]:
+        """Create training data for a chunk of feedback and mark the feedback reviewed
+
+        One executemany insert, one id lookup and one status update per chunk.
+        The caller owns the transaction.
+        """
         cursor = connection.cursor()
         
-        query_pattern = self.generalize_query_pattern(feedback['OriginalQuery'])
+        feedback_ids = [feedback['Id'] for feedback in feedback_rows]
+        placeholders = ','.join(['%s'] * len(feedback_ids))
         
-        cursor.execute(
+        cursor.executemany(
             """INSERT INTO training_data 
                (FeedbackId, CompanyId, KnowledgeBaseId, QueryPattern, 
                 CorrectResponse, IncorrectResponse, ImprovementNotes)
                VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-            (feedback['Id'], feedback['CompanyId'], feedback['KnowledgeBaseId'],
-             query_pattern, feedback['CorrectedResponse'], feedback['OriginalResponse'],
-             feedback['FeedbackNotes'])
+            [
+                (feedback['Id'], feedback['CompanyId'], feedback['KnowledgeBaseId'],
+                 self.generalize_query_pattern(feedback['OriginalQuery']),
+                 feedback['CorrectedResponse'], feedback['OriginalResponse'],
+                 feedback['FeedbackNotes'])
+                for feedback in feedback_rows
+            ]
         )
         
-        training_data_id = cursor.lastrowid
-        cursor.close()
+        # Auto-increment ids from a multi-row insert are not guaranteed contiguous,
+        # so read them back by feedback id
+        cursor.execute(
+            f"SELECT Id FROM training_data WHERE FeedbackId IN ({placeholders}) ORDER BY Id",
+            feedback_ids
+        )
+        training_data_ids = [row[0] for row in cursor.fetchall()]
         
-        return training_data_id
+        cursor.execute(
+            f"""UPDATE query_feedback 
+               SET ProcessingStatus = 'reviewed', ProcessedAt = NOW(), ProcessedBy = 'system'
+               WHERE Id IN ({placeholders})""",
+            feedback_ids
+        )
+        
+        cursor.close()
+        return training_data_ids
     
     def generalize_query_pattern(self, original_query: str) -> str:
         """Generalize a specific query into a reusable pattern"""
-        pattern = original_query.lower()
-        
-        common_replacements = {
-            'sales orders': '[SALES_ENTITY]',
-            'customers': '[CUSTOMER_ENTITY]',
-            'products': '[PRODUCT_ENTITY]',
-            'orders': '[ORDER_ENTITY]',
-            'payments': '[PAYMENT_ENTITY]'
-        }
-        
-        for term, placeholder in common_replacements.items():
-            pattern = pattern.replace(term, placeholder)
-        
-        return pattern
+        return generalize_query_pattern(original_query)
     
     def generate_corrected_documentation(self, training_data_ids: List[int], connection) -> List[Dict]:
         """Generate corrected documentation from training data"""
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test adaptive numberOfResults and score-gap truncation
+"""
+import json
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from src.advanced_retrieval.adaptive_retrieval import (
+    RetrievalPolicy, adaptive_retrieve, learn_policies, load_policies, log_scores
+)
+from src.advanced_retrieval.context import RetrievedContext
+from src.advanced_retrieval.retrieval_techniques import AdvancedRetrieval
+
+
+def fetcher(scores):
+    """fetch(n) over a fixed ranked result list, recording the requested sizes"""
+    calls = []
+
+    def fetch(n):
+        calls.append(n)
+        return [RetrievedContext(f'chunk {i}', score=score) for i, score in enumerate(scores[:n])]
+    return fetch, calls
+
+
+def test_cut_at_first_large_gap():
+    policy = RetrievalPolicy(gap=0.15, min_results=2)
+    assert policy.cut_at_gap([0.9, 0.88, 0.85, 0.5, 0.48]) == 3
+    assert policy.cut_at_gap([0.9, 0.4, 0.38]) == 2  # never below min_results
+    assert policy.cut_at_gap([0.9, 0.85, 0.8, 0.75]) == 4
+    print('✅ Score-gap truncation')
+
+
+def test_separated_scores_stay_small():
+    """A clear ranking is served from the small first fetch"""
+    fetch, calls = fetcher([0.9, 0.85, 0.5, 0.48, 0.47, 0.46, 0.45, 0.44, 0.43, 0.42])
+    contexts = adaptive_retrieve(fetch, 10, RetrievalPolicy(start=0.5))
+    assert calls == [5]
+    assert [c.content for c in contexts] == ['chunk 0', 'chunk 1']
+    print('✅ Easy query fetches and keeps few results')
+
+
+def test_flat_scores_expand():
+    fetch, calls = fetcher([0.61, 0.60, 0.60, 0.59, 0.59, 0.58, 0.58, 0.57, 0.57, 0.56])
+    contexts = adaptive_retrieve(fetch, 10, RetrievalPolicy(start=0.5))
+    assert calls == [5, 10]
+    assert len(contexts) == 10
+    print('✅ Flat score distribution expands to the full amount')
+
+
+def test_learn_and_load_policies():
+    records = [{'strategy': 'standard', 'requested': 5, 'scores': [0.9, 0.88, 0.86, 0.5, 0.49]}] * 30
+    learned = learn_policies(records, min_samples=20)
+    assert set(learned['standard']) == {'start', 'flat_spread', 'gap', 'min_results'}
+    assert learned['standard']['gap'] < 0.36 / 0.9  # the big drop counts as large
+    assert learn_policies(records[:5], min_samples=20) == {}
+
+    path = os.path.join(tempfile.mkdtemp(), 'retrieval_policy.json')
+    with open(path, 'w') as f:
+        json.dump(learned, f)
+    policies = load_policies(path)
+    assert policies['standard'].gap == learned['standard']['gap']
+    assert 'relationship' in policies
+    print('✅ Policies learned offline and loaded')
+
+
+def test_score_log():
+    path = os.path.join(tempfile.mkdtemp(), 'scores.jsonl')
+    log_scores('hyde', 5, [0.81234567, 0.5], path)
+    with open(path) as f:
+        assert json.loads(f.read()) == {'strategy': 'hyde', 'requested': 5, 'scores': [0.8123, 0.5]}
+
+
+def test_kb_retrieve_uses_strategy_policy():
+    class KBClient:
+        def __init__(self):
+            self.sizes = []
+
+        def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration):
+            n = retrievalConfiguration['vectorSearchConfiguration']['numberOfResults']
+            self.sizes.append(n)
+            return {'retrievalResults': [{'content': {'text': f'doc {i}'}, 'score': 0.9 - 0.01 * i}
+                                         for i in range(n)]}
+
+    retriever = AdvancedRetrieval(kb_id='test')
+    retriever.kb_client = KBClient()
+    retriever.retrieval_policies = {'standard': RetrievalPolicy(start=0.5)}
+    assert len(retriever.kb_retrieve('stock levels', 8)) == 8
+    assert retriever.kb_client.sizes == [4, 8]
+
+    retriever.adaptive_retrieval = False
+    retriever.kb_client.sizes = []
+    retriever.kb_retrieve('stock levels', 8)
+    assert retriever.kb_client.sizes == [8]
+    print('✅ kb_retrieve follows the strategy policy')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
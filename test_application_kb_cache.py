@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test the in-memory application-to-KB routing table
+"""
+import sys
+sys.path.append('.')
+
+from fastapi.testclient import TestClient
+
+import app as dbkb_app
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.rows)
+
+    def close(self):
+        pass
+
+
+ROWS = [{
+    'Name': 'epic',
+    'DatabaseKnowledgeBaseId': 'KRD3MW7QFS',
+    'SupportKnowledgeBaseId': 'ECC3L7C2PG',
+    'DocumentationKnowledgeBaseId': None
+}]
+
+
+def _install_fake_db(monkeypatch, rows):
+    calls = {'count': 0}
+
+    def fake_connection():
+        calls['count'] += 1
+        return FakeConnection(rows) if rows is not None else None
+
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_connection', fake_connection)
+    dbkb_app.invalidate_application_kbs_cache()
+    return calls
+
+
+def test_lookup_hits_database_once(monkeypatch):
+    """Repeated lookups are served from memory until the TTL expires"""
+    calls = _install_fake_db(monkeypatch, ROWS)
+
+    for _ in range(5):
+        kbs = dbkb_app.get_application_kbs('epic')
+        assert kbs.databaseKnowledgeBaseId == 'KRD3MW7QFS'
+        assert kbs.supportKnowledgeBaseId == 'ECC3L7C2PG'
+
+    assert dbkb_app.get_application_kbs('unknown') is None
+    assert calls['count'] == 1
+    print('✅ Routing lookups served from cache')
+
+
+def test_invalidation_forces_reload(monkeypatch):
+    """Invalidating the cache makes the next lookup reload the table"""
+    calls = _install_fake_db(monkeypatch, ROWS)
+
+    dbkb_app.get_application_kbs('epic')
+    dbkb_app.invalidate_application_kbs_cache()
+    dbkb_app.get_application_kbs('epic')
+
+    assert calls['count'] == 2
+    print('✅ Cache invalidation reloads routing table')
+
+
+def test_stale_table_survives_db_outage(monkeypatch):
+    """An expired table keeps serving when the database cannot be reached"""
+    _install_fake_db(monkeypatch, ROWS)
+    dbkb_app.get_application_kbs('epic')
+
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_connection', lambda: None)
+    monkeypatch.setattr(dbkb_app, 'application_kbs_loaded_at', 0.0)
+
+    kbs = dbkb_app.get_application_kbs('epic')
+    assert kbs is not None and kbs.databaseKnowledgeBaseId == 'KRD3MW7QFS'
+    print('✅ Stale routing table served during DB outage')
+
+
+def test_refresh_endpoint_keeps_table_during_outage(monkeypatch):
+    """A failed forced reload does not throw away the last known table"""
+    _install_fake_db(monkeypatch, ROWS)
+    dbkb_app.get_application_kbs('epic')
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_connection', lambda: None)
+
+    response = TestClient(dbkb_app.app).post('/applications/refresh')
+    assert response.status_code == 503
+    assert 'epic' in response.json()['applications']
+    assert dbkb_app.get_application_kbs('epic').databaseKnowledgeBaseId == 'KRD3MW7QFS'
+    print('✅ Forced refresh keeps routing during DB outage')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Test the persisted background job runner
+"""
+import sys
+import json
+import time
+import threading
+sys.path.append('.')
+
+from utils.jobs import JobRunner
+
+
+class DuplicateKeyError(Exception):
+    errno = 1062
+
+
+class JobTableCursor:
+    """Minimal stand-in for the background_job table"""
+
+    def __init__(self, db, dictionary):
+        self.db = db
+        self.dictionary = dictionary
+        self.result = []
+        self.rowcount = 0
+
+    @staticmethod
+    def _lease_expired(job):
+        return job.get('LeaseExpiresAt') is None or job['LeaseExpiresAt'] < time.time()
+
+    def execute(self, query, params=()):
+        query = ' '.join(query.split())
+        jobs = self.db.jobs
+        self.rowcount = 0
+        if query.startswith('INSERT INTO background_job'):
+            job_uuid, job_type, payload, dedupe_key = params
+            if dedupe_key and any(j['DedupeKey'] == dedupe_key and j['Status'] in ('queued', 'running')
+                                  for j in jobs.values()):
+                raise DuplicateKeyError()
+            jobs[job_uuid] = {'JobUuid': job_uuid, 'JobType': job_type, 'Payload': payload,
+                              'DedupeKey': dedupe_key, 'Status': 'queued', 'Progress': None,
+                              'Result': None, 'ErrorMessage': None, 'Attempts': 0,
+                              'LeaseOwner': None, 'LeaseExpiresAt': None,
+                              'CreatedAt': time.time(), 'StartedAt': None, 'CompletedAt': None}
+        elif 'WHERE DedupeKey' in query:
+            if self.db.hide_dedupe_once:
+                # Simulates another task inserting between our SELECT and INSERT
+                self.db.hide_dedupe_once = False
+                self.result = []
+                return
+            self.result = [(j['JobUuid'], j['Status'] == 'queued' or self._lease_expired(j)) for j in jobs.values()
+                           if j['DedupeKey'] == params[0] and j['Status'] in ('queued', 'running')]
+        elif query.startswith("SELECT JobUuid FROM background_job WHERE Status"):
+            self.result = [(j['JobUuid'],) for j in jobs.values()
+                           if j['Status'] == 'queued' or (j['Status'] == 'running' and self._lease_expired(j))]
+        elif query.startswith('SELECT'):
+            job = jobs.get(params[0])
+            self.result = [dict(job)] if job else []
+        elif "SET Status = 'running'" in query:
+            owner, lease_seconds, job_uuid = params
+            job = jobs.get(job_uuid)
+            with self.db.lock:
+                if job and (job['Status'] == 'queued' or (job['Status'] == 'running' and self._lease_expired(job))):
+                    job.update(Status='running', Attempts=job['Attempts'] + 1, LeaseOwner=owner,
+                               LeaseExpiresAt=time.time() + lease_seconds)
+                    self.rowcount = 1
+        elif 'SET LeaseExpiresAt' in query:
+            lease_seconds, job_uuid, owner = params
+            job = jobs[job_uuid]
+            if job['LeaseOwner'] == owner and job['Status'] == 'running':
+                job['LeaseExpiresAt'] = time.time() + lease_seconds
+                self.rowcount = 1
+        elif 'SET Progress' in query:
+            jobs[params[1]]['Progress'] = params[0]
+            self.rowcount = 1
+        elif 'SET Status = %s' in query:
+            status, result, error, job_uuid, owner = params
+            job = jobs[job_uuid]
+            if job['LeaseOwner'] == owner:
+                job.update(Status=status, Result=result, ErrorMessage=error, LeaseExpiresAt=None)
+                self.rowcount = 1
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class JobDB:
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.hide_dedupe_once = False
+
+    def connect(self):
+        return self
+
+    def cursor(self, dictionary=False):
+        return JobTableCursor(self, dictionary)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _wait_for(runner, job_uuid, status, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = runner.get(job_uuid)
+        if job and job['Status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_uuid} never reached {status}")
+
+
+def test_job_runs_and_reports_progress():
+    """A submitted job runs in the background and stores progress and result"""
+    db = JobDB()
+    runner = JobRunner(db.connect, max_workers=1)
+
+    def handler(payload, report_progress):
+        report_progress({'processed': 1, 'total': 2})
+        return {'echo': payload['value']}
+
+    runner.register('echo', handler)
+    job_uuid = runner.submit('echo', {'value': 42})
+
+    job = _wait_for(runner, job_uuid, 'completed')
+    assert job['Result'] == {'echo': 42}
+    assert job['Progress'] == {'processed': 1, 'total': 2}
+    runner.shutdown(wait=True)
+    print('✅ Background job completed with progress')
+
+
+def test_failed_job_records_error():
+    """Handler exceptions mark the job failed with the error message"""
+    db = JobDB()
+    runner = JobRunner(db.connect, max_workers=1)
+
+    def handler(payload, report_progress):
+        raise RuntimeError('boom')
+
+    runner.register('explode', handler)
+    job = _wait_for(runner, runner.submit('explode', {}), 'failed')
+    assert job['ErrorMessage'] == 'boom'
+    runner.shutdown(wait=True)
+    print('✅ Failed job records its error')
+
+
+def test_unfinished_jobs_resume_after_restart():
+    """Jobs left queued or running by a previous process are picked up again"""
+    db = JobDB()
+    db.jobs['left-running'] = {'JobUuid': 'left-running', 'JobType': 'echo',
+                               'Payload': json.dumps({'value': 1}), 'DedupeKey': None,
+                               'Status': 'running', 'Progress': None, 'Result': None,
+                               'ErrorMessage': None, 'Attempts': 1, 'LeaseOwner': 'dead-task',
+                               'LeaseExpiresAt': time.time() - 1, 'CreatedAt': 0,
+                               'StartedAt': None, 'CompletedAt': None}
+
+    runner = JobRunner(db.connect, max_workers=1)
+    runner.register('echo', lambda payload, report_progress: {'echo': payload['value']})
+    assert runner.resume() == 1
+
+    job = _wait_for(runner, 'left-running', 'completed')
+    assert job['Attempts'] == 2
+    runner.shutdown(wait=True)
+    print('✅ Unfinished jobs resume after restart')
+
+
+def test_dedupe_returns_active_job():
+    """Submitting with the dedupe key of an active job returns that job"""
+    db = JobDB()
+    runner = JobRunner(db.connect, max_workers=1)
+    release = []
+
+    def handler(payload, report_progress):
+        while not release:
+            time.sleep(0.01)
+        return {}
+
+    runner.register('slow', handler)
+    first = runner.submit('slow', {}, dedupe_key='kb:1')
+    second = runner.submit('slow', {}, dedupe_key='kb:1')
+    assert first == second
+    release.append(True)
+    _wait_for(runner, first, 'completed')
+    runner.shutdown(wait=True)
+    print('✅ Duplicate submissions share the active job')
+
+
+def test_leased_job_is_not_taken_over():
+    """Another task's running job is neither resumed nor run again by a duplicate submit"""
+    db = JobDB()
+    db.jobs['leased'] = {'JobUuid': 'leased', 'JobType': 'count', 'Payload': '{}',
+                         'DedupeKey': 'kb:1', 'Status': 'running', 'Progress': None, 'Result': None,
+                         'ErrorMessage': None, 'Attempts': 1, 'LeaseOwner': 'other-task',
+                         'LeaseExpiresAt': time.time() + 60, 'CreatedAt': 0,
+                         'StartedAt': None, 'CompletedAt': None}
+    runs = []
+    runner = JobRunner(db.connect, max_workers=1)
+    runner.register('count', lambda payload, report_progress: runs.append(1) or {})
+
+    assert runner.resume() == 0
+    assert runner.submit('count', {}, dedupe_key='kb:1') == 'leased'
+    assert runner._claim('leased') is None
+    time.sleep(0.05)
+    assert runs == [] and db.jobs['leased']['Attempts'] == 1
+    runner.shutdown(wait=True)
+    print('✅ Leased jobs stay with their owner')
+
+
+def test_claim_is_exclusive():
+    """Two runners racing for one queued job: exactly one claims it"""
+    db = JobDB()
+    db.jobs['queued'] = {'JobUuid': 'queued', 'JobType': 'count', 'Payload': '{}', 'DedupeKey': None,
+                         'Status': 'queued', 'Progress': None, 'Result': None, 'ErrorMessage': None,
+                         'Attempts': 0, 'LeaseOwner': None, 'LeaseExpiresAt': None, 'CreatedAt': 0,
+                         'StartedAt': None, 'CompletedAt': None}
+    first, second = JobRunner(db.connect, max_workers=1), JobRunner(db.connect, max_workers=1)
+    claims = [first._claim('queued'), second._claim('queued')]
+    assert sum(claim is not None for claim in claims) == 1
+    assert db.jobs['queued']['LeaseOwner'] == first.owner
+    first.shutdown()
+    second.shutdown()
+
+
+def test_lease_renewed_while_running():
+    db = JobDB()
+    runner = JobRunner(db.connect, max_workers=1, lease_seconds=1)
+    release = threading.Event()
+    runner.register('slow', lambda payload, report_progress: release.wait(5) and {})
+    job_uuid = runner.submit('slow', {})
+    _wait_for(runner, job_uuid, 'running')
+    time.sleep(1.2)
+    assert db.jobs[job_uuid]['LeaseExpiresAt'] > time.time()  # renewed past the original 1s lease
+    release.set()
+    _wait_for(runner, job_uuid, 'completed')
+    runner.shutdown(wait=True)
+
+
+def _dead_job(job_uuid, lease_expires_at, dedupe_key=None):
+    return {'JobUuid': job_uuid, 'JobType': 'count', 'Payload': '{}', 'DedupeKey': dedupe_key,
+            'Status': 'running', 'Progress': None, 'Result': None, 'ErrorMessage': None,
+            'Attempts': 1, 'LeaseOwner': 'dead-task', 'LeaseExpiresAt': lease_expires_at,
+            'CreatedAt': 0, 'StartedAt': None, 'CompletedAt': None}
+
+
+def test_dedupe_hit_on_dead_job_resumes_it():
+    """A duplicate submit for a job whose task died runs it instead of returning a stuck id"""
+    db = JobDB()
+    db.jobs['dead'] = _dead_job('dead', time.time() - 1, dedupe_key='kb:1')
+    runner = JobRunner(db.connect, max_workers=1)
+    runner.register('count', lambda payload, report_progress: {})
+
+    assert runner.submit('count', {}, dedupe_key='kb:1') == 'dead'
+    _wait_for(runner, 'dead', 'completed')
+    runner.shutdown(wait=True)
+    print('✅ Dedupe hit resumes a dead job')
+
+
+def test_reclaimer_picks_up_lease_that_expires_later():
+    """Jobs whose lease was still current at startup are reclaimed once it expires"""
+    db = JobDB()
+    db.jobs['dead'] = _dead_job('dead', time.time() + 0.2)
+    runner = JobRunner(db.connect, max_workers=1)
+    runner.register('count', lambda payload, report_progress: {})
+
+    runner.start_reclaimer(interval=0.1)
+    _wait_for(runner, 'dead', 'completed')
+    runner.shutdown(wait=True)
+    print('✅ Periodic reclaim recovers crashed jobs')
+
+
+def test_concurrent_submit_uses_winning_job():
+    """If another task inserts first, the unique active dedupe key makes this submit reuse its job"""
+    db = JobDB()
+    runner = JobRunner(db.connect, max_workers=1)
+    release = threading.Event()
+    runner.register('slow', lambda payload, report_progress: release.wait(5) and {})
+
+    first = runner.submit('slow', {}, dedupe_key='kb:1')
+    db.hide_dedupe_once = True
+    second = runner.submit('slow', {}, dedupe_key='kb:1')
+    assert first == second and len(db.jobs) == 1
+    release.set()
+    _wait_for(runner, first, 'completed')
+    runner.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    test_job_runs_and_reports_progress()
+    test_failed_job_records_error()
+    test_unfinished_jobs_resume_after_restart()
+    test_dedupe_returns_active_job()
+    test_leased_job_is_not_taken_over()
+    test_claim_is_exclusive()
+    test_lease_renewed_while_running()
+    test_dedupe_hit_on_dead_job_resumes_it()
+    test_reclaimer_picks_up_lease_that_expires_later()
+    test_concurrent_submit_uses_winning_job()
+    print("\n🎉 All background job tests passed!")
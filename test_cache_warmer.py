@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test retrieval cache warm-up from historical queries
+"""
+import sys
+import time
+import threading
+sys.path.append('.')
+
+from utils.cache_warmer import CacheWarmer, RateLimiter, load_selected_tables
+
+
+class FakeCursor:
+    def __init__(self, rows_by_kb):
+        self.rows_by_kb = rows_by_kb
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.rows = self.rows_by_kb.get(params[0], [])[:params[1]]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rows_by_kb):
+        self.rows_by_kb = rows_by_kb
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.rows_by_kb)
+
+    def close(self):
+        pass
+
+
+POPULAR = {
+    'DBKB': [('show all open orders', '/query', 40), ('db_order', '/relationship', 12),
+             ('show all open orders', '/query', 3)],
+    'SUPPORTKB': [('how do I reset a password', '/query/multi', 9)]
+}
+
+
+def test_selected_tables_loaded_in_rank_order():
+    """Representative queries contribute their main tables once each"""
+    tables = load_selected_tables()
+    assert tables[0] == 'db_order'
+    assert len(tables) == len(set(tables))
+    print(f'✅ {len(tables)} representative tables loaded')
+
+
+def test_plan_combines_popular_queries_and_tables():
+    """Popular queries are replayed per KB and tables only for database KBs"""
+    warmer = CacheWarmer(lambda: FakeConnection(POPULAR), lambda *item: None,
+                         top_n=5, selected_tables=['db_order', 'db_product'])
+
+    plan = warmer.plan({'DBKB': 'database', 'SUPPORTKB': 'support'})
+
+    assert plan == [
+        ('DBKB', '/query', 'show all open orders'),
+        ('DBKB', '/relationship', 'db_order'),
+        ('DBKB', '/relationship', 'db_product'),
+        ('SUPPORTKB', '/query/multi', 'how do I reset a password')
+    ]
+    print('✅ Warm-up plan built')
+
+
+def test_run_respects_concurrency_and_counts_failures():
+    """No more than `concurrency` queries run at once and failures are counted"""
+    in_flight = {'now': 0, 'max': 0}
+    lock = threading.Lock()
+
+    def replay(kb_id, endpoint, query_text):
+        with lock:
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+        time.sleep(0.02)
+        with lock:
+            in_flight['now'] -= 1
+        if endpoint == '/relationship':
+            raise RuntimeError('retrieval failed')
+
+    warmer = CacheWarmer(lambda: FakeConnection(POPULAR), replay, top_n=5, concurrency=2, rate=0,
+                         selected_tables=['db_product', 'db_invoice', 'db_ap'])
+    counts = warmer.run_once({'DBKB': 'database'})
+
+    assert counts == {'warmed': 1, 'failed': 4}
+    assert in_flight['max'] <= 2
+    assert warmer.stats['runs'] == 1
+    print('✅ Warm-up bounded by concurrency')
+
+
+def test_rate_limiter_spaces_calls():
+    """Calls are spaced 1/rate seconds apart"""
+    limiter = RateLimiter(50)
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    assert time.monotonic() - started >= 0.07
+    print('✅ Rate limiter spaces warm-up queries')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Test that chat DB connect failures are backed off instead of retried per request
+"""
+import sys
+sys.path.append('.')
+
+from mysql.connector import Error, pooling
+
+import app as dbkb_app
+
+
+def test_failed_connects_back_off(monkeypatch):
+    attempts = []
+
+    def failing_connect(*args, **kwargs):
+        attempts.append(1)
+        raise Error('Can\'t connect to MySQL server')
+
+    now = [1000.0]
+    monkeypatch.setattr(dbkb_app.time, 'time', lambda: now[0])
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_config', lambda: {})
+    monkeypatch.setattr(dbkb_app, 'chat_db_pool', None)
+    monkeypatch.setattr(dbkb_app, 'chat_db_retry_at', 0.0)
+    monkeypatch.setattr(pooling, 'MySQLConnectionPool', failing_connect)
+    monkeypatch.setattr(dbkb_app.mysql.connector, 'connect', failing_connect)
+
+    assert dbkb_app.get_chat_db_connection() is None
+    assert len(attempts) == 1  # the failed pool creation also skips the direct fallback
+
+    for _ in range(5):
+        assert dbkb_app.get_chat_db_connection() is None
+    assert len(attempts) == 1
+
+    now[0] += dbkb_app.CHAT_DB_RETRY_SECONDS + 1
+    assert dbkb_app.get_chat_db_connection() is None
+    assert len(attempts) == 2
+    print('✅ Chat DB connect failures backed off')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
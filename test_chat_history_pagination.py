@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test keyset pagination of chat session messages
+"""
+import sys
+import json
+from datetime import datetime, timedelta
+sys.path.append('.')
+
+from fastapi.testclient import TestClient
+
+import app as dbkb_app
+
+BASE_TIME = datetime(2025, 1, 1, 12, 0, 0)
+# Pairs of messages share a timestamp so the Id tie-breaker is exercised
+MESSAGES = [
+    {'Id': i, 'SessionId': 1, 'MessageType': 'user', 'Content': f"message {i}",
+     'CreatedAt': BASE_TIME + timedelta(seconds=i // 2), 'Metadata': '{"big": "blob"}',
+     'QueryType': None, 'EndpointUsed': None, 'ResponseTimeMs': None,
+     'QueryMode': None, 'SourceKnowledgeBase': None}
+    for i in range(1, 8)
+]
+
+
+class FakeCursor:
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, query, params=None):
+        if 'FROM chat_session' in query:
+            self.rows = [{'Id': 1}] if params[0] == 'known-session' else []
+            return
+        rows = [m for m in MESSAGES if m['SessionId'] == params[0]]
+        if 'CreatedAt <' in query:
+            created_at, _, message_id = params[1:4]
+            rows = [m for m in rows if (m['CreatedAt'], m['Id']) < (created_at, message_id)]
+        rows.sort(key=lambda m: (m['CreatedAt'], m['Id']), reverse=True)
+        self.rows = rows[:params[-1]]
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FailingCursor(FakeCursor):
+    def execute(self, query, params=None):
+        if 'FROM chat_message' in query:
+            raise RuntimeError('Lost connection to MySQL server')
+        super().execute(query, params)
+
+
+class FakeConnection:
+    def __init__(self, cursor_class=FakeCursor):
+        self.cursor_class = cursor_class
+
+    def cursor(self, dictionary=False):
+        return self.cursor_class()
+
+    def close(self):
+        pass
+
+
+def test_pages_walk_back_through_history(monkeypatch):
+    """Following nextCursor visits every message exactly once, newest first"""
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_connection', lambda: FakeConnection())
+    client = TestClient(dbkb_app.app)
+
+    seen = []
+    params = {'limit': 3}
+    while True:
+        response = client.get('/chat/session/known-session/messages', params=params)
+        assert response.status_code == 200
+        page = json.loads(response.text)
+        assert all('Metadata' not in m for m in page['messages'])
+        seen.extend(m['Id'] for m in page['messages'])
+        if not page['nextCursor']:
+            break
+        params = {'limit': 3, 'before': page['nextCursor']}
+
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+    print('✅ Keyset pagination walks full history')
+
+
+def test_field_projection(monkeypatch):
+    """Only the requested fields are returned and unknown fields are rejected"""
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_connection', lambda: FakeConnection())
+    client = TestClient(dbkb_app.app)
+
+    response = client.get('/chat/session/known-session/messages', params={'fields': 'Content,Metadata'})
+    message = json.loads(response.text)['messages'][0]
+    assert set(message) == {'Content', 'Metadata'}
+
+    response = client.get('/chat/session/known-session/messages', params={'fields': 'Password'})
+    assert response.status_code == 400
+
+    response = client.get('/chat/session/missing/messages')
+    assert response.status_code == 404
+    print('✅ Field projection and validation work')
+
+
+def test_db_error_returns_error_status(monkeypatch):
+    """A failing message query is reported before any of the body is sent"""
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_connection', lambda: FakeConnection(FailingCursor))
+    client = TestClient(dbkb_app.app)
+
+    response = client.get('/chat/session/known-session/messages')
+    assert response.status_code == 500
+    assert 'Lost connection' in response.json()['detail']
+    print('✅ DB errors surface as an error status')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test the write-behind chat message writer
+"""
+import sys
+sys.path.append('.')
+
+from utils.chat_writer import ChatMessageWriter
+
+
+class RecordingCursor:
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+
+    def execute(self, query, params=None):
+        self.db.statements.append((query, params))
+        if query.startswith('SELECT'):
+            self._rows = [(self.db.sessions[uuid], uuid, 7, 3) for uuid in params if uuid in self.db.sessions]
+
+    def executemany(self, query, rows):
+        if query.startswith('INSERT'):
+            if any(row[4] == 'poison' for row in rows):
+                raise ValueError('Data truncated for column')
+            self.db.batches.append(list(rows))
+        else:
+            self.db.session_updates.append(list(rows))
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class RecordingDB:
+    def __init__(self, sessions, fail=False):
+        self.sessions = sessions
+        self.fail = fail
+        self.statements = []
+        self.batches = []
+        self.session_updates = []
+        self.commits = 0
+
+    def connect(self):
+        if self.fail:
+            return None
+        return self
+
+    def cursor(self, dictionary=False):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_batches_messages_with_one_session_update():
+    """A flush inserts all buffered messages at once and touches each session once"""
+    db = RecordingDB({'session-a': 1, 'session-b': 2})
+    writer = ChatMessageWriter(db.connect, batch_size=10, flush_interval=60, max_queue_size=100)
+
+    for i in range(4):
+        assert writer.enqueue('session-a', 'user', f"message {i}", {'queryType': 'general'})
+    assert writer.enqueue('session-b', 'assistant', 'answer', {})
+
+    assert writer.flush()
+    assert len(db.batches) == 1 and len(db.batches[0]) == 5
+    assert db.session_updates == [[
+        (4, 'message 3', 'message 3', 1),
+        (1, None, None, 2)
+    ]]
+    assert writer.pending() == 0
+    print('✅ Messages written with executemany and one session update per batch')
+
+
+def test_buffer_is_bounded():
+    """Enqueue refuses new messages once the buffer is full"""
+    db = RecordingDB({'session-a': 1})
+    writer = ChatMessageWriter(db.connect, batch_size=10, flush_interval=60, max_queue_size=2)
+
+    assert writer.enqueue('session-a', 'user', 'one')
+    assert writer.enqueue('session-a', 'user', 'two')
+    assert not writer.enqueue('session-a', 'user', 'three')  # does not wait for room by default
+    assert not writer.enqueue('session-a', 'user', 'four', timeout=0.01)
+    assert writer.stats['dropped'] == 2
+    print('✅ Write buffer is bounded')
+
+
+def test_stop_drains_buffer():
+    """Stopping the writer flushes everything still buffered"""
+    db = RecordingDB({'session-a': 1})
+    writer = ChatMessageWriter(db.connect, batch_size=3, flush_interval=60, max_queue_size=100)
+    writer.start()
+
+    for i in range(7):
+        writer.enqueue('session-a', 'user', f"message {i}")
+    writer.stop()
+
+    assert writer.pending() == 0
+    assert sum(len(batch) for batch in db.batches) == 7
+    print('✅ Shutdown flush drains the buffer')
+
+
+def test_failed_batches_are_retried_then_dropped():
+    """A batch that cannot be written is retried up to max_attempts"""
+    db = RecordingDB({'session-a': 1}, fail=True)
+    writer = ChatMessageWriter(db.connect, batch_size=10, flush_interval=60, max_attempts=2)
+    writer.enqueue('session-a', 'user', 'lost')
+
+    assert not writer.flush()
+    assert writer.pending() == 1
+    assert not writer.flush()
+    assert writer.pending() == 0
+    assert writer.stats['dropped'] == 1
+    print('✅ Failed batches retried then dropped')
+
+
+def test_bad_row_does_not_sink_the_batch():
+    """A batch with one unwritable message writes the rest and retries only that message"""
+    db = RecordingDB({'session-a': 1, 'session-b': 2})
+    writer = ChatMessageWriter(db.connect, batch_size=10, flush_interval=60, max_attempts=2)
+    writer.enqueue('session-a', 'user', 'fine')
+    writer.enqueue('session-a', 'user', 'poison')
+    writer.enqueue('session-b', 'assistant', 'also fine')
+
+    assert writer.flush()
+    assert [batch[0][4] for batch in db.batches] == ['fine', 'also fine']
+    assert writer.pending() == 1
+    assert not writer.flush()
+    assert writer.pending() == 0
+    assert writer.stats['written'] == 2 and writer.stats['dropped'] == 1
+    print('✅ Only the bad message is dropped')
+
+
+def test_invalid_messages_rejected_on_enqueue():
+    db = RecordingDB({'session-a': 1})
+    writer = ChatMessageWriter(db.connect, batch_size=10, flush_interval=60)
+    for message_type, metadata in (('bot', {}), ('user', {'metadata': '{not json'})):
+        try:
+            writer.enqueue('session-a', message_type, 'hi', metadata)
+            raise AssertionError('invalid message accepted')
+        except ValueError:
+            pass
+    assert writer.enqueue('session-a', 'user', 'hi', {'metadata': {'source': 'widget'}})
+    assert writer._buffer[0]['metadata'] == '{"source": "widget"}'
+    assert writer.pending() == 1
+
+
+if __name__ == "__main__":
+    test_batches_messages_with_one_session_update()
+    test_buffer_is_bounded()
+    test_stop_drains_buffer()
+    test_failed_batches_are_retried_then_dropped()
+    test_bad_row_does_not_sink_the_batch()
+    test_invalid_messages_rejected_on_enqueue()
+    print("\n🎉 All chat writer tests passed!")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test query-focused compression of retrieved table docs
+"""
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from src.advanced_retrieval.compression import compress_context, compress_contexts, query_terms
+from src.advanced_retrieval.thinking_trace import ThinkingTrace
+from src.documentation.schema_to_markdown import SchemaMarkdownGenerator
+
+
+def order_table_doc():
+    """Table doc for db_order as written by the schema doc generator"""
+    columns = {
+        'order_id': {'data_type': 'int', 'is_primary_key': True, 'is_nullable': False},
+        'customer_id': {'data_type': 'int', 'foreign_key': {'table': 'db_customer'}},
+        'ship_date': {'data_type': 'datetime', 'description': 'Date shipped', 'has_index': True},
+        'status': {'data_type': 'varchar(20)', 'description': 'Open or closed'},
+    }
+    columns.update({f'misc_{i}': {'data_type': 'varchar(50)', 'description': f'Spare field {i}'}
+                    for i in range(20)})
+    table = {
+        'description': 'Work orders',
+        'columns': columns,
+        'primary_key': ['order_id'],
+        'foreign_keys': [{'column': 'customer_id',
+                          'references': {'table': 'db_customer', 'column': 'customer_id'}}],
+        'referenced_by': [{'table': 'db_orderitem', 'column': 'order_id', 'via_foreign_key': 'fk_item'},
+                          {'table': 'db_invoice', 'column': 'order_id', 'via_foreign_key': 'fk_invoice'}],
+        'indexes': [{'name': 'ix_ship_date', 'columns': ['ship_date']},
+                    {'name': 'ix_misc_3', 'columns': ['misc_3']}]
+    }
+    out_dir = tempfile.mkdtemp()
+    SchemaMarkdownGenerator({'tables': {'db_order': table}}, out_dir).generate_table_doc('db_order', table)
+    with open(os.path.join(out_dir, 'tables', 'db_order.md'), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_query_terms():
+    terms = query_terms('SELECT * FROM db_orderitem WHERE ship_date > NOW()')
+    assert {'db_orderitem', 'orderitem', 'ship_date', 'ship', 'date'} <= terms
+    assert 'select' not in terms and 'from' not in terms
+    print('✅ Query terms')
+
+
+def test_keeps_relevant_rows_and_key_sections():
+    """Matching columns, key columns, relationship sections and matching joins survive"""
+    doc = order_table_doc()
+    compressed = compress_context(doc, query_terms('orders shipped by ship_date with their invoices'))
+
+    assert compressed.startswith('[TABLE: db_order]\n# Table: db_order')
+    assert compressed.rstrip().endswith('[/TABLE: db_order]')
+    assert '| ship_date |' in compressed
+    assert '| order_id |' in compressed and '| customer_id |' in compressed  # key columns
+    assert 'misc_7' not in compressed
+    assert '## Referenced By' in compressed and 'db_orderitem' in compressed
+    assert '| ix_ship_date |' in compressed and 'ix_misc_3' not in compressed
+    assert '### Join with db_invoice (referencing)' in compressed
+    assert 'Join with db_customer' not in compressed
+    assert len(compressed) < len(doc) / 2
+    print('✅ Table doc compressed to the relevant parts')
+
+
+def test_unrelated_context_is_unchanged():
+    guide = "# Business Glossary\n\n## Billing\n\nInvoices are raised monthly.\n"
+    assert compress_context(guide, query_terms('warehouse bins')) == guide
+    assert compress_context(guide, set()) == guide
+    print('✅ Contexts without a match are left alone')
+
+
+def test_reduction_reported_in_trace():
+    doc = order_table_doc()
+    result = compress_contexts('open orders by status', [doc])
+    assert result.tokens_after < result.tokens_before
+    assert '| status |' in result.texts[0]
+
+    trace = ThinkingTrace('Multi-Strategy Retrieval Process')
+    with trace.stage('Answer generation') as stage:
+        result.report(stage)
+    assert stage.counts['Compressed context tokens (estimated)'].startswith(
+        f"{result.tokens_before} -> {result.tokens_after}")
+    print('✅ Token reduction in the trace')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test the token-budgeted context packer used for generation prompts
+"""
+import sys
+sys.path.append('.')
+
+from src.advanced_retrieval.context_packer import (
+    CONTEXT_SEPARATOR, estimate_tokens, pack_contexts, split_sections
+)
+from src.advanced_retrieval.thinking_trace import ThinkingTrace
+
+
+def table_doc(name, columns):
+    rows = "\n".join(f"| {name}_col{i} | varchar(50) | YES | NULL | Column {i} of {name} |  |  |  |"
+                     for i in range(columns))
+    return (f"[TABLE: {name}]\n# Table: {name}\n\nStores {name} records.\n\n"
+            f"## Quick Statistics\n\n- **Columns**: {columns}\n\n"
+            f"## Columns\n\n| Column Name | Data Type | Nullable | Default | Description | PK | FK | Indexed |\n"
+            f"{rows}\n")
+
+
+def test_estimate_tokens():
+    """Prose is ~4 chars per token; punctuation-heavy markdown counts each symbol"""
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('a' * 400) == 100
+    assert estimate_tokens('| a | b |') == 5
+    print('✅ Token estimate')
+
+
+def test_everything_fits_within_budget():
+    texts = [table_doc('db_order', 3), table_doc('db_customer', 3)]
+    packed = pack_contexts(texts, 10000)
+    assert packed.texts == texts
+    assert packed.join() == CONTEXT_SEPARATOR.join(texts)
+    assert not packed.truncated and not packed.dropped
+    print('✅ Small contexts packed whole')
+
+
+def test_truncates_at_section_boundary():
+    """The context that overflows is cut before a section, never mid-table"""
+    first = table_doc('db_order', 5)
+    second = table_doc('db_customer', 200)
+    budget = estimate_tokens(first) + 150
+    packed = pack_contexts([first, second], budget)
+
+    assert packed.tokens <= budget
+    assert packed.texts[0] == first
+    assert packed.truncated == [1]
+    cut = packed.texts[1]
+    assert cut.startswith('[TABLE: db_customer]')
+    assert '## Quick Statistics' in cut
+    assert '## Columns' not in cut
+    print('✅ Truncated at a section boundary')
+
+
+def test_drops_and_keeps_filling_by_priority():
+    big = 'db_order notes ' * 2000  # no section to cut at
+    small = table_doc('db_customer', 2)
+    packed = pack_contexts(['x' * 20, big, small], estimate_tokens(small) + 40)
+    assert packed.dropped == [1]
+    assert packed.texts == ['x' * 20, small]
+    print('✅ Lower-priority contexts fill the leftover budget')
+
+
+def test_zero_budget_is_unlimited_and_report():
+    texts = [table_doc('db_order', 50)] * 3
+    assert pack_contexts(texts, 0).texts == texts
+
+    trace = ThinkingTrace('SQL Optimization')
+    budget = estimate_tokens(texts[0]) + 120
+    with trace.stage('Optimization analysis') as stage:
+        packed = pack_contexts(texts, budget)
+        packed.report(stage)
+    assert packed.tokens <= budget
+    assert stage.counts['Contexts packed'] == f"{len(packed.texts)} of 3"
+    assert stage.notes[0] == 'Truncated at a section boundary: context ' + ', '.join(
+        str(i + 1) for i in packed.truncated)
+    assert packed.truncated[0] == 1
+    print('✅ Packing reported in the trace')
+
+
+def test_split_sections():
+    sections = split_sections(table_doc('db_order', 1))
+    assert sections[0] == '[TABLE: db_order]\n'
+    assert sections[-1].startswith('## Columns')
+    print('✅ Section split')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
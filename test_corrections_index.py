@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test the in-memory corrections index used by get_relevant_corrections
+"""
+import sys
+from datetime import datetime
+sys.path.append('.')
+
+from src.advanced_retrieval.corrections_index import CorrectionsIndex
+from src.training.feedback_processor import generalize_query_pattern
+
+
+def _row(row_id, query, response, status='validated', second=0):
+    return {
+        'Id': row_id,
+        'QueryPattern': generalize_query_pattern(query),
+        'CorrectResponse': response,
+        'ValidationStatus': status,
+        'UpdatedAt': datetime(2025, 1, 1, 12, 0, second)
+    }
+
+
+def test_similar_question_finds_correction():
+    """A rephrased question matches the stored correction pattern"""
+    index = CorrectionsIndex('KRD3MW7QFS')
+    index.apply_rows([
+        _row(1, 'Show me all sales orders by payment date',
+             'SELECT * FROM db_order WHERE DatePaid != "0000-00-00" ORDER BY DatePaid'),
+        _row(2, 'List customers with overdue invoices', 'SELECT * FROM db_customer c JOIN db_invoice i ...'),
+    ])
+
+    matches = index.search('sales orders sorted by payment date')
+    assert matches and matches[0]['id'] == 1
+    assert 'db_order' in matches[0]['correct_response']
+    assert index.search('how many warehouses are there') == []
+    print('✅ Similar questions find their corrections')
+
+
+def test_incremental_updates_follow_validation_status():
+    """Rows that stop being validated drop out and the watermark advances"""
+    index = CorrectionsIndex('KRD3MW7QFS')
+    index.apply_rows([_row(1, 'total payments per customer', 'SELECT ...', second=1)])
+    assert len(index) == 1
+
+    index.apply_rows([_row(1, 'total payments per customer', 'SELECT ...', status='rejected', second=5)])
+    assert len(index) == 0
+    assert index.search('total payments per customer') == []
+    assert index.watermark == datetime(2025, 1, 1, 12, 0, 5)
+    print('✅ Incremental updates honour validation status')
+
+
+def test_refresh_reads_since_watermark():
+    """After the first load only rows changed since the watermark are requested"""
+    queries = []
+
+    class FakeDB:
+        def cursor(self, dictionary=False):
+            return self
+
+        def execute(self, query, params):
+            queries.append((query, params))
+
+        def fetchall(self):
+            return [_row(len(queries), 'payments by month', 'SELECT ...', second=len(queries))]
+
+        def close(self):
+            pass
+
+    index = CorrectionsIndex('KRD3MW7QFS', connection_factory=FakeDB)
+    index.refresh()
+    index.refresh()
+
+    assert "ValidationStatus = 'validated'" in queries[0][0]
+    assert 'UpdatedAt >=' in queries[1][0]
+    assert queries[1][1][1] == datetime(2025, 1, 1, 12, 0, 1)
+    assert len(index) == 2
+    print('✅ Refresh is incremental by UpdatedAt watermark')
+
+
+if __name__ == "__main__":
+    test_similar_question_finds_correction()
+    test_incremental_updates_follow_validation_status()
+    test_refresh_reads_since_watermark()
+    print("\n🎉 All corrections index tests passed!")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test chunked processing of pending feedback
+"""
+import sys
+sys.path.append('.')
+
+from src.training.feedback_processor import FeedbackProcessor
+
+
+class FeedbackDB:
+    """In-memory query_feedback/training_data tables recording statement counts"""
+
+    def __init__(self, pending, fail_chunk_containing=None):
+        self.feedback = {
+            i: {'Id': i, 'CompanyId': 2, 'KnowledgeBaseId': 'KRD3MW7QFS',
+                'OriginalQuery': f"show me sales orders {i}", 'OriginalResponse': 'SELECT 1',
+                'CorrectedResponse': 'SELECT 2', 'FeedbackNotes': None, 'ProcessingStatus': 'pending'}
+            for i in range(1, pending + 1)
+        }
+        self.training_data = []
+        self.fail_chunk_containing = fail_chunk_containing
+        self.staged = None
+        self.commits = 0
+        self.inserts = 0
+        self.status_updates = 0
+        self.page_sizes = []
+
+    def cursor(self, dictionary=False):
+        return FeedbackCursor(self, dictionary)
+
+    def commit(self):
+        if self.staged:
+            feedback_ids, rows = self.staged
+            self.training_data.extend(rows)
+            for feedback_id in feedback_ids:
+                self.feedback[feedback_id]['ProcessingStatus'] = 'reviewed'
+        self.staged = None
+        self.commits += 1
+
+    def rollback(self):
+        self.staged = None
+
+
+class FeedbackCursor:
+    def __init__(self, db, dictionary):
+        self.db = db
+        self.dictionary = dictionary
+        self.result = []
+        self.lastrowid = 1
+
+    def execute(self, query, params=()):
+        query = ' '.join(query.split())
+        pending = [f for f in self.db.feedback.values() if f['ProcessingStatus'] == 'pending']
+        if query.startswith('SELECT COUNT(*)'):
+            self.result = [{'total': len(pending)}]
+        elif query.startswith('SELECT Id, CompanyId'):
+            last_id, limit = params[2], params[3]
+            page = sorted((f for f in pending if f['Id'] > last_id), key=lambda f: f['Id'])[:limit]
+            self.db.page_sizes.append(len(page))
+            self.result = [dict(f) for f in page]
+        elif query.startswith('SELECT Id FROM training_data'):
+            self.result = [(1000 + feedback_id,) for feedback_id in params]
+        elif query.startswith('UPDATE query_feedback'):
+            self.db.status_updates += 1
+            if self.db.fail_chunk_containing in params:
+                raise RuntimeError('lock wait timeout')
+            self.db.staged = (list(params), self.db.staged_rows)
+        else:
+            self.result = []
+
+    def executemany(self, query, rows):
+        self.db.inserts += 1
+        self.db.staged_rows = list(rows)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+def _processor(chunk_size):
+    processor = FeedbackProcessor.__new__(FeedbackProcessor)
+    processor.chunk_size = chunk_size
+    processor.region = 'us-east-1'
+    # Keep the test focused on the chunked training-data stage
+    processor.generate_corrected_documentation = lambda ids, connection: []
+    return processor
+
+
+def test_feedback_processed_in_chunks():
+    """Each chunk is one insert, one status update and one commit"""
+    db = FeedbackDB(pending=7)
+    progress = []
+
+    result = _processor(3).process_pending_feedback('KRD3MW7QFS', 2, db, progress.append)
+
+    assert result['processed'] == 7
+    assert db.page_sizes == [3, 3, 1, 0]
+    assert db.inserts == 3 and db.status_updates == 3
+    assert all(f['ProcessingStatus'] == 'reviewed' for f in db.feedback.values())
+    assert progress[-1]['processed'] == 7 and progress[-1]['total'] == 7
+    print('✅ Feedback processed in bounded chunks')
+
+
+def test_failed_chunk_stays_pending():
+    """A failing chunk is rolled back without blocking the chunks after it"""
+    db = FeedbackDB(pending=6, fail_chunk_containing=3)
+
+    result = _processor(2).process_pending_feedback('KRD3MW7QFS', 2, db)
+
+    assert result['processed'] == 4 and result['failed'] == 2
+    assert db.feedback[3]['ProcessingStatus'] == 'pending'
+    assert db.feedback[4]['ProcessingStatus'] == 'pending'
+    assert db.feedback[5]['ProcessingStatus'] == 'reviewed'
+    print('✅ Failed chunk rolled back and left pending')
+
+
+if __name__ == "__main__":
+    test_feedback_processed_in_chunks()
+    test_failed_chunk_stays_pending()
+    print("\n🎉 All feedback chunking tests passed!")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test rank fusion of multi-strategy retrieval results
+"""
+import sys
+sys.path.append('.')
+
+import numpy as np
+import pytest
+
+from src.advanced_retrieval.context import RetrievedContext
+from src.advanced_retrieval.fusion import (
+    fuse, reciprocal_rank_fusion, weighted_score_fusion, results_per_list
+)
+
+
+def ctx(text, score):
+    return RetrievedContext(text, score=score)
+
+
+# The HyDE list scores far higher in absolute terms than the query list
+STANDARD = [ctx('db_order', 0.42), ctx('db_orderitem', 0.40), ctx('db_customer', 0.35)]
+HYDE = [ctx('db_stock', 0.91), ctx('db_order', 0.89), ctx('db_bom', 0.88)]
+
+
+def test_rrf_rewards_agreement_over_raw_score():
+    """A chunk ranked well by both strategies beats a single high raw score"""
+    contexts, scores = reciprocal_rank_fusion([STANDARD, HYDE], top_k=3)
+    assert contexts[0].content == 'db_order'
+    assert np.all(np.diff(scores) <= 0)
+    print('✅ RRF ranks consensus first')
+
+
+def test_fused_context_keeps_best_instance():
+    """The merged context is the highest-scoring copy of the chunk"""
+    contexts, _ = reciprocal_rank_fusion([STANDARD, HYDE])
+    assert contexts[0].score == 0.89
+    assert len(contexts) == 5
+    print('✅ Best instance kept')
+
+
+def test_weights_shift_the_ranking():
+    """Weighting a strategy pulls its top results up"""
+    contexts = fuse([STANDARD, HYDE], top_k=2, weights=[0.1, 1.0])
+    assert [c.content for c in contexts] == ['db_order', 'db_stock']
+    print('✅ Strategy weights applied')
+
+
+def test_weighted_score_fusion_normalizes_per_list():
+    """Min-max normalization puts each list's best result on the same scale"""
+    contexts, scores = weighted_score_fusion([STANDARD, HYDE], top_k=2)
+    assert contexts[0].content == 'db_order'
+    assert scores[0] == pytest.approx(1.0 + (0.89 - 0.88) / (0.91 - 0.88))
+    print('✅ Weighted score fusion')
+
+
+def test_empty_lists_and_bad_method():
+    """Empty inputs fuse to nothing and unknown methods are rejected"""
+    assert fuse([[], []], top_k=5) == []
+    with pytest.raises(ValueError):
+        fuse([STANDARD], method='borda')
+    print('✅ Edge cases handled')
+
+
+def test_results_per_list():
+    """Per-call result counts shrink as the number of lists grows"""
+    assert results_per_list(5, 5) == 2
+    assert results_per_list(10, 2) == 10
+    assert results_per_list(2, 6) == 2
+    print('✅ Per-list fetch sizing')
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test doc metadata sidecars and table-filtered knowledge base retrieval
+"""
+import json
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from src.advanced_retrieval.metadata_filter import detect_tables, load_known_tables, resolve_tables, table_filter
+from src.advanced_retrieval.retrieval_techniques import AdvancedRetrieval
+from src.documentation.queries_to_markdown import QueryMarkdownGenerator
+from src.documentation.schema_to_markdown import SchemaMarkdownGenerator
+
+KNOWN_TABLES = {'db_order', 'db_orderitem', 'db_customer'}
+
+
+class FilteringKBClient:
+    """Returns nothing for filtered searches when ``empty_when_filtered`` is set"""
+
+    def __init__(self, empty_when_filtered=False):
+        self.empty_when_filtered = empty_when_filtered
+        self.configs = []
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration):
+        config = retrievalConfiguration['vectorSearchConfiguration']
+        self.configs.append(config)
+        if self.empty_when_filtered and 'filter' in config:
+            return {'retrievalResults': []}
+        return {'retrievalResults': [
+            {'content': {'text': '[TABLE: db_stock] stock levels'}, 'score': 0.7}
+        ]}
+
+
+def read_metadata(path):
+    with open(f"{path}.metadata.json", encoding='utf-8') as f:
+        return json.load(f)['metadataAttributes']
+
+
+def test_schema_docs_have_sidecars():
+    schema = {'tables': {'db_order': {'columns': {'order_id': {'data_type': 'int'}}}}}
+    out_dir = tempfile.mkdtemp()
+    SchemaMarkdownGenerator(schema, out_dir).generate_all_docs()
+
+    assert read_metadata(os.path.join(out_dir, 'tables', 'db_order.md')) == {
+        'doc_type': 'table', 'category': 'schema', 'table_name': 'db_order'
+    }
+    assert read_metadata(os.path.join(out_dir, 'index.md')) == {'doc_type': 'index', 'category': 'schema'}
+    assert read_metadata(os.path.join(out_dir, 'relationships', 'relationships_summary.md'))['doc_type'] == 'relationships'
+    print('✅ Schema doc metadata sidecars')
+
+
+def test_query_docs_have_sidecars():
+    queries = [{'category': 'Order Management', 'tables_referenced': ['db_order'], 'sql_text': 'SELECT 1'}] * 2
+    out_dir = tempfile.mkdtemp()
+    QueryMarkdownGenerator(queries, out_dir).generate_all_docs()
+
+    assert read_metadata(os.path.join(out_dir, 'query_patterns', 'order_management.md')) == {
+        'doc_type': 'query_pattern', 'category': 'Order Management'
+    }
+    assert read_metadata(os.path.join(out_dir, 'tables_usage', 'db_order.md'))['table_name'] == 'db_order'
+    print('✅ Query doc metadata sidecars')
+
+
+def test_detect_tables_and_filter():
+    assert detect_tables('open orders with their order items for db_orderitem', KNOWN_TABLES) == [
+        'db_order', 'db_orderitem'
+    ]
+    assert detect_tables('what is the ship_date column?', KNOWN_TABLES) == []
+    assert table_filter([]) is None
+    assert table_filter(['db_order']) == {'orAll': [
+        {'in': {'key': 'table_name', 'value': ['db_order']}},
+        {'notIn': {'key': 'doc_type', 'value': ['table', 'table_usage']}}
+    ]}
+    assert 'db_order' in load_known_tables()
+    print('✅ Table detection and filter')
+
+
+def test_retrieval_passes_filter_and_falls_back():
+    retriever = AdvancedRetrieval(kb_id='test')
+    retriever.known_tables = set(KNOWN_TABLES)
+    retriever.kb_client = FilteringKBClient()
+
+    retriever.standard_query('count customers by region')
+    assert retriever.kb_client.configs[0]['filter']['orAll'][0]['in']['value'] == ['db_customer']
+    # Tables seen in results become detectable
+    assert 'db_stock' in retriever.known_tables
+
+    retriever.kb_client = FilteringKBClient(empty_when_filtered=True)
+    contexts = retriever.kb_retrieve('orders', 3, ['db_order'])
+    assert len(contexts) == 1
+    assert ['filter' in config for config in retriever.kb_client.configs] == [True, False]
+    print('✅ Filtered retrieval with unfiltered fallback')
+
+
+def test_resolve_explicit_table_names():
+    """Case and schema prefixes do not stop a name from resolving; unknown names give no filter"""
+    assert resolve_tables(['DB_Order', 'dbo.db_orderitem', '[dbo].[db_customer]'], KNOWN_TABLES) == [
+        'db_customer', 'db_order', 'db_orderitem'
+    ]
+    assert resolve_tables(['dbo', 'nope'], KNOWN_TABLES) == []
+
+
+def test_relationship_and_optimize_filter_on_resolved_names():
+    retriever = AdvancedRetrieval(kb_id='test')
+    retriever.known_tables = set(KNOWN_TABLES)
+    retriever.kb_client = FilteringKBClient()
+    retriever.bedrock_client = None  # analysis fails; only the retrieval calls matter here
+
+    retriever.relationship_retrieval('DB_ORDER')
+    assert retriever.kb_client.configs[0]['filter']['orAll'][0]['in']['value'] == ['db_order']
+
+    retriever.kb_client = FilteringKBClient()
+    retriever.optimize_sql_query('SELECT * FROM dbo.db_order o JOIN unknown_table u ON 1 = 1')
+    filtered = [config['filter']['orAll'][0]['in']['value'] for config in retriever.kb_client.configs
+                if 'filter' in config]
+    assert filtered and all(value == ['db_order'] for value in filtered)
+    print('✅ Explicit table names resolved before filtering')
+
+
+def test_fallback_when_filter_returns_no_doc_for_the_table():
+    """Non-table docs alone do not count as a successful filtered search"""
+    retriever = AdvancedRetrieval(kb_id='test')
+    retriever.known_tables = set(KNOWN_TABLES)
+    retriever.kb_client = FilteringKBClient()  # only ever returns the db_stock doc
+
+    retriever.kb_retrieve('orders', 3, ['db_order'])
+    assert ['filter' in config for config in retriever.kb_client.configs] == [True, False]
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
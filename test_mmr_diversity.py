@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test MMR diversification of the final context selection
+"""
+import sys
+sys.path.append('.')
+
+import numpy as np
+
+from src.advanced_retrieval.context import RetrievedContext
+from src.advanced_retrieval.diversity import mmr_select, term_vectors
+
+
+def table_doc(table, variant):
+    return RetrievedContext(f'[TABLE: {table}] {table} columns Wo Status ShipDate CustomerId part {variant}')
+
+
+ORDER_DOCS = [table_doc('db_order', i) for i in range(4)]
+JOIN_DOCS = [RetrievedContext('[TABLE: db_orderitem] Item Qty SubTotal ItemBatch references Wo'),
+             RetrievedContext('[TABLE: db_customer] CustomerId Name Terms SalespersonId')]
+POOL = ORDER_DOCS + JOIN_DOCS
+
+
+def test_lambda_one_keeps_ranking():
+    """lambda = 1 is plain top-k of the ranked pool"""
+    assert mmr_select(POOL, 3, mmr_lambda=1.0) == POOL[:3]
+    print('✅ Ranking preserved at lambda 1')
+
+
+def test_diverse_tables_selected():
+    """Lower lambda brings in other tables instead of copies of the first"""
+    selected = mmr_select(POOL, 3, mmr_lambda=0.5)
+    assert selected[0] is POOL[0]
+    assert JOIN_DOCS[0] in selected and JOIN_DOCS[1] in selected
+    print('✅ Join tables selected')
+
+
+def test_small_pool_and_zero_k():
+    """Pools no larger than k are returned whole; k = 0 selects nothing"""
+    assert mmr_select(POOL[:2], 5, 0.5) == POOL[:2]
+    assert mmr_select(POOL, 0, 0.5) == []
+    print('✅ Edge cases')
+
+
+def test_term_vectors_are_normalized():
+    """Rows are unit length so dot products are cosine similarities"""
+    vectors = term_vectors(POOL)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    print('✅ Normalized term vectors')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
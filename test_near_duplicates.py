@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Test MinHash near-duplicate suppression of retrieved contexts
+"""
+import sys
+sys.path.append('.')
+
+from src.advanced_retrieval.context import RetrievedContext
+from src.advanced_retrieval.near_duplicates import filter_near_duplicates, minhash, containment
+
+COLUMNS = ' '.join(f'Column{i} stores value {i} for the order row' for i in range(40))
+PARENT = f'[TABLE: db_order]\n## Columns\n{COLUMNS}'
+CHILD = PARENT[:len(PARENT) // 2]
+OTHER = ' '.join(f'Invoice line {i} references product {i * 7} and tax code {i % 5}' for i in range(40))
+
+
+def test_identical_text_is_fully_contained():
+    """Identical texts estimate containment 1.0 and disjoint texts near 0"""
+    assert containment(minhash(PARENT), minhash(PARENT)) == 1.0
+    assert containment(minhash(PARENT), minhash(OTHER)) < 0.2
+    print('✅ Containment estimates')
+
+
+def test_overlapping_chunk_is_suppressed():
+    """A child chunk contained in a higher-ranked parent chunk is dropped"""
+    parent, child, other = RetrievedContext(PARENT), RetrievedContext(CHILD), RetrievedContext(OTHER)
+    kept = filter_near_duplicates([parent, child, other], threshold=0.8)
+    assert kept == [parent, other]
+    print('✅ Overlapping chunk suppressed')
+
+
+def test_limit_fills_slots_after_skipping_duplicates():
+    """The limit counts kept contexts, so a skipped duplicate frees its slot"""
+    parent, child, other = RetrievedContext(PARENT), RetrievedContext(CHILD), RetrievedContext(OTHER)
+    assert filter_near_duplicates([parent, child, other], threshold=0.8, limit=2) == [parent, other]
+    print('✅ Slots refilled after skipping')
+
+
+def test_threshold_disables_filter():
+    """A threshold outside (0, 1) keeps everything"""
+    contexts = [RetrievedContext(PARENT), RetrievedContext(CHILD)]
+    assert filter_near_duplicates(contexts, threshold=0) == contexts
+    print('✅ Filter can be disabled')
+
+
+def test_signature_cached_on_context():
+    """The signature is computed once per context"""
+    context = RetrievedContext(PARENT)
+    filter_near_duplicates([context, RetrievedContext(OTHER)])
+    first = context.signature
+    filter_near_duplicates([context])
+    assert first is not None and context.signature is first
+    print('✅ Signature cached')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
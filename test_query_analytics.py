@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test the in-memory query analytics aggregator
+"""
+import sys
+sys.path.append('.')
+
+from utils.query_analytics import UPSERT_ANALYTIC_SQL, QueryAnalyticsAggregator, query_hash
+
+
+class RecordingCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, params=None):
+        self.db.company_lookups.append(list(params))
+
+    def fetchall(self):
+        return [(company_id, code) for code, company_id in self.db.companies.items()]
+
+    def executemany(self, query, rows):
+        self.db.upserts.append(list(rows))
+
+    def close(self):
+        pass
+
+
+class RecordingDB:
+    def __init__(self, companies, available=True):
+        self.companies = companies
+        self.available = available
+        self.company_lookups = []
+        self.upserts = []
+
+    def connect(self):
+        return self if self.available else None
+
+    def cursor(self, dictionary=False):
+        return RecordingCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_normalized_queries_share_a_hash():
+    """Case, whitespace and trailing punctuation do not split counters"""
+    assert query_hash("Show me  all orders?") == query_hash("show me all orders")
+    assert query_hash("show me all orders") != query_hash("show me all customers")
+    print('✅ Query normalization validated')
+
+
+def test_flush_upserts_aggregated_counters():
+    """Repeated queries are flushed as a single row with summed usage"""
+    db = RecordingDB({'TEST001': 5})
+    analytics = QueryAnalyticsAggregator(db.connect, flush_interval=60)
+
+    analytics.record('TEST001', 'KRD3MW7QFS', 'Show me all orders', 100, endpoint='/query')
+    analytics.record('TEST001', 'KRD3MW7QFS', 'show me all orders?', 300, endpoint='/query')
+    analytics.record('TEST001', 'KRD3MW7QFS', 'list customers', 50, endpoint='/query')
+    analytics.record('UNKNOWN', 'KRD3MW7QFS', 'list customers', 50, endpoint='/query')
+
+    assert analytics.flush() == 2
+    rows = {row[3]: row for row in db.upserts[0]}
+    orders = rows[query_hash('show me all orders')]
+    assert orders[0] == 5 and orders[6] == 200 and orders[9] == 2
+    assert analytics.pending() == 0
+    print('✅ Aggregated counters flushed with one bulk upsert')
+
+
+def test_counters_survive_unavailable_database():
+    """Counters are kept for the next flush when the database is down"""
+    db = RecordingDB({'TEST001': 5}, available=False)
+    analytics = QueryAnalyticsAggregator(db.connect, flush_interval=60)
+
+    analytics.record('TEST001', 'KRD3MW7QFS', 'list customers', 40)
+    assert analytics.flush() == 0
+    analytics.record('TEST001', 'KRD3MW7QFS', 'list customers', 60)
+
+    db.available = True
+    assert analytics.flush() == 1
+    row = db.upserts[0][0]
+    assert row[6] == 50 and row[9] == 2
+    print('✅ Counters retained across failed flush')
+
+
+def test_same_query_on_two_kbs_stays_separate():
+    """Counters are per KB and the upsert never moves a row to another KB"""
+    db = RecordingDB({'TEST001': 5})
+    analytics = QueryAnalyticsAggregator(db.connect, flush_interval=60)
+
+    analytics.record('TEST001', 'KB-A', 'list customers', 40)
+    analytics.record('TEST001', 'KB-B', 'list customers', 60)
+
+    assert analytics.flush() == 2
+    assert sorted(row[1] for row in db.upserts[0]) == ['KB-A', 'KB-B']
+    assert 'KnowledgeBaseId = VALUES' not in UPSERT_ANALYTIC_SQL
+    print('✅ Per-KB counters kept apart')
+
+
+if __name__ == "__main__":
+    test_normalized_queries_share_a_hash()
+    test_flush_upserts_aggregated_counters()
+    test_counters_survive_unavailable_database()
+    test_same_query_on_two_kbs_stays_separate()
+    print("\n🎉 All query analytics tests passed!")
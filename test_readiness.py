@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test startup warm-up and /ready gating
+"""
+import sys
+sys.path.append('.')
+
+from fastapi.testclient import TestClient
+
+import app as dbkb_app
+
+
+def _reset_warmup(monkeypatch, ready):
+    monkeypatch.setitem(dbkb_app.warmup_state, 'ready', ready)
+    monkeypatch.setitem(dbkb_app.warmup_state, 'steps', {})
+
+
+def test_ready_returns_503_until_warm(monkeypatch):
+    """/ready fails while warm-up is running and /health stays up"""
+    _reset_warmup(monkeypatch, False)
+    client = TestClient(dbkb_app.app)
+
+    assert client.get('/ready').status_code == 503
+    assert client.get('/health').status_code == 200
+
+    monkeypatch.setitem(dbkb_app.warmup_state, 'ready', True)
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.json()['ready'] is True
+    print('✅ /ready gated on warm-up')
+
+
+def test_failed_steps_do_not_block_readiness(monkeypatch):
+    """Warm-up records failing steps and still reports ready"""
+    _reset_warmup(monkeypatch, False)
+
+    def unavailable():
+        return None
+
+    def no_aws(kb_id):
+        raise RuntimeError('no AWS credentials')
+
+    import utils.retrieval
+    monkeypatch.setattr(dbkb_app, 'get_db_credentials', lambda: {})
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_connection', unavailable)
+    monkeypatch.setattr(dbkb_app, 'load_application_kbs', unavailable)
+    monkeypatch.setattr(utils.retrieval, 'create_retrieval_client', no_aws)
+    monkeypatch.setattr(dbkb_app, 'retrieval_clients', {})
+    monkeypatch.setattr(dbkb_app, 'retrieval_client', None)
+
+    dbkb_app.warm_up()
+
+    steps = dbkb_app.warmup_state['steps']
+    assert dbkb_app.warmup_state['ready'] is True
+    assert steps['database']['status'] == 'failed'
+    assert steps['retrieval_clients']['status'] == 'failed'
+    print('✅ Warm-up degrades instead of blocking readiness')
+
+
+def test_retrieval_clients_are_reused(monkeypatch):
+    """Clients per knowledge base are created once and shared"""
+    created = []
+
+    def fake_create(kb_id):
+        created.append(kb_id)
+        return object()
+
+    import utils.retrieval
+    monkeypatch.setattr(utils.retrieval, 'create_retrieval_client', fake_create)
+    monkeypatch.setattr(dbkb_app, 'retrieval_clients', {})
+
+    first = dbkb_app.get_retrieval_client_for_kb('KB1')
+    second = dbkb_app.get_retrieval_client_for_kb('KB1')
+
+    assert first is second
+    assert created == ['KB1']
+    print('✅ Retrieval clients cached per KB')
+
+
+def test_single_kb_endpoints_share_warmed_client(monkeypatch):
+    """/query uses the registry client for the default KB, the one the cache warmer fills"""
+    class FakeClient:
+        kb_id = 'KB-DEFAULT'
+
+        def advanced_rag_query(self, query_text, **kwargs):
+            return {'answer': f'answer to {query_text}'}
+
+    warmed = FakeClient()
+    monkeypatch.setenv('KNOWLEDGE_BASE_ID', 'KB-DEFAULT')
+    monkeypatch.setattr(dbkb_app, 'retrieval_clients', {'KB-DEFAULT': warmed})
+    monkeypatch.setattr(dbkb_app, 'retrieval_client', None)
+    monkeypatch.setattr(dbkb_app, 'record_query_analytics', lambda *args, **kwargs: None)
+
+    assert dbkb_app.get_retrieval_client_for_kb('KB-DEFAULT') is dbkb_app.get_default_retrieval_client()
+    response = TestClient(dbkb_app.app).post('/query', json={'query_text': 'open orders'})
+    assert response.status_code == 200
+    assert response.json()['answer'] == 'answer to open orders'
+    print('✅ Single-KB endpoints share the warmed client')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
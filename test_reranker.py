@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test the local BM25 + identifier reranker
+"""
+import subprocess
+import sys
+sys.path.append('.')
+
+import numpy as np
+
+from src.advanced_retrieval.context import RetrievedContext
+from src.advanced_retrieval.reranker import rerank, bm25_scores, question_identifiers
+
+POOL = [
+    RetrievedContext('[TABLE: db_invoice]\n## Columns\nInvoiceId, CustomerId, Total', score=0.9),
+    RetrievedContext('General notes about reporting and exports', score=0.85),
+    RetrievedContext('[TABLE: db_order]\n## Columns\nWo, CustomerId, Status, ShipDate', score=0.6),
+    RetrievedContext('Query joining db_order to db_orderitem on Wo', score=0.5),
+]
+
+
+def test_table_named_in_question_ranks_first():
+    """A chunk documenting the table the question names moves to the top"""
+    ranked = rerank('show open orders with their status', POOL)
+    assert ranked[0] is POOL[2]
+    assert ranked[1] is POOL[3]
+    print('✅ Table chunk boosted')
+
+
+def test_top_k_trims_pool():
+    """Only top_k contexts are returned"""
+    assert len(rerank('open orders', POOL, top_k=2)) == 2
+    assert rerank('anything', POOL[:1]) == POOL[:1]
+    print('✅ Pool trimmed to top_k')
+
+
+def test_prior_keeps_order_without_lexical_signal():
+    """With no matching terms the retrieval order is preserved"""
+    assert rerank('zzz qqq', POOL) == POOL
+    print('✅ Retrieval order kept as tie-breaker')
+
+
+def test_bm25_and_identifiers():
+    """BM25 favours documents with the query terms; plain words map to tables"""
+    scores = bm25_scores(['status'], [['status', 'wo'], ['total'], []])
+    assert scores[0] > 0 and scores[1] == 0 and scores[2] == 0
+    assert np.isfinite(scores).all()
+    assert question_identifiers(['orders', 'ship_date'], {'db_order', 'db_invoice'}) == {'ship_date', 'db_order'}
+    print('✅ BM25 scoring and identifier detection')
+
+
+def test_lexical_modules_import_without_aws():
+    """The reranker and shared text utilities do not pull in boto3 or the feedback pipeline"""
+    check = ("import sys; import src.advanced_retrieval.reranker, src.advanced_retrieval.compression; "
+             "assert 'boto3' not in sys.modules and 'src.training.feedback_processor' not in sys.modules")
+    assert subprocess.run([sys.executable, '-c', check]).returncode == 0
+    print('✅ Lexical modules import without AWS')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test orjson serialization and response compression
+"""
+import sys
+from decimal import Decimal
+from datetime import datetime
+sys.path.append('.')
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.advanced_retrieval import json_codec
+from utils.responses import FastJSONResponse, CompressionMiddleware, brotli
+
+app = FastAPI(default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+LARGE_CONTEXTS = ['Table db_order has columns Wo, CustomerId, Status and ShipDate. ' * 20] * 10
+
+
+@app.get('/large')
+async def large():
+    return {'answer': 'SELECT * FROM db_order', 'retrieved_contexts': LARGE_CONTEXTS}
+
+
+@app.get('/small')
+async def small():
+    return {'status': 'ok'}
+
+
+client = TestClient(app)
+
+
+def test_codec_round_trip():
+    """Codec handles unicode and falls back to str for Decimal/datetime"""
+    payload = {'text': 'Número de caja', 'cost': Decimal('1.50'), 'at': datetime(2025, 5, 23)}
+    decoded = json_codec.loads(json_codec.dumps(payload))
+    assert decoded['text'] == 'Número de caja'
+    assert decoded['cost'] == '1.50'
+    assert decoded['at'].startswith('2025-05-23')
+    print('✅ JSON codec round trip')
+
+
+def test_bedrock_body_codec():
+    """Bedrock bodies are encoded to bytes and decoded from the streaming body"""
+    import io
+    body = json_codec.encode_bedrock_body({'messages': [{'role': 'user', 'content': 'hi'}]})
+    assert isinstance(body, bytes)
+    response = {'body': io.BytesIO(json_codec.dumps({'content': [{'text': 'hello'}]}))}
+    assert json_codec.decode_bedrock_body(response)['content'][0]['text'] == 'hello'
+    print('✅ Bedrock body codec')
+
+
+def test_large_response_gzipped():
+    """Bodies over the threshold are gzip-encoded for gzip clients"""
+    response = client.get('/large', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert int(response.headers['content-length']) < len(json_codec.dumps(response.json()))
+    assert response.json()['retrieved_contexts'] == LARGE_CONTEXTS
+    print('✅ Large response gzipped')
+
+
+def test_brotli_preferred_when_available():
+    """Brotli is chosen over gzip when installed and accepted"""
+    response = client.get('/large', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['content-encoding'] == ('br' if brotli else 'gzip')
+    print('✅ Encoding negotiated')
+
+
+def test_small_and_unaccepted_responses_untouched():
+    """Small bodies and clients without Accept-Encoding get identity responses"""
+    assert 'content-encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'content-encoding' not in client.get('/large', headers={'Accept-Encoding': 'identity'}).headers
+    print('✅ Small responses not compressed')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test negative caching and stale-while-revalidate in the retrieval cache
+"""
+import sys
+import threading
+import time
+sys.path.append('.')
+
+from src.advanced_retrieval.retrieval_cache import RetrievalCache
+from src.advanced_retrieval.retrieval_techniques import AdvancedRetrieval
+
+
+def expire(cache, key):
+    """Move an entry past its TTL without waiting"""
+    entry = cache._entries[key]
+    shift = entry.expires_at - time.time() + 0.01
+    entry.expires_at -= shift
+    entry.stale_until -= shift
+
+
+def test_fresh_hit_and_negative_entries():
+    cache = RetrievalCache(ttl=60, negative_ttl=30, stale_ttl=60)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        return {'error': 'throttled', 'contexts': []}
+
+    assert cache.get_or_compute('k', failing)['error'] == 'throttled'
+    assert cache.get_or_compute('k', failing)['error'] == 'throttled'
+    assert len(calls) == 1  # the failure is cached instead of retried
+
+    # Negative entries are never served stale
+    expire(cache, 'k')
+    cache.get_or_compute('k', failing)
+    assert len(calls) == 2
+    print('✅ Failures cached with a short TTL')
+
+
+def test_empty_result_is_negative():
+    cache = RetrievalCache(ttl=60, negative_ttl=5, stale_ttl=60)
+    cache.get_or_compute('k', lambda: {'contexts': []})
+    entry = cache._entries['k']
+    assert entry.negative and entry.expires_at - time.time() <= 5
+
+
+def test_stale_while_revalidate():
+    """An expired result is returned at once while one background refresh replaces it"""
+    cache = RetrievalCache(ttl=60, negative_ttl=30, stale_ttl=60)
+    cache.get_or_compute('k', lambda: {'contexts': ['old']})
+    expire(cache, 'k')
+
+    release = threading.Event()
+    calls = []
+
+    def slow_refresh():
+        calls.append(1)
+        release.wait(5)
+        return {'contexts': ['new']}
+
+    assert cache.get_or_compute('k', slow_refresh) == {'contexts': ['old']}
+    assert cache.get_or_compute('k', slow_refresh) == {'contexts': ['old']}
+    release.set()
+    deadline = time.time() + 5
+    while cache._entries['k'].result != {'contexts': ['new']} and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert cache.get_or_compute('k', slow_refresh) == {'contexts': ['new']}
+    assert len(calls) == 1  # single background refresh
+    print('✅ Stale result served while refreshing')
+
+
+def test_failed_refresh_keeps_stale_result():
+    cache = RetrievalCache(ttl=60, negative_ttl=30, stale_ttl=60)
+    cache.get_or_compute('k', lambda: {'contexts': ['old']})
+    expire(cache, 'k')
+
+    done = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        done.set()
+        return {'error': 'down', 'contexts': []}
+
+    assert cache.get_or_compute('k', failing) == {'contexts': ['old']}
+    done.wait(5)
+    deadline = time.time() + 5
+    while 'k' in cache._refreshing and time.time() < deadline:
+        time.sleep(0.01)
+
+    # Still stale, but the next refresh waits out the negative TTL
+    assert cache.get_or_compute('k', failing) == {'contexts': ['old']}
+    time.sleep(0.05)
+    assert len(calls) == 1
+    print('✅ Failed refresh keeps the stale result and backs off')
+
+
+def test_retriever_caches_failures():
+    class FailingKBClient:
+        calls = 0
+
+        def retrieve(self, **kwargs):
+            FailingKBClient.calls += 1
+            raise RuntimeError('ThrottlingException')
+
+    retriever = AdvancedRetrieval(kb_id='test')
+    retriever.kb_client = FailingKBClient()
+    first = retriever.standard_query('open orders')
+    second = retriever.standard_query('open orders')
+    assert first is second and 'error' in first
+    assert FailingKBClient.calls == 1
+    print('✅ Retriever does not hammer a failing knowledge base')
+
+
+def test_multi_strategy_outage_is_negative():
+    """A full outage is not cached as a fused result built from the mock fallback"""
+    class FailingKBClient:
+        def retrieve(self, **kwargs):
+            raise RuntimeError('ServiceUnavailable')
+
+    class FailingBedrock:
+        def invoke_model(self, **kwargs):
+            raise RuntimeError('ServiceUnavailable')
+
+    retriever = AdvancedRetrieval(kb_id='test')
+    retriever.kb_client = FailingKBClient()
+    retriever.bedrock_client = FailingBedrock()
+    result = retriever.multi_strategy_retrieval('open orders')
+    assert 'standard' in result['error']
+    assert not any(c.source == 'mock-source' for c in result['contexts'])
+
+    key = retriever.generate_cache_key('open orders', 8, method='multi', mmr_lambda=retriever.mmr_lambda)
+    entry = retriever.cache._entries[key]
+    assert entry.negative and entry.stale_until == entry.expires_at
+    print('✅ Multi-strategy outage cached as a failure')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
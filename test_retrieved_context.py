@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test the compact RetrievedContext record and hash-based deduplication
+"""
+import sys
+import hashlib
+sys.path.append('.')
+
+from src.advanced_retrieval.context import RetrievedContext, contexts_from_response, dedupe_contexts
+from src.advanced_retrieval import json_codec
+
+RESPONSE = {'retrievalResults': [
+    {'content': {'text': 'x' * 600}, 'location': {'s3Location': {'uri': 's3://kb/tables/db_order.md'}}, 'score': 0.7},
+    {'content': {'text': 'db_customer columns'}, 'score': 0.4}
+]}
+
+
+def test_built_from_retrieve_response():
+    """Contexts carry content, source, score and a precomputed hash"""
+    contexts = contexts_from_response(RESPONSE, 'open orders')
+    first = contexts[0]
+    assert first.source == 's3://kb/tables/db_order.md'
+    assert first.from_query == 'open orders'
+    assert first.content_hash == hashlib.md5(('x' * 600).encode()).hexdigest()
+    assert contexts[1].source == ''
+    print('✅ Contexts built from retrieve response')
+
+
+def test_sample_is_lazy_and_not_stored():
+    """The sample is derived on access and not kept as a slot"""
+    context = RetrievedContext('y' * 600)
+    assert context.content_sample == 'y' * 500 + '...'
+    assert not hasattr(context, '__dict__')
+    assert RetrievedContext('').content_sample == ''
+    print('✅ Lazy content sample')
+
+
+def test_dict_style_access_and_serialization():
+    """Existing callers can keep using dict access and JSON output is unchanged"""
+    context = RetrievedContext('db_order columns', 's3://kb/db_order.md', 0.9)
+    assert context['content'] == 'db_order columns'
+    assert context.get('from_query', 'none') == 'none'
+    decoded = json_codec.loads(json_codec.dumps({'contexts': [context]}))
+    assert decoded['contexts'][0] == {
+        'content': 'db_order columns', 'source': 's3://kb/db_order.md',
+        'content_sample': 'db_order columns...', 'score': 0.9
+    }
+    print('✅ Dict access and serialization')
+
+
+def test_dedupe_keeps_highest_score():
+    """Duplicates across strategies collapse to the best-scoring copy"""
+    low = RetrievedContext('same chunk', score=0.2, from_query='a')
+    high = RetrievedContext('same chunk', score=0.6, from_query='b')
+    other = RetrievedContext('other chunk', score=0.1)
+    unique = dedupe_contexts([low, high, other])
+    assert len(unique) == 2
+    assert unique[high.content_hash] is high
+    print('✅ Deduplication by precomputed hash')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test in-memory UI asset serving
+"""
+import sys
+import gzip
+sys.path.append('.')
+
+from fastapi.testclient import TestClient
+
+import app as dbkb_app
+
+client = TestClient(dbkb_app.app)
+
+
+def test_widget_served_with_etag_and_cache_headers():
+    """The widget carries a strong ETag and a cacheable Cache-Control"""
+    response = client.get('/db-knowledge-assistant.js', headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert response.headers['etag'].startswith('"')
+    assert 'max-age' in response.headers['cache-control']
+    assert response.headers['content-type'].startswith('application/javascript')
+    with open('src/ui/db-knowledge-assistant.js') as f:
+        assert response.text == f.read()
+    print('✅ Widget served from memory')
+
+
+def test_matching_etag_returns_304():
+    """A revalidation with the current ETag gets an empty 304"""
+    etag = client.get('/db-knowledge-assistant.js').headers['etag']
+    response = client.get('/db-knowledge-assistant.js', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+    print('✅ 304 on matching ETag')
+
+
+def test_gzip_variant_served_when_accepted():
+    """Clients accepting gzip get the precomputed compressed body"""
+    asset = dbkb_app.ui_assets['script']
+    response = client.get('/db-knowledge-assistant.js', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert gzip.decompress(asset.variants['gzip']) == asset.variants['identity']
+    assert 'Accept-Encoding' in response.headers['vary']
+    print('✅ gzip variant negotiated')
+
+
+def test_each_encoding_has_its_own_etag():
+    """A gzip body's ETag never validates the identity body"""
+    identity = client.get('/db-knowledge-assistant.js', headers={'Accept-Encoding': 'identity'})
+    gzipped = client.get('/db-knowledge-assistant.js', headers={'Accept-Encoding': 'gzip'})
+    assert identity.headers['etag'] != gzipped.headers['etag']
+    assert gzipped.headers['etag'].endswith('-gzip"')
+
+    response = client.get('/db-knowledge-assistant.js',
+                          headers={'Accept-Encoding': 'identity', 'If-None-Match': gzipped.headers['etag']})
+    assert response.status_code == 200
+    print('✅ Per-encoding ETags')
+
+
+def test_index_has_api_endpoint_substituted():
+    """The index page is served with the placeholder already replaced"""
+    response = client.get('/ui/')
+    assert response.status_code == 200
+    assert '{{API_ENDPOINT}}' not in response.text
+    assert response.headers['cache-control'] == 'no-cache'
+    print('✅ Index page pre-rendered')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
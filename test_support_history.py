@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test /support/history served from the denormalized chat_session counters
+"""
+import sys
+from datetime import datetime
+sys.path.append('.')
+
+from fastapi.testclient import TestClient
+
+import app as dbkb_app
+
+SESSIONS = [
+    {'SessionUuid': 'older', 'Title': None, 'CreatedAt': datetime(2025, 1, 1), 'UpdatedAt': datetime(2025, 1, 3),
+     'MessageCount': 4, 'LastMessageAt': datetime(2025, 1, 3), 'LastUserMessage': 'reset my password',
+     'LastUserMessageAt': datetime(2025, 1, 2)},
+    {'SessionUuid': 'newer', 'Title': None, 'CreatedAt': datetime(2025, 1, 2), 'UpdatedAt': datetime(2025, 1, 2),
+     'MessageCount': 2, 'LastMessageAt': datetime(2025, 1, 2), 'LastUserMessage': 'export invoices',
+     'LastUserMessageAt': datetime(2025, 1, 2, 12)},
+    {'SessionUuid': 'empty', 'Title': None, 'CreatedAt': datetime(2025, 1, 1), 'UpdatedAt': datetime(2025, 1, 1),
+     'MessageCount': 0, 'LastMessageAt': None, 'LastUserMessage': None, 'LastUserMessageAt': None},
+]
+
+USER = {'loginId': 'u1', 'email': 'u1@example.com', 'firstName': 'A', 'lastName': 'B', 'company': 'TEST001',
+        'companyName': 'Test', 'industry': 'Retail', 'databaseHost': 'h', 'databaseSchema': 's',
+        'application': 'epic'}
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.queries = []
+
+    def cursor(self, dictionary=False):
+        return self
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+
+    def fetchall(self):
+        return [dict(session) for session in SESSIONS]
+
+    def close(self):
+        pass
+
+
+def test_history_reads_only_chat_session(monkeypatch):
+    connection = RecordingConnection()
+    monkeypatch.setattr(dbkb_app, 'ensure_user_and_company', lambda user_context: (1, 2))
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_connection', lambda: connection)
+
+    response = TestClient(dbkb_app.app).post('/support/history', json=USER)
+    assert response.status_code == 200
+    assert len(connection.queries) == 1 and 'chat_message' not in connection.queries[0]
+
+    recent = response.json()['recent_queries']
+    assert [query['Content'] for query in recent] == ['export invoices', 'reset my password']
+    assert set(recent[0]) == {'Content', 'MessageType', 'CreatedAt', 'QueryMode', 'SessionUuid'}
+    print('✅ Support history served from session counters')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
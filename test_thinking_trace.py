@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test the structured thinking trace built by the retrieval strategies
+"""
+import sys
+sys.path.append('.')
+
+from src.advanced_retrieval.retrieval_techniques import AdvancedRetrieval
+from src.advanced_retrieval.thinking_trace import ThinkingTrace, render_thinking
+
+
+class FakeKBClient:
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration):
+        text = retrievalQuery['text']
+        return {'retrievalResults': [
+            {'content': {'text': f'[TABLE: db_order] context for {text}'}, 'score': 0.8},
+            {'content': {'text': '[TABLE: db_customer] shared context'}, 'score': 0.5}
+        ]}
+
+
+def _retriever(monkeypatch):
+    retriever = AdvancedRetrieval(kb_id='test')
+    retriever.kb_client = FakeKBClient()
+    monkeypatch.setattr(retriever, 'generate_expanded_queries',
+                        lambda q: ['open orders by customer', q])
+    monkeypatch.setattr(retriever, 'generate_hypothetical_document',
+                        lambda q: 'db_order stores one row per work order')
+    return retriever
+
+
+def test_multi_strategy_returns_structured_trace(monkeypatch):
+    """The multi-strategy result carries a trace, not a pre-built string"""
+    retriever = _retriever(monkeypatch)
+    result = retriever.multi_strategy_retrieval('show open orders')
+
+    trace = result['thinking_process']
+    assert isinstance(trace, ThinkingTrace)
+    assert [stage.name for stage in trace.stages] == [
+        'Standard Retrieval', 'Query Expansion', 'Hypothetical Document Embedding (HyDE)', 'Aggregation Results'
+    ]
+    # Sub-strategy traces are shared with their own cached results
+    expansion = retriever.query_expansion('show open orders', 2)['thinking_process']
+    assert trace.stages[1].child is expansion
+    print('✅ Multi-strategy trace is structured')
+
+
+def test_trace_renders_on_demand(monkeypatch):
+    """Rendering produces the readable thinking text with nested stages"""
+    retriever = _retriever(monkeypatch)
+    text = render_thinking(retriever.multi_strategy_retrieval('show open orders')['thinking_process'])
+
+    assert text.startswith('# Multi-Strategy Retrieval Process')
+    assert 'Query: show open orders' in text
+    assert '1. open orders by customer' in text
+    assert 'db_order stores one row per work order' in text
+    assert 'Top contexts selected by rrf fusion and MMR' in text
+    print('✅ Trace rendered to text')
+
+
+def test_trace_to_dict_and_plain_strings():
+    """Traces serialize to dicts and plain strings pass through render_thinking"""
+    trace = ThinkingTrace('Relationship Retrieval', 'db_order')
+    with trace.stage('Specialized queries') as stage:
+        stage.item('db_order foreign keys')
+        stage.count('Retrieved contexts', 4)
+
+    data = trace.to_dict()
+    assert data['stages'][0]['items'] == ['db_order foreign keys']
+    assert data['stages'][0]['elapsed_ms'] is not None
+    assert render_thinking('mock thinking') == 'mock thinking'
+    assert render_thinking(None) == ''
+    print('✅ Trace serialization')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
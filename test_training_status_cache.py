@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test the single-query, cached training status endpoint
+"""
+import sys
+from datetime import datetime
+sys.path.append('.')
+
+from fastapi.testclient import TestClient
+
+import app as dbkb_app
+
+TEST_USER_CONTEXT = {
+    "loginId": "test.user",
+    "email": "test@example.com",
+    "firstName": "Test",
+    "lastName": "User",
+    "company": "TEST001",
+    "companyName": "Test Company",
+    "industry": "Technology",
+    "databaseHost": "test-db.example.com",
+    "databaseSchema": "test_schema",
+    "application": "epic"
+}
+
+
+class FakeDB:
+    def __init__(self):
+        self.queries = []
+
+    def connect(self):
+        return self
+
+    def cursor(self, dictionary=False):
+        return self
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+
+    def fetchone(self):
+        return (3, 5, datetime(2025, 1, 1, 12, 0, 0))
+
+    def close(self):
+        pass
+
+
+def _setup(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(dbkb_app, 'get_chat_db_connection', db.connect)
+    monkeypatch.setattr(dbkb_app, 'ensure_user_and_company', lambda user_context: (1, 2))
+    dbkb_app.training_status_cache.clear()
+    return db, TestClient(dbkb_app.app)
+
+
+def _get_status(client):
+    return client.request('GET', '/feedback/training-status',
+                          json={"knowledgeBaseId": "KRD3MW7QFS", "userContext": TEST_USER_CONTEXT})
+
+
+def test_status_uses_one_query_and_is_cached(monkeypatch):
+    """Counts come from one query and repeat polls are served from the cache"""
+    db, client = _setup(monkeypatch)
+
+    for _ in range(3):
+        response = _get_status(client)
+        assert response.status_code == 200
+        body = response.json()
+        assert body['pendingFeedback'] == 3 and body['processedFeedback'] == 5
+        assert body['lastTrainingUpdate'] == '2025-01-01T12:00:00'
+
+    assert len(db.queries) == 1
+    print('✅ Training status served from one query and cached')
+
+
+def test_invalidation_refreshes_status(monkeypatch):
+    """Invalidating the (KB, company) entry forces a fresh query"""
+    db, client = _setup(monkeypatch)
+
+    _get_status(client)
+    dbkb_app.invalidate_training_status('KRD3MW7QFS', 'TEST001')
+    _get_status(client)
+
+    assert len(db.queries) == 2
+    print('✅ Training status cache invalidation works')
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -36,6 +36,7 @@ def update_epic_application_kbs():
         
         if rows_affected > 0:
             print(f"✅ Updated {rows_affected} Epic application record(s)")
+            print("ℹ️  Running API tasks cache this table - POST /applications/refresh to pick up the change")
             
             cursor.execute(
                 "SELECT Name, DatabaseKnowledgeBaseId, SupportKnowledgeBaseId FROM application WHERE Name = 'epic'"
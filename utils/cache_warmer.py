@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Retrieval cache warm-up from historical queries
+Replays the most popular queries per knowledge base (from query_analytic) and
+the tables of the representative queries in query_analysis_selected_queries.json
+so the first users after a deploy hit a warm cache
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger('cache_warmer')
+
+SELECTED_QUERIES_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'query_analysis_selected_queries.json'
+)
+
+POPULAR_QUERIES_SQL = """SELECT QueryText, EndpointUsed, SUM(UsageCount) AS Uses
+   FROM query_analytic
+   WHERE KnowledgeBaseId = %s AND Success = TRUE
+   GROUP BY QueryHash, QueryText, EndpointUsed
+   ORDER BY Uses DESC
+   LIMIT %s"""
+
+# (knowledge base id, endpoint, query text)
+WarmupItem = Tuple[str, str, str]
+
+
+def load_selected_tables(path: str = SELECTED_QUERIES_FILE) -> List[str]:
+    """Main tables of the representative queries, in rank order without repeats"""
+    try:
+        with open(path) as f:
+            selected = json.load(f).get('selected_queries', [])
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read selected queries from {path}: {e}")
+        return []
+
+    tables = []
+    for query in sorted(selected, key=lambda q: q.get('rank', 0)):
+        table = query.get('main_table')
+        if table and table not in tables:
+            tables.append(table)
+    return tables
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / rate`` seconds apart across threads"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class CacheWarmer:
+    """Replays popular queries through the retrieval pipeline on a schedule
+
+    ``replay(kb_id, endpoint, query_text)`` performs one warm-up query; the
+    caller decides which retrieval method each endpoint maps to. Passes run
+    with at most ``concurrency`` queries in flight and ``rate`` queries started
+    per second so warm-up traffic cannot crowd out live requests.
+    """
+
+    def __init__(self, connection_factory: Callable[[], Any],
+                 replay: Callable[[str, str, str], Any],
+                 top_n: Optional[int] = None,
+                 concurrency: Optional[int] = None,
+                 rate: Optional[float] = None,
+                 interval: Optional[float] = None,
+                 selected_tables: Optional[Iterable[str]] = None):
+        self.connection_factory = connection_factory
+        self.replay = replay
+        self.top_n = top_n or int(os.getenv('CACHE_WARMUP_TOP_N', 25))
+        self.concurrency = concurrency or int(os.getenv('CACHE_WARMUP_CONCURRENCY', 2))
+        self.rate = rate if rate is not None else float(os.getenv('CACHE_WARMUP_RATE', 1.0))
+        # Default just under the one hour retrieval cache TTL so entries are refreshed before expiring
+        self.interval = interval if interval is not None else float(os.getenv('CACHE_WARMUP_INTERVAL', 3300))
+        self.selected_tables = list(selected_tables) if selected_tables is not None else None
+
+        self.stats = {'runs': 0, 'warmed': 0, 'failed': 0, 'last_run_at': None, 'last_run_ms': None}
+        self._running = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, kb_ids: Callable[[], Dict[str, str]], delay: float = 0.0):
+        """Run a pass after ``delay`` seconds, then every ``interval`` seconds
+
+        ``kb_ids`` returns the knowledge bases to warm as {kb_id: kb_type}.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(kb_ids, delay),
+                                        name='cache-warmer', daemon=True)
+        self._thread.start()
+        logger.info(f"Cache warmer started (top_n={self.top_n}, concurrency={self.concurrency}, "
+                    f"rate={self.rate}/s, interval={self.interval}s)")
+
+    def stop(self):
+        """Stop scheduling passes; a pass in progress finishes its in-flight queries"""
+        self._stop.set()
+
+    def _run(self, kb_ids: Callable[[], Dict[str, str]], delay: float):
+        if self._stop.wait(delay):
+            return
+        while True:
+            try:
+                self.run_once(kb_ids())
+            except Exception as e:
+                logger.error(f"Cache warm-up pass failed: {e}")
+            if self.interval <= 0 or self._stop.wait(self.interval):
+                return
+
+    def popular_queries(self, kb_id: str) -> List[Tuple[str, str]]:
+        """Top-N successful queries for a knowledge base as (endpoint, query_text)"""
+        connection = self.connection_factory()
+        if not connection:
+            return []
+        try:
+            cursor = connection.cursor()
+            cursor.execute(POPULAR_QUERIES_SQL, (kb_id, self.top_n))
+            rows = cursor.fetchall()
+            cursor.close()
+        except Exception as e:
+            logger.warning(f"Could not load popular queries for KB {kb_id}: {e}")
+            return []
+        finally:
+            connection.close()
+        return [(row[1] or '/query', row[0]) for row in rows]
+
+    def plan(self, kb_ids: Dict[str, str]) -> List[WarmupItem]:
+        """Queries to replay: popular queries per KB plus the representative tables"""
+        items = []
+        seen = set()
+
+        def add(kb_id, endpoint, query_text):
+            key = (kb_id, endpoint, query_text)
+            if query_text and key not in seen:
+                seen.add(key)
+                items.append(key)
+
+        for kb_id, kb_type in kb_ids.items():
+            for endpoint, query_text in self.popular_queries(kb_id):
+                add(kb_id, endpoint, query_text)
+
+            if kb_type == 'database':
+                if self.selected_tables is None:
+                    self.selected_tables = load_selected_tables()
+                for table in self.selected_tables[:self.top_n]:
+                    add(kb_id, '/relationship', table)
+        return items
+
+    def run_once(self, kb_ids: Dict[str, str]) -> Dict[str, int]:
+        """Warm the cache for the given knowledge bases; skipped if a pass is already running"""
+        if not self._running.acquire(blocking=False):
+            logger.info("Cache warm-up already in progress - skipping")
+            return {'warmed': 0, 'failed': 0, 'skipped': True}
+
+        try:
+            started = time.time()
+            items = self.plan(kb_ids)
+            limiter = RateLimiter(self.rate)
+            counts = {'warmed': 0, 'failed': 0}
+            counts_lock = threading.Lock()
+
+            def warm(item: WarmupItem):
+                if self._stop.is_set():
+                    return
+                limiter.wait()
+                try:
+                    self.replay(*item)
+                    outcome = 'warmed'
+                except Exception as e:
+                    logger.warning(f"Warm-up query failed for KB {item[0]} ({item[1]}): {e}")
+                    outcome = 'failed'
+                with counts_lock:
+                    counts[outcome] += 1
+
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='cache-warmup') as pool:
+                list(pool.map(warm, items))
+
+            elapsed_ms = int((time.time() - started) * 1000)
+            self.stats['runs'] += 1
+            self.stats['warmed'] += counts['warmed']
+            self.stats['failed'] += counts['failed']
+            self.stats['last_run_at'] = started
+            self.stats['last_run_ms'] = elapsed_ms
+            logger.info(f"Cache warm-up: {counts['warmed']} queries warmed, {counts['failed']} failed "
+                        f"across {len(kb_ids)} KBs in {elapsed_ms}ms")
+            return counts
+        finally:
+            self._running.release()
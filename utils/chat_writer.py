@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Write-behind persistence for chat messages
+Buffers messages in memory and writes them to the chat database in batches
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger('chat_writer')
+
+INSERT_MESSAGE_SQL = """INSERT INTO chat_message
+   (SessionId, UserId, CompanyId, MessageType, Content, Metadata,
+    QueryType, EndpointUsed, ResponseTimeMs)
+   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+
+# Keeps the denormalized counters on chat_session in step with chat_message so
+# /support/history never has to aggregate messages
+UPDATE_SESSION_SQL = """UPDATE chat_session
+   SET MessageCount = MessageCount + %s,
+       LastMessageAt = NOW(),
+       LastUserMessage = COALESCE(%s, LastUserMessage),
+       LastUserMessageAt = IF(%s IS NULL, LastUserMessageAt, NOW()),
+       UpdatedAt = NOW()
+   WHERE Id = %s"""
+
+LAST_MESSAGE_PREVIEW_CHARS = 500
+
+# Values of the chat_message.MessageType enum
+MESSAGE_TYPES = ('user', 'assistant', 'system')
+
+
+class ChatMessageWriter:
+    """Bounded write-behind queue for chat messages
+
+    Messages are acknowledged as soon as they are buffered. A background thread
+    flushes the buffer when it reaches ``batch_size`` or every ``flush_interval``
+    seconds, inserting the whole batch with one ``executemany`` and touching each
+    session's counters and timestamps once per batch. If a batch fails it is
+    retried one message at a time, so only the messages that fail on their own
+    are retried later and eventually dropped. ``stop()`` drains the buffer.
+    """
+
+    def __init__(self, connection_factory: Callable[[], Any],
+                 batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None,
+                 max_queue_size: Optional[int] = None,
+                 max_attempts: int = 3):
+        self.connection_factory = connection_factory
+        self.batch_size = batch_size or int(os.getenv('CHAT_WRITE_BATCH_SIZE', 50))
+        self.flush_interval = flush_interval or float(os.getenv('CHAT_WRITE_FLUSH_INTERVAL', 1.0))
+        self.max_queue_size = max_queue_size or int(os.getenv('CHAT_WRITE_QUEUE_SIZE', 5000))
+        self.max_attempts = max_attempts
+
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'failures': 0}
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='chat-writer', daemon=True)
+        self._thread.start()
+        logger.info(f"Chat message writer started (batch={self.batch_size}, "
+                    f"interval={self.flush_interval}s, queue={self.max_queue_size})")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the flush thread and write everything still buffered"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+        # Durable flush: failed batches are requeued until they run out of attempts
+        while self.pending():
+            self.flush()
+        logger.info(f"Chat message writer stopped: {self.stats}")
+
+    def pending(self) -> int:
+        """Number of buffered messages not yet written"""
+        with self._condition:
+            return len(self._buffer)
+
+    def enqueue(self, session_uuid: str, message_type: str, content: str,
+                metadata: Optional[Dict] = None, timeout: float = 0.0) -> bool:
+        """Buffer a message for persistence; returns False if the buffer is full
+
+        By default a full buffer drops the message at once, so the call never
+        blocks an event loop; ``timeout`` waits up to that long for room.
+        Raises ValueError for messages the database would reject.
+        """
+        if message_type not in MESSAGE_TYPES:
+            raise ValueError(f"Invalid message type '{message_type}'")
+        metadata = metadata or {}
+        message_metadata = metadata.get('metadata', '{}')
+        if isinstance(message_metadata, str):
+            try:
+                json.loads(message_metadata)
+            except ValueError:
+                raise ValueError("Message metadata is not valid JSON")
+        else:
+            message_metadata = json.dumps(message_metadata, default=str)
+
+        item = {
+            'session_uuid': session_uuid,
+            'message_type': message_type,
+            'content': content,
+            'metadata': message_metadata,
+            'query_type': metadata.get('queryType'),
+            'endpoint_used': metadata.get('endpointUsed'),
+            'response_time': metadata.get('responseTime'),
+            'attempts': 0
+        }
+
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while len(self._buffer) >= self.max_queue_size:
+                # Wake the flusher and give it a moment to make room
+                self._condition.notify_all()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping:
+                    self.stats['dropped'] += 1
+                    logger.warning("Chat message buffer full - message not persisted")
+                    return False
+                self._condition.wait(remaining)
+
+            self._buffer.append(item)
+            self.stats['queued'] += 1
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+        return True
+
+    def _run(self):
+        """Background loop: flush on size or interval"""
+        while True:
+            with self._condition:
+                if not self._stopping and len(self._buffer) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            while self.pending():
+                if not self.flush():
+                    break
+                if self.pending() < self.batch_size:
+                    break
+
+    def _take_batch(self) -> List[Dict]:
+        with self._condition:
+            batch = []
+            while self._buffer and len(batch) < self.batch_size:
+                batch.append(self._buffer.popleft())
+            # Producers may be waiting for room
+            self._condition.notify_all()
+            return batch
+
+    def _requeue(self, batch: List[Dict]):
+        """Put a failed batch back at the front of the buffer for another attempt"""
+        retry = [item for item in batch if item['attempts'] < self.max_attempts]
+        dropped = len(batch) - len(retry)
+        with self._condition:
+            self._buffer.extendleft(reversed(retry))
+        if dropped:
+            self.stats['dropped'] += dropped
+            logger.error(f"Dropped {dropped} chat messages after {self.max_attempts} failed writes")
+
+    def flush(self) -> bool:
+        """Write one batch to the database; returns True on success"""
+        with self._flush_lock:
+            batch = self._take_batch()
+            if not batch:
+                return True
+
+            for item in batch:
+                item['attempts'] += 1
+
+            connection = self.connection_factory()
+            if not connection:
+                self.stats['failures'] += 1
+                self._requeue(batch)
+                return False
+
+            cursor = None
+            try:
+                cursor = connection.cursor()
+                written = self._write_batch(cursor, batch)
+                connection.commit()
+                self.stats['written'] += written
+                self.stats['batches'] += 1
+                return True
+
+            except Exception as e:
+                logger.error(f"Failed to write chat message batch of {len(batch)}: {e}")
+                self.stats['failures'] += 1
+                self._rollback(connection)
+                if len(batch) == 1:
+                    self._requeue(batch)
+                    return False
+                # Isolate the bad rows instead of retrying (and eventually dropping) the whole batch
+                failed = self._write_individually(connection, batch)
+                self._requeue(failed)
+                return len(failed) < len(batch)
+            finally:
+                if cursor:
+                    cursor.close()
+                connection.close()
+
+    @staticmethod
+    def _rollback(connection):
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+
+    def _write_individually(self, connection, batch: List[Dict]) -> List[Dict]:
+        """Write a failed batch one message per transaction; returns the messages that failed"""
+        failed = []
+        for item in batch:
+            cursor = None
+            try:
+                cursor = connection.cursor()
+                written = self._write_batch(cursor, [item])
+                connection.commit()
+                self.stats['written'] += written
+            except Exception as e:
+                logger.error(f"Failed to write chat message for session {item['session_uuid']}: {e}")
+                self._rollback(connection)
+                failed.append(item)
+            finally:
+                if cursor:
+                    cursor.close()
+        return failed
+
+    def _write_batch(self, cursor, batch: List[Dict]) -> int:
+        """Insert a batch of messages and touch their sessions; returns rows written"""
+        session_uuids = sorted({item['session_uuid'] for item in batch})
+        cursor.execute(
+            "SELECT Id, SessionUuid, UserId, CompanyId FROM chat_session WHERE SessionUuid IN ({})".format(
+                ','.join(['%s'] * len(session_uuids))
+            ),
+            session_uuids
+        )
+        sessions = {row[1]: (row[0], row[2], row[3]) for row in cursor.fetchall()}
+
+        rows = []
+        for item in batch:
+            session = sessions.get(item['session_uuid'])
+            if not session:
+                logger.warning(f"Dropping chat message for unknown session {item['session_uuid']}")
+                self.stats['dropped'] += 1
+                continue
+            session_id, user_id, company_id = session
+            rows.append((session_id, user_id, company_id, item['message_type'], item['content'],
+                         item['metadata'], item['query_type'], item['endpoint_used'],
+                         item['response_time']))
+
+        if not rows:
+            return 0
+
+        cursor.executemany(INSERT_MESSAGE_SQL, rows)
+
+        # One counter/timestamp update per session per batch instead of one per message,
+        # in the same transaction as the inserts
+        session_updates = {}
+        for row in rows:
+            count, last_user_message = session_updates.get(row[0], (0, None))
+            if row[3] == 'user':
+                last_user_message = row[4][:LAST_MESSAGE_PREVIEW_CHARS]
+            session_updates[row[0]] = (count + 1, last_user_message)
+
+        cursor.executemany(UPDATE_SESSION_SQL, [
+            (count, last_user_message, last_user_message, session_id)
+            for session_id, (count, last_user_message) in sorted(session_updates.items())
+        ])
+        return len(rows)
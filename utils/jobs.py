@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Background job runner for long-running API work
+Jobs are persisted in the background_job table and executed by an in-process
+worker pool, so requests return immediately and unfinished jobs resume after
+a restart. A running job is leased to the task executing it; other tasks only
+pick it up once the lease has expired, which every task checks periodically
+"""
+
+import os
+import json
+import uuid
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger('background_jobs')
+
+# MySQL ER_DUP_ENTRY: another task inserted an active job with the same dedupe key
+DUPLICATE_KEY_ERRNO = 1062
+
+JOB_COLUMNS = ['JobUuid', 'JobType', 'Status', 'Progress', 'Result', 'ErrorMessage',
+               'Attempts', 'CreatedAt', 'StartedAt', 'CompletedAt']
+
+
+class JobRunner:
+    """Persisted background jobs executed by a thread pool
+
+    Handlers are registered per job type and called as
+    ``handler(payload, report_progress)``; whatever dict they return is stored
+    as the job result. ``report_progress(dict)`` writes intermediate progress so
+    ``get()`` can report it while the job runs.
+    """
+
+    def __init__(self, connection_factory: Callable[[], Any],
+                 max_workers: Optional[int] = None, max_attempts: int = 3,
+                 lease_seconds: Optional[int] = None):
+        self.connection_factory = connection_factory
+        self.max_workers = max_workers or int(os.getenv('JOB_WORKERS', 2))
+        self.max_attempts = max_attempts
+        # Leases are renewed while a job runs, so this only bounds how long a dead task's jobs wait
+        self.lease_seconds = lease_seconds or int(os.getenv('JOB_LEASE_SECONDS', 300))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers: Dict[str, Callable] = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job-worker')
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._stop_reclaiming = threading.Event()
+        self._reclaimer = None
+
+    def register(self, job_type: str, handler: Callable[[Dict, Callable[[Dict], None]], Dict]):
+        """Register the handler for a job type"""
+        self.handlers[job_type] = handler
+
+    def submit(self, job_type: str, payload: Dict, dedupe_key: Optional[str] = None) -> Optional[str]:
+        """Persist a job and schedule it; returns the job id or None if the DB is unavailable
+
+        When ``dedupe_key`` matches a job that is still queued or running, that
+        job's id is returned instead of creating a duplicate. A job still leased
+        to a live task is left to it; a queued or lease-expired one is scheduled
+        here. The active dedupe key is unique in the table, so concurrent
+        submits from different tasks cannot both insert.
+        """
+        if job_type not in self.handlers:
+            raise ValueError(f"No handler registered for job type '{job_type}'")
+
+        connection = self.connection_factory()
+        if not connection:
+            return None
+
+        try:
+            cursor = connection.cursor()
+            existing = self._find_active(cursor, dedupe_key) if dedupe_key else None
+            if not existing:
+                job_uuid = str(uuid.uuid4())
+                try:
+                    cursor.execute(
+                        """INSERT INTO background_job (JobUuid, JobType, Payload, DedupeKey, Status)
+                           VALUES (%s, %s, %s, %s, 'queued')""",
+                        (job_uuid, job_type, json.dumps(payload), dedupe_key)
+                    )
+                    connection.commit()
+                except Exception as e:
+                    if not dedupe_key or getattr(e, 'errno', None) != DUPLICATE_KEY_ERRNO:
+                        raise
+                    # Lost the race with another task's submit; use its job
+                    connection.rollback()
+                    existing = self._find_active(cursor, dedupe_key)
+                    if not existing:
+                        raise
+            cursor.close()
+        finally:
+            connection.close()
+
+        if existing:
+            job_uuid, claimable = existing
+            if claimable:
+                self._schedule(job_uuid)
+            return job_uuid
+
+        self._schedule(job_uuid)
+        return job_uuid
+
+    @staticmethod
+    def _find_active(cursor, dedupe_key: str):
+        """(job id, claimable) of the active job with the dedupe key, or None
+
+        Claimable means queued or running on an expired lease, i.e. no live
+        task is known to be working on it.
+        """
+        cursor.execute(
+            """SELECT JobUuid,
+                      Status = 'queued' OR LeaseExpiresAt IS NULL OR LeaseExpiresAt < NOW()
+               FROM background_job
+               WHERE DedupeKey = %s AND Status IN ('queued', 'running')
+               ORDER BY CreatedAt DESC LIMIT 1""",
+            (dedupe_key,)
+        )
+        row = cursor.fetchone()
+        return (row[0], bool(row[1])) if row else None
+
+    def get(self, job_uuid: str) -> Optional[Dict[str, Any]]:
+        """Current state of a job, or None if it does not exist"""
+        connection = self.connection_factory()
+        if not connection:
+            return None
+
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM background_job WHERE JobUuid = %s",
+                (job_uuid,)
+            )
+            job = cursor.fetchone()
+            cursor.close()
+        finally:
+            connection.close()
+
+        if job:
+            for field in ('Progress', 'Result'):
+                if isinstance(job.get(field), str):
+                    job[field] = json.loads(job[field])
+        return job
+
+    def resume(self) -> int:
+        """Reschedule queued jobs and running jobs whose lease has expired
+
+        Jobs another live task is running keep a current lease and are skipped.
+        """
+        connection = self.connection_factory()
+        if not connection:
+            logger.warning("Could not resume background jobs - database unavailable")
+            return 0
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                """SELECT JobUuid FROM background_job
+                   WHERE Status = 'queued'
+                      OR (Status = 'running' AND (LeaseExpiresAt IS NULL OR LeaseExpiresAt < NOW()))
+                   ORDER BY CreatedAt ASC"""
+            )
+            job_uuids = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+        finally:
+            connection.close()
+
+        for job_uuid in job_uuids:
+            self._schedule(job_uuid)
+        if job_uuids:
+            logger.info(f"Resumed {len(job_uuids)} background jobs")
+        return len(job_uuids)
+
+    def start_reclaimer(self, interval: Optional[float] = None):
+        """Run ``resume`` now and then every ``interval`` seconds (default: the lease length)
+
+        A task that replaces a crashed one usually starts before the crashed
+        task's leases expire, so a single resume at startup would miss its jobs.
+        """
+        if self._reclaimer and self._reclaimer.is_alive():
+            return
+        interval = interval or self.lease_seconds
+        self._stop_reclaiming.clear()
+        self._reclaimer = threading.Thread(target=self._reclaim_loop, args=(interval,),
+                                           name='job-reclaimer', daemon=True)
+        self._reclaimer.start()
+
+    def _reclaim_loop(self, interval: float):
+        while True:
+            try:
+                self.resume()
+            except Exception as e:
+                logger.error(f"Error reclaiming background jobs: {e}")
+            if self._stop_reclaiming.wait(interval):
+                return
+
+    def shutdown(self, wait: bool = False):
+        """Stop accepting work; jobs still running are reclaimed by another task once their lease expires"""
+        self._stop_reclaiming.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _schedule(self, job_uuid: str):
+        with self._lock:
+            if job_uuid in self._scheduled:
+                return
+            self._scheduled.add(job_uuid)
+        self._executor.submit(self._execute, job_uuid)
+
+    def _update(self, job_uuid: str, sql: str, params: tuple) -> int:
+        """Run an update for a job; returns the number of rows changed"""
+        connection = self.connection_factory()
+        if not connection:
+            logger.error(f"Could not update job {job_uuid} - database unavailable")
+            return 0
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            connection.commit()
+            updated = cursor.rowcount
+            cursor.close()
+            return updated
+        finally:
+            connection.close()
+
+    def _claim(self, job_uuid: str) -> Optional[Dict]:
+        """Take the lease on a queued or lease-expired job and return its type and payload
+
+        The claim is a single conditional UPDATE, so when several tasks race
+        for the same job exactly one of them sees a changed row.
+        """
+        connection = self.connection_factory()
+        if not connection:
+            return None
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(
+                """UPDATE background_job
+                   SET Status = 'running', Attempts = Attempts + 1, StartedAt = NOW(),
+                       LeaseOwner = %s, LeaseExpiresAt = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                   WHERE JobUuid = %s
+                     AND (Status = 'queued'
+                          OR (Status = 'running' AND (LeaseExpiresAt IS NULL OR LeaseExpiresAt < NOW())))""",
+                (self.owner, self.lease_seconds, job_uuid)
+            )
+            claimed = cursor.rowcount
+            connection.commit()
+            if not claimed:
+                cursor.close()
+                return None
+            cursor.execute(
+                "SELECT JobType, Payload, Attempts FROM background_job WHERE JobUuid = %s",
+                (job_uuid,)
+            )
+            job = cursor.fetchone()
+            cursor.close()
+            return job
+        finally:
+            connection.close()
+
+    def _renew_lease(self, job_uuid: str) -> bool:
+        """Extend this task's lease on a running job; False if the lease was lost"""
+        return self._update(job_uuid,
+                            """UPDATE background_job SET LeaseExpiresAt = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                               WHERE JobUuid = %s AND LeaseOwner = %s AND Status = 'running'""",
+                            (self.lease_seconds, job_uuid, self.owner)) > 0
+
+    def _finish(self, job_uuid: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        """Record a job's final state, unless another task has taken over its lease"""
+        updated = self._update(job_uuid,
+                               """UPDATE background_job SET Status = %s, Result = %s, ErrorMessage = %s,
+                                  CompletedAt = NOW(), LeaseExpiresAt = NULL
+                                  WHERE JobUuid = %s AND LeaseOwner = %s""",
+                               (status, json.dumps(result, default=str) if result is not None else None,
+                                error, job_uuid, self.owner))
+        if not updated:
+            logger.warning(f"Lease on job {job_uuid} was lost; not recording it as {status}")
+
+    def _keep_leased(self, job_uuid: str, stop: threading.Event):
+        """Renew the lease until the job finishes"""
+        while not stop.wait(self.lease_seconds / 3):
+            if not self._renew_lease(job_uuid):
+                logger.warning(f"Could not renew lease on job {job_uuid}")
+
+    def _execute(self, job_uuid: str):
+        try:
+            job = self._claim(job_uuid)
+            if not job:
+                return
+
+            if job['Attempts'] > self.max_attempts:
+                self._finish(job_uuid, 'failed', error=f"Gave up after {self.max_attempts} attempts")
+                return
+
+            handler = self.handlers.get(job['JobType'])
+            if not handler:
+                self._finish(job_uuid, 'failed', error=f"No handler for job type '{job['JobType']}'")
+                return
+
+            payload = job['Payload']
+            if isinstance(payload, (str, bytes)):
+                payload = json.loads(payload)
+
+            def report_progress(progress: Dict):
+                self._update(job_uuid, "UPDATE background_job SET Progress = %s WHERE JobUuid = %s",
+                             (json.dumps(progress, default=str), job_uuid))
+
+            logger.info(f"Running {job['JobType']} job {job_uuid} (attempt {job['Attempts']})")
+            stop_renewing = threading.Event()
+            threading.Thread(target=self._keep_leased, args=(job_uuid, stop_renewing), daemon=True).start()
+            try:
+                result = handler(payload, report_progress)
+            except Exception as e:
+                logger.error(f"Job {job_uuid} failed: {e}")
+                self._finish(job_uuid, 'failed', error=str(e))
+                return
+            finally:
+                stop_renewing.set()
+
+            self._finish(job_uuid, 'completed', result=result or {})
+            logger.info(f"Job {job_uuid} completed")
+
+        except Exception as e:
+            logger.error(f"Error executing job {job_uuid}: {e}")
+        finally:
+            with self._lock:
+                self._scheduled.discard(job_uuid)
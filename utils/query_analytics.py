@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+In-process aggregation of query analytics
+Counts usage and latency per (company, knowledge base, query) in memory and
+periodically upserts the totals into the query_analytic table, whose unique
+key is the same (CompanyId, KnowledgeBaseId, QueryHash) triple
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger('query_analytics')
+
+UPSERT_ANALYTIC_SQL = """INSERT INTO query_analytic
+   (CompanyId, KnowledgeBaseId, QueryText, QueryHash, QueryType, EndpointUsed,
+    ResponseTimeMs, Success, ErrorMessage, UsageCount)
+   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+   ON DUPLICATE KEY UPDATE
+    ResponseTimeMs = ROUND((COALESCE(ResponseTimeMs, 0) * UsageCount + VALUES(ResponseTimeMs) * VALUES(UsageCount))
+                           / (UsageCount + VALUES(UsageCount))),
+    UsageCount = UsageCount + VALUES(UsageCount),
+    QueryType = COALESCE(VALUES(QueryType), QueryType),
+    EndpointUsed = COALESCE(VALUES(EndpointUsed), EndpointUsed),
+    Success = VALUES(Success),
+    ErrorMessage = VALUES(ErrorMessage),
+    LastUsedAt = NOW()"""
+
+
+def normalize_query(query_text: str) -> str:
+    """Normalize query text so trivially different phrasings share a hash"""
+    normalized = re.sub(r'\s+', ' ', query_text.strip().lower())
+    return normalized.rstrip('?.!; ')
+
+
+def query_hash(query_text: str) -> str:
+    """MD5 of the normalized query text (matches the QueryHash column)"""
+    return hashlib.md5(normalize_query(query_text).encode()).hexdigest()
+
+
+class QueryAnalyticsAggregator:
+    """Accumulate per-query usage counters in memory and flush them in bulk
+
+    ``record()`` is a dict update under a lock, so it is safe to call on every
+    request. A background thread upserts the accumulated counters every
+    ``flush_interval`` seconds (or sooner once ``max_keys`` distinct queries are
+    buffered) with a single ``executemany``.
+    """
+
+    def __init__(self, connection_factory: Callable[[], Any],
+                 flush_interval: Optional[float] = None,
+                 max_keys: Optional[int] = None):
+        self.connection_factory = connection_factory
+        self.flush_interval = flush_interval or float(os.getenv('QUERY_ANALYTICS_FLUSH_INTERVAL', 60))
+        self.max_keys = max_keys or int(os.getenv('QUERY_ANALYTICS_MAX_KEYS', 10000))
+
+        self._counters: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='query-analytics', daemon=True)
+        self._thread.start()
+        logger.info(f"Query analytics aggregator started (interval={self.flush_interval}s)")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the flush thread and write the remaining counters"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def record(self, company_code: str, kb_id: str, query_text: str, response_time_ms: int,
+               endpoint: Optional[str] = None, query_type: Optional[str] = None,
+               success: bool = True, error_message: Optional[str] = None):
+        """Count one execution of a query"""
+        if not company_code or not kb_id or not query_text:
+            return
+
+        key = (company_code, kb_id, query_hash(query_text))
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None:
+                entry = self._counters[key] = {
+                    'query_text': query_text,
+                    'count': 0,
+                    'total_ms': 0,
+                    'endpoint': endpoint,
+                    'query_type': query_type,
+                    'success': True,
+                    'error_message': None
+                }
+            entry['count'] += 1
+            entry['total_ms'] += int(response_time_ms)
+            entry['success'] = success
+            entry['error_message'] = error_message if not success else None
+            full = len(self._counters) >= self.max_keys
+
+        if full:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        """Number of distinct queries waiting to be flushed"""
+        with self._lock:
+            return len(self._counters)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            self.flush()
+
+    def _swap(self) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+        with self._lock:
+            counters, self._counters = self._counters, {}
+        return counters
+
+    def _merge_back(self, counters: Dict[Tuple[str, str, str], Dict[str, Any]]):
+        """Return unflushed counters to the buffer so they are written next time"""
+        with self._lock:
+            for key, entry in counters.items():
+                current = self._counters.get(key)
+                if current is None:
+                    if len(self._counters) < self.max_keys:
+                        self._counters[key] = entry
+                else:
+                    current['count'] += entry['count']
+                    current['total_ms'] += entry['total_ms']
+
+    def flush(self) -> int:
+        """Upsert all accumulated counters; returns the number of rows written"""
+        with self._flush_lock:
+            counters = self._swap()
+            if not counters:
+                return 0
+
+            connection = self.connection_factory()
+            if not connection:
+                self._merge_back(counters)
+                return 0
+
+            cursor = None
+            try:
+                cursor = connection.cursor()
+
+                # Resolve company codes to ids in one round trip
+                company_codes = sorted({key[0] for key in counters})
+                cursor.execute(
+                    "SELECT Id, CompanyCode FROM company WHERE CompanyCode IN ({})".format(
+                        ','.join(['%s'] * len(company_codes))
+                    ),
+                    company_codes
+                )
+                company_ids = {row[1]: row[0] for row in cursor.fetchall()}
+
+                rows = []
+                for (company_code, kb_id, hashed), entry in counters.items():
+                    company_id = company_ids.get(company_code)
+                    if company_id is None:
+                        continue
+                    rows.append((
+                        company_id, kb_id, entry['query_text'], hashed, entry['query_type'],
+                        entry['endpoint'], round(entry['total_ms'] / entry['count']),
+                        entry['success'], entry['error_message'], entry['count']
+                    ))
+
+                if rows:
+                    cursor.executemany(UPSERT_ANALYTIC_SQL, rows)
+                    connection.commit()
+                logger.info(f"Flushed analytics for {len(rows)} queries")
+                return len(rows)
+
+            except Exception as e:
+                logger.error(f"Failed to flush query analytics: {e}")
+                try:
+                    connection.rollback()
+                except Exception:
+                    pass
+                self._merge_back(counters)
+                return 0
+            finally:
+                if cursor:
+                    cursor.close()
+                connection.close()
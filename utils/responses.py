@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Response serialization and compression for the API
+FastJSONResponse renders with orjson (when installed) and CompressionMiddleware
+gzip/brotli-encodes large bodies such as answers with contexts or thinking
+"""
+
+import os
+import gzip
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from src.advanced_retrieval.json_codec import dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript')
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered through the orjson codec"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class CompressionMiddleware:
+    """Compress complete response bodies above ``minimum_size`` bytes
+
+    Brotli is preferred when the client accepts it and the module is
+    installed, otherwise gzip. Streaming responses and responses that already
+    carry a Content-Encoding are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = None, gzip_level: int = None, brotli_quality: int = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else \
+            int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+        self.gzip_level = gzip_level or int(os.getenv('RESPONSE_GZIP_LEVEL', 6))
+        # Low brotli qualities compress about as well as gzip -6 at a fraction of the CPU
+        self.brotli_quality = brotli_quality or int(os.getenv('RESPONSE_BROTLI_QUALITY', 4))
+
+    def _choose_encoding(self, scope) -> str:
+        accept = ''
+        for name, value in scope.get('headers', []):
+            if name == b'accept-encoding':
+                accept = value.decode('latin-1').lower()
+                break
+        accepted = {part.split(';')[0].strip() for part in accept.split(',') if not part.strip().endswith(';q=0')}
+        if brotli and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return ''
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._choose_encoding(scope)
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, passthrough
+
+            if message['type'] == 'http.response.start':
+                start_message = message
+                return
+
+            if message['type'] != 'http.response.body' or passthrough or start_message is None:
+                await send(message)
+                return
+
+            headers = {name.lower(): value for name, value in start_message.get('headers', [])}
+            body = message.get('body', b'')
+            content_type = headers.get(b'content-type', b'').decode('latin-1')
+
+            if message.get('more_body') or b'content-encoding' in headers or \
+                    len(body) < self.minimum_size or not content_type.startswith(COMPRESSIBLE_TYPES):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if encoding == 'br':
+                compressed = brotli.compress(body, quality=self.brotli_quality)
+            else:
+                compressed = gzip.compress(body, compresslevel=self.gzip_level)
+
+            response_headers = [
+                (name, value) for name, value in start_message.get('headers', [])
+                if name.lower() not in (b'content-length', b'vary')
+            ]
+            vary = headers.get(b'vary')
+            if not vary:
+                vary = b'Accept-Encoding'
+            elif b'accept-encoding' not in vary.lower():
+                vary += b', Accept-Encoding'
+            response_headers.append((b'vary', vary))
+            response_headers.append((b'content-encoding', encoding.encode()))
+            response_headers.append((b'content-length', str(len(compressed)).encode()))
+
+            await send({**start_message, 'headers': response_headers})
+            await send({'type': 'http.response.body', 'body': compressed})
+
+        await self.app(scope, receive, compressing_send)
@@ -42,6 +42,10 @@ def format_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
         'body': json.dumps(body)
     }
 
+def default_kb_id() -> str:
+    """Knowledge base used when a request does not name one"""
+    return os.getenv('KNOWLEDGE_BASE_ID', 'KRD3MW7QFS')
+
 def get_retrieval_client(kb_id: Optional[str] = None):
     """Get the retrieval client instance for a specific or default knowledge base"""
     try:
@@ -49,7 +53,7 @@ def get_retrieval_client(kb_id: Optional[str] = None):
         from src.advanced_retrieval.retrieval_techniques import AdvancedRetrieval
         
         # Use provided KB ID or fall back to environment variable
-        knowledge_base_id = kb_id or os.getenv('KNOWLEDGE_BASE_ID', 'KRD3MW7QFS')
+        knowledge_base_id = kb_id or default_kb_id()
         region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
         
         logger.info(f"Initializing AdvancedRetrieval with KB ID: {knowledge_base_id}")
@@ -98,7 +102,8 @@ class MockRetrievalClient:
         self.kb_id = kb_id or 'mock-kb-id'
         logger.warning(f"Using MockRetrievalClient for KB {self.kb_id} - Bedrock not available")
     
-    def advanced_rag_query(self, query_text: str, use_extended_thinking: bool = True) -> Dict[str, Any]:
+    def advanced_rag_query(self, query_text: str, use_extended_thinking: bool = True,
+                           mmr_lambda: Optional[float] = None) -> Dict[str, Any]:
         """Mock implementation of advanced RAG query"""
         logger.info(f"Mock query for KB {self.kb_id}: {query_text}")
         
@@ -112,7 +117,7 @@ class MockRetrievalClient:
             ]
         }
     
-    def query_database_relationships(self, table_name: str) -> Dict[str, Any]:
+    def query_database_relationships(self, table_name: str, mmr_lambda: Optional[float] = None) -> Dict[str, Any]:
         """Mock implementation of relationship query"""
         logger.info(f"Mock relationship query for table: {table_name}")
         
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+In-memory UI assets
+Loads the UI files once, with placeholders substituted, and keeps
+pre-compressed variants of each, every variant with its own strong ETag, so
+requests never touch the disk
+"""
+
+import gzip
+import hashlib
+import logging
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('static_assets')
+
+# Variants are only kept when they save at least this fraction of the size
+MIN_COMPRESSION_SAVING = 0.1
+
+
+class StaticAsset:
+    """An asset's bytes and compressed variants, each with its own ETag
+
+    The variants are different representations with different bytes, so
+    they cannot share a strong validator; compressed variants get the
+    content hash with the encoding appended.
+    """
+
+    def __init__(self, content: bytes, media_type: str, cache_control: str):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.content_hash = hashlib.sha256(content).hexdigest()[:32]
+        self.variants: Dict[str, bytes] = {'identity': content}
+
+        candidates = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli:
+            candidates['br'] = brotli.compress(content, quality=11)
+        for encoding, body in candidates.items():
+            if len(body) <= len(content) * (1 - MIN_COMPRESSION_SAVING):
+                self.variants[encoding] = body
+
+        self.etags = {
+            encoding: '"{}"'.format(self.content_hash if encoding == 'identity' else f"{self.content_hash}-{encoding}")
+            for encoding in self.variants
+        }
+
+    def negotiate(self, accept_encoding: str) -> str:
+        """Best encoding the client accepts, preferring brotli over gzip"""
+        accepted = {
+            part.split(';')[0].strip().lower()
+            for part in accept_encoding.split(',')
+            if not part.strip().endswith(';q=0')
+        }
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in self.variants:
+                return encoding
+        return 'identity'
+
+    def response(self, request: Request, status_code: int = 200) -> Response:
+        """200 with the negotiated variant, or 304 if the client's copy of that variant is current"""
+        encoding = self.negotiate(request.headers.get('accept-encoding', ''))
+        headers = {
+            'ETag': self.etags[encoding],
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+
+        if_none_match = request.headers.get('if-none-match', '')
+        if status_code == 200 and if_none_match:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            if self.etags[encoding] in tags or '*' in tags:
+                return Response(status_code=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(content=self.variants[encoding], status_code=status_code,
+                        media_type=self.media_type, headers=headers)
+
+
+def load_asset(path: str, media_type: str, cache_control: str,
+               replacements: Optional[Dict[str, str]] = None) -> Optional[StaticAsset]:
+    """Read a UI file and apply placeholder replacements; None if it is missing"""
+    try:
+        with open(path, 'r') as f:
+            content = f.read()
+    except FileNotFoundError:
+        logger.warning(f"UI asset not found: {path}")
+        return None
+
+    for placeholder, value in (replacements or {}).items():
+        content = content.replace(placeholder, value)
+    return StaticAsset(content.encode('utf-8'), media_type, cache_control)